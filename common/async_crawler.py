@@ -0,0 +1,536 @@
+import argparse
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from common.cache import CACHE_TTL, ResponseCache
+from common.checkpoint import CHECKPOINT_EVERY, Checkpoint
+from common.common import (HostRateLimiter, RetryableError, RetryConfig, ScrapingError, fetch_attempt, get_host,
+                           rate_limiter)
+from common.frontier import Frontier
+from common.metrics import MetricsServer, metrics
+from common.parsing import BACKENDS, PARSER_BACKEND, ListingParser, ParsePool, stream_listing
+from common.registry import ListingPage, get_spec
+from common.retry import RetryScheduler
+from common.seen_index import SEEN_INDEX_KIND, SEEN_INDEX_KINDS
+from common.sessions import SessionPool
+from common.sharding import crawl_sharded
+from common.sinks import add_sink_arguments
+
+# Configuration constants - can be overridden when importing
+GLOBAL_CONCURRENCY = 8
+PER_HOST_CONCURRENCY = 2
+MAX_CONSECUTIVE_FAILURES = 5
+KNOWN_PAGES_BEFORE_STOP = 1
+
+logger = logging.getLogger(__name__)
+
+
+def add_crawl_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """Add the options shared by every crawler entry point"""
+    parser.add_argument('--incremental', action='store_true',
+                        help="only collect jobs posted since the last run and stop at the first known page")
+    parser.add_argument('--known-pages', type=int, default=KNOWN_PAGES_BEFORE_STOP,
+                        help="consecutive pages with only known jobs before an incremental crawl stops")
+    parser.add_argument('--seen-index', choices=SEEN_INDEX_KINDS, default=SEEN_INDEX_KIND,
+                        help="index of known jobs: exact IDs, or smaller Bloom filters that may skip a few new jobs")
+    parser.add_argument('--parser', choices=BACKENDS, default=PARSER_BACKEND, help="HTML parser backend")
+    parser.add_argument('--parse-processes', action='store_true',
+                        help="parse listing pages in a process pool instead of threads")
+    parser.add_argument('--shards', type=int, default=0, metavar='WORKERS',
+                        help="find the last page and crawl page ranges on this many worker processes")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue each site from its checkpoint without refetching completed pages")
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY, metavar='PAGES',
+                        help="save the checkpoint after this many finished pages")
+    add_metrics_arguments(parser)
+    add_sink_arguments(parser)
+    return add_cache_arguments(parser)
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """Add the options exposing crawl metrics"""
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics during the run")
+    parser.add_argument('--metrics-json', metavar='PATH', help="write a JSON snapshot of the metrics at the end")
+    return parser
+
+
+def start_metrics(args: argparse.Namespace) -> Optional[MetricsServer]:
+    """Reset the metrics for a run and start the metrics endpoint requested on the command line"""
+    metrics.reset()
+    return MetricsServer(args.metrics_port).start() if args.metrics_port else None
+
+
+def finish_metrics(args: argparse.Namespace, server: Optional[MetricsServer]) -> None:
+    """Log the end-of-run summary, write the JSON snapshot and stop the endpoint"""
+    metrics.summary()
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if server is not None:
+        server.stop()
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """Add the response cache options"""
+    parser.add_argument('--cache', action='store_true', help="keep responses in the on-disk cache and reuse them")
+    parser.add_argument('--cache-ttl', type=float, default=CACHE_TTL,
+                        help="seconds a cached response is used before it is revalidated")
+    parser.add_argument('--offline', action='store_true',
+                        help="replay responses from the cache only, without any request")
+    return parser
+
+
+def open_cache(args: argparse.Namespace) -> Optional[ResponseCache]:
+    """The response cache requested on the command line, if any"""
+    if not (args.cache or args.offline):
+        return None
+    return ResponseCache(ttl=args.cache_ttl, offline=args.offline)
+
+
+def open_checkpoint(name: str, args: argparse.Namespace) -> Checkpoint:
+    """The checkpoint of a site, loaded when --resume is given"""
+    return Checkpoint(name, resume=args.resume, every=args.checkpoint_every)
+
+
+class SiteCrawl:
+    """
+    Paging state for one listing crawl
+
+    extract turns the HTML of a listing page into job URLs. It runs on the crawler's
+    parse pool, so it must be picklable when that pool uses processes (ListingParser is).
+
+    Pages are handed out in order to the workers of the site. The first page that
+    comes back empty (or with a 404) marks the end of the listing, so no page after
+    it is requested and results from later pages that were already in flight are dropped.
+
+    A site crawled in partitions (one listing per province, say) has one SiteCrawl per
+    partition. They share the site name, so the frontier dedupes jobs across partitions,
+    while each partition pages and stops on its own and is keyed by name@partition.
+
+    Job URLs are recorded in the frontier when one is given, and only jobs that were not
+    in it yet are passed to on_page. An incremental crawl relies on the frontier:
+    listings are sorted newest first, so once known_pages consecutive pages contain only
+    known jobs the listing is treated as ended.
+
+    With a checkpoint, every finished or failed page is counted and the paging state is
+    saved every checkpoint.every pages. A checkpoint loaded for resuming restores the
+    state: pages that were failed or in flight are handed out again first, and completed
+    pages are never refetched.
+    """
+
+    def __init__(self, name: str, url: str, extract: Callable[[str], List[str]], scraper: Any,
+                 start_page: int = 1, on_page: Optional[Callable[[str, int, List[str]], None]] = None,
+                 retry_config: Optional[RetryConfig] = None, frontier: Optional[Frontier] = None,
+                 incremental: bool = False, known_pages: int = KNOWN_PAGES_BEFORE_STOP,
+                 checkpoint: Optional[Checkpoint] = None, partition: Optional[str] = None):
+        if incremental and frontier is None:
+            raise ValueError("An incremental crawl needs a frontier to tell known jobs apart")
+        self.name = name
+        self.partition = partition
+        self.key = f"{name}@{partition}" if partition else name
+        self.url = url
+        self.extract = extract
+        self.scraper = scraper
+        self.on_page = on_page
+        self.retry_config = retry_config
+        self.frontier = frontier
+        self.incremental = incremental
+        self.known_pages = known_pages
+        self.checkpoint = checkpoint
+        self.host = get_host(url)
+        self.end_page: Optional[int] = None
+        self.aborted = False
+        self.consecutive_failures = 0
+        self.pages_done = 0
+        self.urls_found = 0
+        self.failed_pages: Set[int] = set()
+        self._next_page = start_page
+        self._done_through = start_page - 1
+        self._done: Set[int] = set()
+        self._in_flight: Set[int] = set()
+        self._retry: List[int] = []
+        self._known_only_pages: Set[int] = set()
+        if checkpoint is not None and checkpoint.state is not None:
+            self.restore(checkpoint.state)
+
+    @property
+    def finished(self) -> bool:
+        return not self._retry and self.end_page is not None and self._next_page > self.end_page
+
+    @property
+    def first_unclaimed(self) -> int:
+        """The first page that was never handed out"""
+        return self._next_page
+
+    def next_page(self) -> Optional[int]:
+        """Return the next page number to fetch, or None when the listing is exhausted"""
+        while self._retry:
+            page = self._retry.pop(0)
+            if self.end_page is None or page <= self.end_page:
+                self._in_flight.add(page)
+                return page
+        if self.finished:
+            return None
+        page = self._next_page
+        self._next_page += 1
+        self._in_flight.add(page)
+        return page
+
+    def claim_through(self, last: int) -> List[int]:
+        """Hand out every page to fetch up to last at once, pages to retry first"""
+        pages = [page for page in self._retry if page <= last] + list(range(self._next_page, last + 1))
+        self._retry = []
+        self._next_page = max(self._next_page, last + 1)
+        self._in_flight.update(pages)
+        return pages
+
+    def complete(self, page: int) -> None:
+        """Record that a page is done, whatever it contained"""
+        self._in_flight.discard(page)
+        self.failed_pages.discard(page)
+        self._done.add(page)
+        while self._done_through + 1 in self._done:
+            self._done_through += 1
+            self._done.remove(self._done_through)
+        self._tick()
+
+    def fail(self, page: int) -> None:
+        """Record that a page could not be fetched, so a resumed run retries it"""
+        self._in_flight.discard(page)
+        self.failed_pages.add(page)
+        self._tick()
+
+    def _tick(self) -> None:
+        if self.checkpoint is not None and self.checkpoint.tick():
+            self.save_checkpoint()
+
+    def state(self) -> Dict[str, Any]:
+        """The paging state saved in a checkpoint"""
+        return {
+            "done_through": self._done_through,
+            "completed": sorted(self._done),
+            "failed": sorted(self.failed_pages),
+            "pending": sorted(self._in_flight.union(self._retry)),
+            "next_page": self._next_page,
+            # A crawl stopped by failures has not found the real end of the listing
+            "end_page": None if self.aborted else self.end_page,
+            "frontier_offset": self.frontier.count(self.name) if self.frontier is not None else None,
+            "pages_done": self.pages_done,
+            "urls_found": self.urls_found,
+        }
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """Continue from a checkpoint state: every page handed out but not completed is retried"""
+        self._done_through = state["done_through"]
+        self._done = set(state["completed"])
+        self._next_page = state["next_page"]
+        self.end_page = state["end_page"]
+        self.pages_done = state["pages_done"]
+        self.urls_found = state["urls_found"]
+        self._retry = [page for page in range(self._done_through + 1, self._next_page) if page not in self._done]
+        logger.info(f"[{self.key}] Resuming run from page {self._next_page} with {len(self._retry)} pages to retry "
+                    f"({state['frontier_offset']} jobs in the frontier at the checkpoint)")
+
+    def save_checkpoint(self) -> None:
+        if self.frontier is not None:
+            self.frontier.flush()
+        self.checkpoint.save(self.state())
+
+    def finish_checkpoint(self) -> None:
+        """Keep the checkpoint of an interrupted or partly failed run, drop it after a clean one"""
+        if self.checkpoint is None:
+            return
+        if self.finished and not self.aborted and not self.failed_pages and not self._in_flight:
+            self.checkpoint.clear()
+        else:
+            self.save_checkpoint()
+            logger.info(f"[{self.key}] Checkpoint saved to {self.checkpoint.path}, continue with --resume")
+
+    def mark_end(self, page: int) -> None:
+        """Record that the listing ends before the given page"""
+        if self.end_page is None or page - 1 < self.end_page:
+            self.end_page = page - 1
+
+    def record(self, page: int, job_urls: List[str]) -> List[str]:
+        """
+        Record the jobs of a page in the frontier. An incremental crawl stops once
+        known_pages consecutive pages held nothing new.
+
+        Returns:
+            The URLs that were not in the frontier before
+        """
+        if self.frontier is None:
+            return job_urls
+
+        new_urls = self.frontier.add_many(self.name, job_urls, page)
+        if isinstance(job_urls, ListingPage):
+            new_urls = job_urls.only(new_urls)
+        if self.incremental and not new_urls:
+            self._known_only_pages.add(page)
+            # Pages complete out of order, so this page can close a run of known pages after it
+            for last in range(page, page + self.known_pages):
+                if all(p in self._known_only_pages for p in range(last - self.known_pages + 1, last + 1)):
+                    logger.info(f"[{self.key}] Only known jobs up to page {last}, stopping incremental crawl.")
+                    self.mark_end(last + 1)
+                    break
+        return new_urls
+
+
+class PrioritySemaphore:
+    """
+    asyncio semaphore that hands a freed slot to the waiter with the highest priority
+
+    Waiters of equal priority are served in arrival order, so with every priority at
+    0 it behaves like asyncio.Semaphore.
+    """
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    async def acquire(self, priority: float = 0.0) -> None:
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelled after being handed a slot: pass the slot on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: float = 0.0) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AsyncCrawler:
+    """
+    Crawl listing pages of several sites concurrently
+
+    Every site gets its own workers. Requests are bounded by a global semaphore and by a
+    per-host semaphore, and pacing comes from the per-host token buckets of the rate
+    limiter, so different sites never wait on each other.
+
+    A page whose request fails is handed to the retry scheduler with its backoff deadline
+    and the worker moves on to the next page; the page is picked up again once the
+    deadline has passed. No thread or semaphore is held while a page waits for its retry.
+
+    When priority is given, requests waiting for a global slot are let through highest
+    priority(site, page) first instead of in arrival order (see common.scheduler).
+    """
+
+    def __init__(self, global_concurrency: int = GLOBAL_CONCURRENCY, per_host_concurrency: int = PER_HOST_CONCURRENCY,
+                 limiter: Optional[HostRateLimiter] = None, parse_pool: Optional[ParsePool] = None,
+                 cache: Optional[ResponseCache] = None, max_consecutive_failures: int = MAX_CONSECUTIVE_FAILURES,
+                 retries: Optional[RetryScheduler] = None,
+                 priority: Optional[Callable[[SiteCrawl, int], float]] = None):
+        self.global_concurrency = global_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.limiter = limiter or rate_limiter
+        self.parse_pool = parse_pool or ParsePool()
+        self.cache = cache
+        self.max_consecutive_failures = max_consecutive_failures
+        self.retries = retries or RetryScheduler()
+        self.priority = priority
+        self._global_semaphore: Optional[PrioritySemaphore] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_semaphores[host]
+
+    async def fetch(self, site: SiteCrawl, page: int, attempt: int = 0,
+                    on_text: Optional[Callable[[str], None]] = None) -> Any:
+        """Make one attempt at a listing page within the global and per-host budgets"""
+        url = site.url.format(page=page)
+        async with self._host_semaphore(site.host):
+            # The slot comes before the host's token, so the pages that win the slots by
+            # priority are also the ones the host's rate budget is spent on
+            async with self._global_semaphore.slot(self.priority(site, page) if self.priority is not None else 0.0):
+                # Pages served from the cache do not use up the host's rate budget
+                cached = self.cache is not None and self.cache.is_fresh(self.cache.lookup(url))
+                if not cached:
+                    await self.limiter.acquire_async(site.host)
+                return await asyncio.to_thread(fetch_attempt, site.scraper, url, f"page {page}", attempt,
+                                               site.retry_config, self.limiter, not cached, self.cache, None,
+                                               on_text)
+
+    async def _worker(self, site: SiteCrawl) -> None:
+        while True:
+            retry = self.retries.pop_due(site.key)
+            if retry is not None:
+                page, attempt = retry
+                if site.end_page is not None and page > site.end_page:
+                    site.complete(page)
+                    continue
+            else:
+                page, attempt = site.next_page(), 0
+                if page is None:
+                    if not self.retries.pending(site.key):
+                        return
+                    with metrics.timed("sleep"):
+                        await self.retries.wait(site.key)
+                    continue
+
+            # Pages with their jobs in a script are parsed while the rest downloads
+            stream = stream_listing(site.name) if isinstance(site.extract, ListingParser) else None
+            try:
+                response = await self.fetch(site, page, attempt, stream.feed if stream is not None else None)
+            except ScrapingError as error:
+                if isinstance(error, RetryableError) and self.retries.schedule(site.key, site.host, page,
+                                                                               attempt + 1, error.delay):
+                    logger.info(f"[{site.key}] Page {page} will be retried in {error.delay:.1f} seconds")
+                    continue
+
+                if error.status_code == 404:
+                    logger.info(f"[{site.key}] 404 on page {page} - likely reached the end of available pages.")
+                    site.mark_end(page)
+                    site.complete(page)
+                    continue
+
+                site.consecutive_failures += 1
+                site.fail(page)
+                logger.warning(f"[{site.key}] Failed to scrape page {page}: {error}")
+                if site.consecutive_failures >= self.max_consecutive_failures:
+                    logger.error(f"[{site.key}] Too many consecutive failures ({site.consecutive_failures}), "
+                                 f"stopping.")
+                    site.aborted = True
+                    site.mark_end(page)
+                continue
+
+            site.consecutive_failures = 0
+            self.retries.record_success(site.host)
+            try:
+                with metrics.timed("parse"):
+                    if stream is not None and stream.result is not None:
+                        job_urls = stream.result
+                    else:
+                        job_urls = await self.parse_pool.run(site.extract, response.text)
+            except Exception as error:
+                # A page the extractor chokes on is failed on its own, the crawl goes on
+                logger.error(f"[{site.key}] Could not parse page {page}: {error}")
+                site.fail(page)
+                continue
+
+            if site.end_page is not None and page > site.end_page:
+                site.complete(page)
+                continue
+
+            if not job_urls:
+                logger.info(f"[{site.key}] No job URLs found on page {page}, might have reached the end.")
+                site.mark_end(page)
+                site.complete(page)
+                continue
+
+            logger.info(f"[{site.key}] Found {len(job_urls)} job URLs on page {page}")
+            if getattr(job_urls, 'is_last', False):
+                logger.info(f"[{site.key}] Page {page} is the last listing page.")
+                site.mark_end(page + 1)
+            site.pages_done += 1
+            metrics.count_page(site.name, len(job_urls))
+            job_urls = site.record(page, job_urls)
+            site.urls_found += len(job_urls)
+            site.complete(page)
+            if job_urls and site.on_page is not None:
+                site.on_page(site.name, page, job_urls)
+
+    async def crawl(self, sites: Iterable[SiteCrawl]) -> List[SiteCrawl]:
+        """Crawl all given sites at once and return them with their final paging state"""
+        sites = list(sites)
+        self._global_semaphore = PrioritySemaphore(self.global_concurrency)
+
+        workers = [self._worker(site) for site in sites for _ in range(self.per_host_concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            self.parse_pool.shutdown()
+            if self.cache is not None:
+                self.cache.close()
+            for site in sites:
+                site.finish_checkpoint()
+
+        rates = self.limiter.rates()
+        for site in sites:
+            logger.info(f"[{site.key}] Scraping completed. {site.urls_found} job URLs from {site.pages_done} pages, "
+                        f"final rate {rates.get(site.host, 0):.3f} req/s.")
+        logger.info(f"Retries: {self.retries.scheduled} scheduled, {self.retries.denied} given up.")
+        return sites
+
+
+def open_frontier(sites: Dict[str, str], path: Optional[str] = None,
+                  index_kind: str = SEEN_INDEX_KIND) -> Frontier:
+    """
+    Open the frontier and migrate the job_urls.txt files of sites it has never seen
+
+    Args:
+        sites: Site name to job_urls.txt path
+        path: Frontier database path, defaults to FRONTIER_PATH
+        index_kind: Kind of seen index, see common.seen_index
+    """
+    frontier = Frontier(path, index_kind=index_kind) if path else Frontier(index_kind=index_kind)
+    for name, output_path in sites.items():
+        if frontier.count(name) == 0:
+            frontier.import_txt(name, output_path)
+    return frontier
+
+
+def export_job_urls(frontier: Frontier, sites: Dict[str, str]) -> None:
+    """Rewrite each site's job_urls.txt from the frontier, without duplicates"""
+    for name, output_path in sites.items():
+        count = frontier.export_txt(name, output_path)
+        logger.info(f"[{name}] Wrote {count} unique job URLs to {output_path}")
+
+
+def build_crawler(args: argparse.Namespace) -> AsyncCrawler:
+    """An AsyncCrawler configured from the options of add_crawl_arguments"""
+    return AsyncCrawler(parse_pool=ParsePool(use_processes=args.parse_processes), cache=open_cache(args))
+
+
+def run_crawl(sites: List[SiteCrawl], args: argparse.Namespace) -> None:
+    """Crawl sites with the async engine, or on sharded worker processes when --shards is given"""
+    server = start_metrics(args)
+    try:
+        if args.shards:
+            crawl_sharded(sites, args.shards, args.parser)
+        else:
+            asyncio.run(build_crawler(args).crawl(sites))
+    finally:
+        finish_metrics(args, server)
+
+
+def build_sites(name: str, frontier: Frontier, args: argparse.Namespace,
+                on_page: Optional[Callable[[str, int, List[str]], None]] = None) -> List[SiteCrawl]:
+    """
+    SiteCrawls for a site registered in common.registry, one per partition of its listing
+
+    The partitions share one session pool, as they are all on the same host. args holds
+    the options of add_crawl_arguments, on_page receives the new jobs of every page.
+    """
+    spec = get_spec(name)
+    scraper = SessionPool(spec.url)
+    return [SiteCrawl(name, url, ListingParser(name, args.parser), scraper, on_page=on_page, frontier=frontier,
+                      incremental=args.incremental, known_pages=args.known_pages, partition=partition,
+                      checkpoint=open_checkpoint(f"{name}@{partition}" if partition else name, args))
+            for partition, url in spec.partitions()]
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from common.async_crawler import AsyncCrawler, SiteCrawl
+from common.common import HostRateLimiter, RetryConfig, fetch_with_retry, rate_limiter
+from common.metrics import metrics
+from common.parsing import (BACKENDS, HAS_LXML, HAS_SELECTOLAX, PARSER_BACKEND, ListingParser, ParsePool,
+                            parse_listing)
+from common.registry import get_spec
+from common.sessions import SessionPool
+from common.standin_server import StandinServer
+from common.startup import configure_logging
+
+# Configuration constants - can be overridden when importing
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+FIXTURES_DIR = os.path.join(BENCHMARK_DIR, 'fixtures')
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baseline.json')
+PARSE_REPEATS = 20
+CRAWL_PAGES = 40
+CONCURRENCY_SETTINGS = ((1, 1), (4, 2), (8, 4), (16, 8))
+STANDIN_LATENCY = 0.05
+STANDIN_JITTER = 0.02
+STANDIN_THROTTLE_RATE = 0.01
+STANDIN_ERROR_RATE = 0.02
+STANDIN_SEED = 15
+BENCHMARK_REQUESTS_PER_SECOND = 50.0
+BENCHMARK_BACKOFF_DELAY = 0.1
+REGRESSION_TOLERANCE = 0.25
+REFERENCE_BACKEND = "html.parser"
+
+# Sites with listing page fixtures in FIXTURES_DIR. The shipped ones are synthetic pages
+# in each site's markup; --record replaces them with pages captured from the live site
+FIXTURE_SITES = ("topcv", "itviec", "123job", "careerlink")
+
+logger = logging.getLogger(__name__)
+
+
+def fixture_paths(site: str, directory: str = FIXTURES_DIR) -> List[str]:
+    """Listing page fixtures of a site, fixtures/<site>/page-<n>.html, in page order"""
+    site_dir = os.path.join(directory, site)
+    if not os.path.isdir(site_dir):
+        return []
+    names = [name for name in os.listdir(site_dir) if name.startswith('page-') and name.endswith('.html')]
+    names.sort(key=lambda name: int(name[len('page-'):-len('.html')]))
+    return [os.path.join(site_dir, name) for name in names]
+
+
+def load_fixtures(site: str, directory: str = FIXTURES_DIR) -> List[str]:
+    pages = []
+    for path in fixture_paths(site, directory):
+        with open(path, encoding='utf-8') as file:
+            pages.append(file.read())
+    if not pages:
+        raise ValueError(f"No listing page fixtures for {site} in {directory}")
+    return pages
+
+
+def record_fixtures(site: str, pages: int, directory: str = FIXTURES_DIR) -> List[str]:
+    """
+    Save the first listing pages of a site from the live site as fixtures
+
+    Returns:
+        Paths of the saved pages
+    """
+    spec = get_spec(site)
+    url = spec.partitions()[0][1]
+    site_dir = os.path.join(directory, site)
+    os.makedirs(site_dir, exist_ok=True)
+    scraper = SessionPool(spec.url)
+    paths = []
+    try:
+        for page in range(1, pages + 1):
+            response = fetch_with_retry(scraper, url.format(page=page), f"{site} page {page}", limiter=rate_limiter)
+            path = os.path.join(site_dir, f"page-{page}.html")
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(response.text)
+            paths.append(path)
+            logger.info(f"[{site}] Recorded page {page}: {len(parse_listing(site, response.text))} job URLs")
+    finally:
+        scraper.close()
+    return paths
+
+
+def available_backends(backends: Sequence[str] = BACKENDS) -> List[str]:
+    missing = {"lxml": not HAS_LXML, "selectolax": not HAS_SELECTOLAX}
+    return [backend for backend in backends if not missing.get(backend)]
+
+
+def bench_parse(sites: Sequence[str], backends: Sequence[str] = BACKENDS,
+                repeats: int = PARSE_REPEATS) -> Dict[str, Dict[str, Any]]:
+    """
+    Time parse_listing on the fixtures of every site with every available backend
+
+    Returns:
+        "<site>/<backend>" -> median milliseconds per page and job URLs found in the fixtures
+    """
+    results = {}
+    for site in sites:
+        pages = load_fixtures(site)
+        for backend in available_backends(backends):
+            timings = []
+            job_urls = 0
+            for _ in range(repeats):
+                start = time.perf_counter()
+                job_urls = sum(len(parse_listing(site, html, backend)) for html in pages)
+                timings.append((time.perf_counter() - start) / len(pages))
+            results[f"{site}/{backend}"] = {"ms_per_page": round(statistics.median(timings) * 1000, 3),
+                                            "job_urls": job_urls}
+            logger.info(f"[{site}] {backend}: {results[f'{site}/{backend}']['ms_per_page']:.2f} ms/page, "
+                        f"{job_urls} job URLs in {len(pages)} pages")
+    return results
+
+
+def fixture_renderer(pages: List[str]):
+    """Render listing page N of a stand-in server by cycling through the fixtures"""
+    return lambda page: pages[(page - 1) % len(pages)]
+
+
+def bench_crawl(sites: Sequence[str], settings: Sequence[Tuple[int, int]] = CONCURRENCY_SETTINGS,
+                pages: int = CRAWL_PAGES, latency: float = STANDIN_LATENCY, jitter: float = STANDIN_JITTER,
+                throttle_rate: float = STANDIN_THROTTLE_RATE, error_rate: float = STANDIN_ERROR_RATE,
+                rate: float = BENCHMARK_REQUESTS_PER_SECOND,
+                backend: str = PARSER_BACKEND) -> Dict[str, Dict[str, Any]]:
+    """
+    Crawl every site from its own stand-in server under each concurrency setting
+
+    Each server serves the given number of listing pages, made of the site's fixtures, with injected
+    latency, 429s and 502s, so a run goes through the rate limiter, the retry scheduler
+    and the parse pool like a live crawl. Retry-After is 0 and the backoff is cut to
+    BENCHMARK_BACKOFF_DELAY so failures cost throughput without stalling the run.
+
+    Args:
+        settings: (global concurrency, per-host concurrency) pairs
+        rate: Requests per second the limiter starts every host at
+
+    Returns:
+        "<global>x<per host>" -> pages and job URLs per second, seconds, retries
+    """
+    fixtures = {site: load_fixtures(site) for site in sites}
+    results = {}
+    for global_concurrency, per_host_concurrency in settings:
+        servers = [StandinServer(pages, fixture_renderer(fixtures[site]), latency=latency, jitter=jitter,
+                                 throttle_rate=throttle_rate, error_rate=error_rate, retry_after=0,
+                                 seed=STANDIN_SEED + index).start() for index, site in enumerate(sites)]
+        session = requests.Session()
+        crawls = [SiteCrawl(site, server.url + "/?page={page}", ListingParser(site, backend), session,
+                            retry_config=RetryConfig(initial_delay=BENCHMARK_BACKOFF_DELAY))
+                  for site, server in zip(sites, servers)]
+        crawler = AsyncCrawler(global_concurrency, per_host_concurrency,
+                               limiter=HostRateLimiter(default_rate=rate, max_rate=rate, burst=per_host_concurrency),
+                               parse_pool=ParsePool())
+        metrics.reset()
+        start = time.perf_counter()
+        try:
+            asyncio.run(crawler.crawl(crawls))
+        finally:
+            elapsed = time.perf_counter() - start
+            session.close()
+            for server in servers:
+                server.stop()
+
+        pages_done = sum(crawl.pages_done for crawl in crawls)
+        if pages_done < pages * len(sites):
+            logger.warning(f"Only {pages_done} of {pages * len(sites)} pages were crawled "
+                           f"at {global_concurrency}x{per_host_concurrency}")
+        key = f"{global_concurrency}x{per_host_concurrency}"
+        results[key] = {
+            "pages_per_second": round(pages_done / elapsed, 3),
+            "job_urls_per_second": round(sum(metrics.job_urls.values()) / elapsed, 3),
+            "seconds": round(elapsed, 3),
+            "pages": pages_done,
+            "retries": crawler.retries.scheduled,
+            "throttled": sum(server.throttled for server in servers),
+            "errors": sum(server.errors for server in servers),
+        }
+        logger.info(f"Concurrency {key}: {results[key]['pages_per_second']:.1f} pages/s, "
+                    f"{results[key]['job_urls_per_second']:.1f} job URLs/s in {elapsed:.2f}s, "
+                    f"{crawler.retries.scheduled} retries")
+    return results
+
+
+def relative_time(parse: Dict[str, Dict[str, Any]], key: str) -> Optional[float]:
+    """Time per page of a "<site>/<backend>" parse result relative to the reference backend on the same site"""
+    site = key.rsplit('/', 1)[0]
+    reference = parse.get(f"{site}/{REFERENCE_BACKEND}")
+    if key == f"{site}/{REFERENCE_BACKEND}" or reference is None or not reference["ms_per_page"]:
+        return None
+    return parse[key]["ms_per_page"] / reference["ms_per_page"]
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Regressions of results against a baseline
+
+    Absolute timings depend on the machine, so parsing speed is compared as each
+    backend's time per page relative to REFERENCE_BACKEND on the same fixtures in the
+    same run: a backend regresses when that ratio grows by more than tolerance. Parsing
+    also regresses when it finds a different number of job URLs. A crawl regresses when
+    its pages per second drop by more than tolerance; the stand-in's injected latency
+    dominates those figures, but they are still only comparable on similar machines.
+    Entries missing on either side are not compared.
+
+    Returns:
+        One message per regression
+    """
+    if results.get("settings") != baseline.get("settings"):
+        logger.warning("The baseline was recorded with other settings, comparisons may be meaningless")
+    regressions = []
+    parse, expected_parse = results.get("parse", {}), baseline.get("parse", {})
+    for key, result in parse.items():
+        expected = expected_parse.get(key)
+        if expected is None:
+            continue
+        if result["job_urls"] != expected["job_urls"]:
+            regressions.append(f"parse {key}: {result['job_urls']} job URLs, baseline {expected['job_urls']}")
+        ratio, expected_ratio = relative_time(parse, key), relative_time(expected_parse, key)
+        if ratio is not None and expected_ratio is not None and ratio > expected_ratio * (1 + tolerance):
+            regressions.append(f"parse {key}: {ratio:.2f}x the time of {REFERENCE_BACKEND}, "
+                               f"baseline {expected_ratio:.2f}x")
+    for key, result in results.get("crawl", {}).items():
+        expected = baseline.get("crawl", {}).get(key)
+        if expected is None:
+            continue
+        if result["pages_per_second"] < expected["pages_per_second"] * (1 - tolerance):
+            regressions.append(f"crawl {key}: {result['pages_per_second']:.1f} pages/s, "
+                               f"baseline {expected['pages_per_second']:.1f}")
+    return regressions
+
+
+def parse_concurrency(value: str) -> Tuple[int, int]:
+    """Parse a GLOBALxPER_HOST concurrency setting such as 8x4"""
+    try:
+        global_concurrency, per_host_concurrency = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected GLOBALxPER_HOST, got {value}") from None
+    return global_concurrency, per_host_concurrency
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark listing parsing and crawl throughput offline, "
+                                                 "against listing page fixtures served by a local stand-in")
+    parser.add_argument('sites', nargs='*', default=list(FIXTURE_SITES), help="sites with fixtures to benchmark")
+    parser.add_argument('--record', type=int, metavar='PAGES',
+                        help="save the first PAGES listing pages of each site from the live site as fixtures and exit")
+    parser.add_argument('--skip-parse', action='store_true', help="do not benchmark parsing")
+    parser.add_argument('--skip-crawl', action='store_true', help="do not benchmark crawl throughput")
+    parser.add_argument('--repeats', type=int, default=PARSE_REPEATS, help="timed parses of every fixture")
+    parser.add_argument('--pages', type=int, default=CRAWL_PAGES, help="listing pages each stand-in serves")
+    parser.add_argument('--concurrency', type=parse_concurrency, nargs='+', default=list(CONCURRENCY_SETTINGS),
+                        metavar='GLOBALxPER_HOST', help="concurrency settings to crawl with")
+    parser.add_argument('--latency', type=float, default=STANDIN_LATENCY, help="seconds added to every response")
+    parser.add_argument('--throttle-rate', type=float, default=STANDIN_THROTTLE_RATE,
+                        help="share of requests answered with 429")
+    parser.add_argument('--error-rate', type=float, default=STANDIN_ERROR_RATE,
+                        help="share of requests answered with 502")
+    parser.add_argument('--baseline', nargs='?', const=BASELINE_PATH, metavar='PATH',
+                        help="compare with the baseline results at PATH (default: benchmarks/baseline.json)")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="store the results as the new baseline, at --baseline PATH if given")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE,
+                        help="relative slowdown allowed before a result counts as a regression")
+    parser.add_argument('--output', metavar='PATH', help="also write the results as JSON")
+    parser.add_argument('--verbose', action='store_true', help="log every request of the crawl benchmark")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        for site in args.sites:
+            record_fixtures(site, args.record)
+        return 0
+
+    if not args.verbose:
+        # Injected faults make every crawl log request errors, keep the output to the results
+        logging.getLogger("common").setLevel(logging.CRITICAL)
+        logger.setLevel(logging.INFO)
+
+    results: Dict[str, Any] = {"settings": {"sites": args.sites, "repeats": args.repeats, "pages": args.pages,
+                                            "latency": args.latency, "throttle_rate": args.throttle_rate,
+                                            "error_rate": args.error_rate}}
+    if not args.skip_parse:
+        results["parse"] = bench_parse(args.sites, repeats=args.repeats)
+    if not args.skip_crawl:
+        results["crawl"] = bench_crawl(args.sites, args.concurrency, args.pages, args.latency,
+                                       throttle_rate=args.throttle_rate, error_rate=args.error_rate)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    if args.update_baseline:
+        path = args.baseline or BASELINE_PATH
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+            file.write('\n')
+        logger.info(f"Stored the results as the baseline in {path}")
+        return 0
+    if args.baseline is None:
+        return 0
+    if not os.path.exists(args.baseline):
+        logger.warning(f"No baseline at {args.baseline}, run with --update-baseline to store one")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as file:
+        regressions = compare(results, json.load(file), args.tolerance)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    if not regressions:
+        logger.info("No regressions against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    configure_logging()
+    raise SystemExit(main())
@@ -0,0 +1,223 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    import requests
+
+# Configuration constants - can be overridden when importing
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl', '.cache')
+CACHE_TTL = 6 * 60 * 60
+CACHE_MAX_BYTES = 1024 * 1024 * 1024
+CACHE_COMPRESS_LEVEL = 6
+
+# Response headers kept with a cached body
+CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+logger = logging.getLogger(__name__)
+
+
+class CachedEntry:
+    """Metadata of one cached response"""
+
+    def __init__(self, key: str, url: str, headers: Dict[str, str], stored_at: float, size: int):
+        self.key = key
+        self.url = url
+        self.headers = headers
+        self.stored_at = stored_at
+        self.size = size
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get("ETag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get("Last-Modified")
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+
+class ResponseCache:
+    """
+    On-disk HTTP response cache keyed by URL
+
+    Bodies are stored gzip-compressed, one file per URL, with their metadata in a SQLite
+    index. Entries younger than ttl are served without any request. Older entries are
+    revalidated with If-None-Match/If-Modified-Since, and a 304 answer refreshes them.
+    When the blobs grow past max_bytes, the least recently used entries are evicted.
+    In offline mode only the cache is consulted, whatever the age of the entries.
+
+    Safe to share between the threads that run fetch_with_retry.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, ttl: float = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES,
+                 offline: bool = False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+        """)
+        self._total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _blob_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.gz')
+
+    def lookup(self, url: str) -> Optional[CachedEntry]:
+        key = self.key(url)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT url, headers, stored_at, size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return CachedEntry(key, row[0], json.loads(row[1]), row[2], row[3])
+
+    def is_fresh(self, entry: Optional[CachedEntry]) -> bool:
+        """Whether an entry can be served without contacting the site"""
+        return entry is not None and (self.offline or entry.age() < self.ttl)
+
+    def conditional_headers(self, entry: Optional[CachedEntry]) -> Dict[str, str]:
+        """Revalidation headers for a stale entry"""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def load(self, entry: CachedEntry) -> "requests.Response":
+        """Rebuild a response from the cache and mark the entry as recently used"""
+        # Imported here so opening the cache does not load requests
+        import requests
+        from requests.structures import CaseInsensitiveDict
+
+        with open(self._blob_path(entry.key), 'rb') as file:
+            content = gzip.decompress(file.read())
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), entry.key))
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry.url
+        response._content = content
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers) or 'utf-8'
+        response.from_cache = True
+        return response
+
+    def get(self, url: str) -> Optional["requests.Response"]:
+        """Return a fresh cached response, or None"""
+        entry = self.lookup(url)
+        if not self.is_fresh(entry):
+            return None
+        try:
+            response = self.load(entry)
+        except OSError:
+            return None
+        self.hits += 1
+        return response
+
+    def refresh(self, entry: CachedEntry) -> Optional["requests.Response"]:
+        """
+        Handle a 304 answer: the cached body is still current
+
+        Returns None when the body was evicted (or removed by another process) since the
+        entry was looked up, and the entry is dropped, so the page has to be fetched in full.
+        """
+        try:
+            response = self.load(entry)
+        except OSError:
+            with self._lock, self._connection:
+                deleted = self._connection.execute("DELETE FROM responses WHERE key = ?", (entry.key,)).rowcount
+                if deleted:
+                    self._total_size -= entry.size
+            return None
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE responses SET stored_at = ? WHERE key = ?", (time.time(), entry.key))
+        self.revalidated += 1
+        return response
+
+    def store(self, url: str, response: "requests.Response") -> None:
+        """Cache the body of a successful response to url"""
+        key = self.key(url)
+        blob = gzip.compress(response.content, CACHE_COMPRESS_LEVEL)
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Every writer gets its own temporary file, so concurrent stores of a URL never mix
+        descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(blob)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+        now = time.time()
+        with self._lock, self._connection:
+            previous = self._connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, url, headers, stored_at, last_access, size) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, url, json.dumps(headers), now, now, len(blob)))
+            self._total_size += len(blob) - (previous[0] if previous else 0)
+        self.misses += 1
+
+        if self._total_size > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache is back under 90% of max_bytes"""
+        target = self.max_bytes * 0.9
+        removed = 0
+        with self._lock, self._connection:
+            rows = self._connection.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+            for key, size in rows:
+                if self._total_size <= target:
+                    break
+                try:
+                    os.remove(self._blob_path(key))
+                except FileNotFoundError:
+                    pass
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_size -= size
+                removed += 1
+        logger.info(f"Evicted {removed} responses from the cache")
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+        logger.info(f"Response cache: {self.hits} hits, {self.revalidated} revalidated, {self.misses} fetched")
@@ -0,0 +1,76 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+# Configuration constants - can be overridden when importing
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl', '.checkpoints')
+CHECKPOINT_EVERY = 10
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """
+    Crawl progress of one site, saved atomically to <directory>/<site>.json
+
+    The state is produced by SiteCrawl.state(): the last page up to which every page is
+    done, the completed pages above it, failed pages, pages still in flight (pending
+    retries), the next unclaimed page, the known end of the listing and the number of
+    frontier rows. The frontier is flushed before every save, so a checkpoint never
+    claims a page whose jobs were not persisted.
+
+    A new run starts a new checkpoint. With resume, the saved state is loaded and the
+    crawl continues from it without refetching completed pages. The file is removed
+    once a run completes without failed pages.
+    """
+
+    def __init__(self, site: str, resume: bool = False, directory: str = CHECKPOINT_DIR,
+                 every: int = CHECKPOINT_EVERY):
+        self.site = site
+        self.path = os.path.join(directory, f"{site}.json")
+        self.every = every
+        self.state: Optional[Dict[str, Any]] = self.load() if resume else None
+        self.run_id = self.state["run_id"] if self.state else time.strftime("%Y%m%dT%H%M%S")
+        self._since_save = 0
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            logger.info(f"[{self.site}] No checkpoint to resume from, starting a new run")
+            return None
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError) as error:
+            logger.warning(f"[{self.site}] Ignoring unreadable checkpoint: {error}")
+            return None
+
+    def tick(self) -> bool:
+        """Count a finished page and tell whether a save is due"""
+        self._since_save += 1
+        return self._since_save >= self.every
+
+    def save(self, state: Dict[str, Any]) -> None:
+        state = dict(state, site=self.site, run_id=self.run_id, saved_at=time.time())
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # A crash mid-write leaves the previous checkpoint in place
+        descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                json.dump(state, file)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._since_save = 0
+
+    def clear(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,11 +1,20 @@
+import asyncio
 import logging
 import random
+import threading
 import time
-from typing import Tuple, Optional, Any
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Tuple, Optional, Any
+from urllib.parse import urlsplit
 
 import requests
 from cloudscraper.exceptions import CloudflareException
 
+from common.cache import ResponseCache
+from common.metrics import metrics
+from common.startup import startup
+from common.transport import ACCEPT_ENCODING, stream_get
+
 # Configuration constants - can be overridden when importing
 MIN_DELAY_BETWEEN_REQUESTS = 2
 MAX_DELAY_BETWEEN_REQUESTS = 5
@@ -17,6 +26,17 @@ REQUEST_TIMEOUT = 30
 MAX_RETRIES = 5
 BACKOFF_FACTOR = 2
 INITIAL_BACKOFF_DELAY = 5
+RETRY_JITTER = 0.2
+
+# Rate limiting configuration (requests per second, per host)
+DEFAULT_REQUESTS_PER_SECOND = 2 / (MIN_DELAY_BETWEEN_REQUESTS + MAX_DELAY_BETWEEN_REQUESTS)
+MIN_REQUESTS_PER_SECOND = 0.05
+MAX_REQUESTS_PER_SECOND = 2.0
+RATE_LIMIT_BURST = 1
+RATE_DECREASE_FACTOR = 0.5
+RATE_INCREASE_STEP = 0.05
+SUCCESSES_BEFORE_SPEEDUP = 10
+THROTTLE_STATUS_CODES = (429, 503)
 
 USER_AGENTS = [
     # Chrome (Windows)
@@ -41,18 +61,36 @@ USER_AGENTS = [
 ]
 
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
 logger = logging.getLogger(__name__)
 
 
 class ScrapingError(Exception):
     """Custom exception for scraping-related errors"""
-    pass
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RetryableError(ScrapingError):
+    """A failed attempt that is worth retrying once delay seconds have passed"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, delay: float = 0.0):
+        super().__init__(message, status_code)
+        self.delay = delay
+
+
+def get_host(url: str) -> str:
+    """Return the host part of a URL or URL template"""
+    return urlsplit(url).netloc
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """Return the HTTP status code attached to an error, if any"""
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return response.status_code
+    return getattr(error, 'status_code', None)
 
 
 class RetryConfig:
@@ -65,6 +103,142 @@ class RetryConfig:
         self.initial_delay = initial_delay
 
 
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header value
+
+    Args:
+        value: Header value, either delay-seconds or an HTTP date
+
+    Returns:
+        Delay in seconds, or None when the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class TokenBucket:
+    """Token bucket for a single host. Not thread-safe, HostRateLimiter guards it with a lock."""
+
+    def __init__(self, rate: float, capacity: int = RATE_LIMIT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self) -> float:
+        """Take one token and return how many seconds the caller must wait before using it"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        ready_at = self.updated
+        if self.tokens < 0:
+            ready_at += -self.tokens / self.rate
+        return max(0.0, ready_at - now)
+
+    def set_rate(self, rate: float) -> None:
+        self._refill(time.monotonic())
+        self.rate = rate
+
+    def block(self, seconds: float) -> None:
+        """Hand out no tokens for the given number of seconds"""
+        blocked_until = time.monotonic() + seconds
+        if blocked_until > self.updated:
+            self.tokens = min(self.tokens, 1.0)
+            self.updated = blocked_until
+
+
+class HostRateLimiter:
+    """
+    Adaptive per-host rate limiter shared by threaded and asyncio callers
+
+    Every host gets a token bucket. A 429/503 response cuts the host's rate by
+    RATE_DECREASE_FACTOR (and blocks it for Retry-After seconds when the header is
+    sent), while every SUCCESSES_BEFORE_SPEEDUP successful requests raise it by
+    RATE_INCREASE_STEP, so each host settles close to the rate it can sustain.
+    """
+
+    def __init__(self, default_rate: float = DEFAULT_REQUESTS_PER_SECOND, min_rate: float = MIN_REQUESTS_PER_SECOND,
+                 max_rate: float = MAX_REQUESTS_PER_SECOND, burst: int = RATE_LIMIT_BURST,
+                 host_rates: Optional[Dict[str, float]] = None):
+        self.default_rate = default_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.host_rates = host_rates or {}
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._successes: Dict[str, int] = {}
+
+    def _bucket(self, host: str) -> TokenBucket:
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.host_rates.get(host, self.default_rate), self.burst)
+            self._successes[host] = 0
+        return self._buckets[host]
+
+    def reserve(self, host: str) -> float:
+        """Take a token for host and return the delay before the request may be sent"""
+        with self._lock:
+            return self._bucket(host).reserve()
+
+    def acquire(self, host: str) -> None:
+        """Block the calling thread until a request to host is allowed"""
+        delay = self.reserve(host)
+        if delay > 0:
+            logger.info(f"[{host}] Waiting {delay:.2f} seconds...")
+            metrics.add_time("sleep", delay)
+            time.sleep(delay)
+
+    async def acquire_async(self, host: str) -> None:
+        """Wait without blocking the event loop until a request to host is allowed"""
+        delay = self.reserve(host)
+        if delay > 0:
+            logger.info(f"[{host}] Waiting {delay:.2f} seconds...")
+            metrics.add_time("sleep", delay)
+            await asyncio.sleep(delay)
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            bucket = self._bucket(host)
+            self._successes[host] += 1
+            if self._successes[host] >= SUCCESSES_BEFORE_SPEEDUP:
+                self._successes[host] = 0
+                bucket.set_rate(max(bucket.rate, min(self.max_rate, bucket.rate + RATE_INCREASE_STEP)))
+
+    def record_throttle(self, host: str, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            bucket = self._bucket(host)
+            self._successes[host] = 0
+            bucket.set_rate(max(self.min_rate, bucket.rate * RATE_DECREASE_FACTOR))
+            if retry_after:
+                bucket.block(retry_after)
+            logger.warning(f"[{host}] Throttled, rate lowered to {bucket.rate:.3f} req/s"
+                           + (f", paused for {retry_after:.1f} seconds" if retry_after else ""))
+
+    def rates(self) -> Dict[str, float]:
+        """Current rate of every known host in requests per second"""
+        with self._lock:
+            return {host: bucket.rate for host, bucket in self._buckets.items()}
+
+
+# Shared limiter used when callers do not bring their own
+rate_limiter = HostRateLimiter()
+
+
 def calculate_backoff_delay(retry_count: int, base_delay: int = INITIAL_BACKOFF_DELAY,
                             backoff_factor: int = BACKOFF_FACTOR) -> int:
     """
@@ -81,63 +255,213 @@ def calculate_backoff_delay(retry_count: int, base_delay: int = INITIAL_BACKOFF_
     return base_delay * (backoff_factor ** retry_count)
 
 
-def handle_request_error(error: requests.RequestException, retry_count: int = 0) -> Tuple[str, bool]:
+def add_jitter(delay: float, jitter: float = RETRY_JITTER) -> float:
+    """Spread a delay by +/- jitter so retries of many requests do not fire together"""
+    return delay * random.uniform(1 - jitter, 1 + jitter)
+
+
+def handle_request_error(error: requests.RequestException, retry_count: int = 0,
+                         limiter: Optional[HostRateLimiter] = None,
+                         retry_config: Optional[RetryConfig] = None) -> Tuple[str, Optional[float]]:
     """
-    Handle request errors and return appropriate action.
+    Handle request errors and return appropriate action. Never sleeps: the caller
+    decides how to wait for the returned delay.
 
     Args:
         error: The request exception that occurred
         retry_count: Current retry attempt (0-based)
+        limiter: Optional rate limiter. When given, 429/503 responses lower the
+            host's rate and the limiter spaces out the retry, so no extra delay is needed.
+        retry_config: Optional retry configuration, its initial delay and backoff factor
+            set the delay after server and network errors
 
     Returns:
-        tuple: (action, should_retry)
-        action: 'continue', 'break', 'wait'
-        should_retry: bool indicating if retry is recommended
+        tuple: (action, delay)
+        action: 'wait' or 'break'
+        delay: Seconds to wait before retrying, None for 'break'
     """
     logger.error(f"Request error (attempt {retry_count + 1}): {error}")
+    if retry_config is None:
+        retry_config = RetryConfig()
 
-    if hasattr(error, 'response') and error.response:
+    if getattr(error, 'response', None) is not None:
         status_code = error.response.status_code
 
-        if status_code == 429:
+        if status_code in THROTTLE_STATUS_CODES:
+            retry_after = parse_retry_after(error.response.headers.get('Retry-After'))
+            if limiter is not None:
+                limiter.record_throttle(get_host(error.response.url), retry_after)
+                return 'wait', 0.0
+
             logger.warning("Rate limited, waiting...")
-            backoff_delay = calculate_backoff_delay(retry_count, TOO_MANY_REQUESTS_TIMEOUT)
-            logger.info(f"Backing off for {backoff_delay} seconds...")
-            time.sleep(backoff_delay)
-            return 'wait', True
+            if retry_after is not None:
+                return 'wait', retry_after
+            return 'wait', add_jitter(calculate_backoff_delay(retry_count, TOO_MANY_REQUESTS_TIMEOUT))
         elif status_code == 404:
             logger.info("Page not found, likely reached the end.")
-            return 'break', False
+            return 'break', None
+        elif status_code in [500, 502, 504]:  # Server errors - worth retrying
+            logger.warning(f"Server error {status_code}")
+            return 'wait', add_jitter(calculate_backoff_delay(retry_count, retry_config.initial_delay,
+                                                              retry_config.backoff_factor))
         elif status_code >= 401:
             logger.warning("Unauthorized")
-            return 'break', False
-        elif status_code in [500, 502, 503, 504]:  # Server errors - worth retrying
-            backoff_delay = calculate_backoff_delay(retry_count)
-            logger.warning(f"Server error {status_code}, backing off for {backoff_delay} seconds...")
-            time.sleep(backoff_delay)
-            return 'wait', True
+            return 'break', None
         else:
             logger.error(f"HTTP error {status_code}")
-            return 'break', False
+            return 'break', None
     else:
         # Network errors - might be temporary
         logger.warning("Network error (no response)")
-        backoff_delay = calculate_backoff_delay(retry_count)
-        logger.info(f"Network error, backing off for {backoff_delay} seconds...")
-        time.sleep(backoff_delay)
-        return 'wait', True
+        return 'wait', add_jitter(calculate_backoff_delay(retry_count, retry_config.initial_delay,
+                                                          retry_config.backoff_factor))
 
 
-def scrape_page_with_retry(scraper: Any, url: str, page: int,
-                           retry_config: Optional[RetryConfig] = None) -> requests.Response:
+def fetch_attempt(scraper: Any, url: str, label: Optional[str] = None, retry_count: int = 0,
+                  retry_config: Optional[RetryConfig] = None,
+                  limiter: Optional[HostRateLimiter] = None,
+                  token_acquired: bool = False,
+                  cache: Optional[ResponseCache] = None,
+                  extra_headers: Optional[Dict[str, str]] = None,
+                  on_text: Optional[Callable[[str], None]] = None) -> requests.Response:
     """
-    Scrape a single page with retry logic
+    Make a single attempt at fetching a URL, without waiting between retries
 
     Args:
         scraper: Cloudscraper instance
-        url: URL template with {page} placeholder
-        page: Page number to scrape
+        url: URL to fetch
+        label: Name of the request in log messages, defaults to the URL
+        retry_count: Number of attempts already made (0-based)
+        retry_config: Optional retry configuration
+        limiter: Optional rate limiter, a token is taken for the host before the request
+        token_acquired: The caller already took the token for this attempt
+        cache: Optional response cache. Fresh entries are returned without a request or a
+            rate limiter token, stale ones are revalidated with a conditional request.
+        extra_headers: Optional request headers, such as the caller's own If-None-Match.
+            A 304 answer to them is returned as it is.
+        on_text: Optional callback receiving the body's text piece by piece as it
+            downloads (see common.transport.read_body). Not called for cached pages.
+
+    Returns:
+        Response object on success
+
+    Raises:
+        RetryableError: The attempt failed and another one is worth making after error.delay
+        ScrapingError: The error is not retryable or this was the last attempt
+    """
+    if retry_config is None:
+        retry_config = RetryConfig()
+    if label is None:
+        label = url
+    host = get_host(url)
+
+    cached_entry = None
+    if cache is not None:
+        cached = cache.get(url)
+        if cached is not None:
+            logger.info(f"Loaded {label} from cache")
+            return cached
+        if cache.offline:
+            raise ScrapingError(f"{url} is not in the cache", 404)
+        cached_entry = cache.lookup(url)
+
+    try:
+        if limiter is not None and not token_acquired:
+            limiter.acquire(host)
+
+        logger.info(f"Scraping {label} (attempt {retry_count + 1}/{retry_config.max_retries})...")
+
+        # No User-Agent: every session sends its own on all its requests, which keeps
+        # its Cloudflare clearance and its keep-alive connections valid
+        headers = {
+            "Accept-Language": "en-US,en;q=0.9,vi;q=0.8",
+            "Accept-Encoding": ACCEPT_ENCODING,
+            "Referer": url.split("/")[0],
+        }
+        if extra_headers:
+            headers.update(extra_headers)
+        if cache is not None:
+            headers.update(cache.conditional_headers(cached_entry))
+
+        startup.first_request()
+
+        def get(request_headers: Dict[str, str]) -> requests.Response:
+            started = time.perf_counter()
+            try:
+                response = stream_get(scraper, url, on_text, timeout=REQUEST_TIMEOUT, headers=request_headers)
+            except Exception as error:
+                metrics.observe_request(host, time.perf_counter() - started,
+                                        get_status_code(error) or type(error).__name__)
+                raise
+            metrics.observe_request(host, time.perf_counter() - started, response.status_code,
+                                    len(response.content))
+            return response
+
+        response = get(headers)
+        if response.status_code == 304 and cached_entry is not None:
+            refreshed = cache.refresh(cached_entry)
+            if refreshed is not None:
+                if limiter is not None:
+                    limiter.record_success(host)
+                logger.info(f"{label} not modified, using cached copy")
+                return refreshed
+            logger.info(f"{label} not modified, but its cached copy was evicted, fetching it again")
+            for name in cache.conditional_headers(cached_entry):
+                headers.pop(name, None)
+            response = get(headers)
+        response.raise_for_status()
+
+        if limiter is not None:
+            limiter.record_success(host)
+        if cache is not None and response.status_code != 304:
+            cache.store(url, response)
+        logger.info(f"Successfully scraped {label}")
+        logger.debug(f"{response.status_code} - {url}")
+
+        return response
+
+    except CloudflareException as error:
+        logger.error(f"Cloudflare error (attempt {retry_count + 1}): {error}")
+        metrics.count_challenge(host)
+        failure, kind = error, "Cloudflare error"
+        delay = add_jitter(calculate_backoff_delay(retry_count, CLOUDFLARE_TIMEOUT))
+
+    except requests.RequestException as error:
+        action, delay = handle_request_error(error, retry_count, limiter, retry_config)
+        if action == 'break':
+            raise ScrapingError(f"Non-retryable request error: {error}", get_status_code(error))
+        failure, kind = error, "Request error"
+
+    except Exception as error:
+        logger.error(f"Unexpected error (attempt {retry_count + 1}): {error}")
+        failure, kind = error, "Unexpected error"
+        delay = add_jitter(calculate_backoff_delay(retry_count, retry_config.initial_delay, retry_config.backoff_factor))
+
+    if retry_count >= retry_config.max_retries - 1:
+        logger.error(f"Max retries reached for {kind.lower()}")
+        raise ScrapingError(f"{kind} after {retry_config.max_retries} attempts: {failure}", get_status_code(failure))
+    raise RetryableError(f"{kind}: {failure}", get_status_code(failure), delay)
+
+
+def fetch_with_retry(scraper: Any, url: str, label: Optional[str] = None,
+                     retry_config: Optional[RetryConfig] = None,
+                     limiter: Optional[HostRateLimiter] = None,
+                     first_token_acquired: bool = False,
+                     cache: Optional[ResponseCache] = None) -> requests.Response:
+    """
+    Fetch a single URL with retry logic, sleeping through the backoff between attempts
+
+    Blocking callers with nothing else to do use this; the async engines run
+    fetch_attempt and hand failed requests to a RetryScheduler instead.
+
+    Args:
+        scraper: Cloudscraper instance
+        url: URL to fetch
+        label: Name of the request in log messages, defaults to the URL
         retry_config: Optional retry configuration
+        limiter: Optional rate limiter, a token is taken for the host before every attempt
+        first_token_acquired: The caller already took the token for the first attempt
+        cache: Optional response cache, see fetch_attempt
 
     Returns:
         Response object on success
@@ -150,50 +474,39 @@ def scrape_page_with_retry(scraper: Any, url: str, page: int,
 
     for retry_count in range(retry_config.max_retries):
         try:
-            logger.info(f"Scraping page {page} (attempt {retry_count + 1}/{retry_config.max_retries})...")
+            return fetch_attempt(scraper, url, label, retry_count, retry_config, limiter,
+                                 first_token_acquired and retry_count == 0, cache)
+        except RetryableError as error:
+            logger.info(f"Retrying in {error.delay:.1f} seconds...")
+            metrics.count_retry(get_host(url))
+            metrics.add_time("sleep", error.delay)
+            time.sleep(error.delay)
 
-            response = scraper.get(url.format(page=page), timeout=REQUEST_TIMEOUT, headers={
-                "User-Agent": random.choice(USER_AGENTS),
-                "Accept-Language": "en-US,en;q=0.9,vi;q=0.8",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Referer": url.split("/")[0],
-            })
-            response.raise_for_status()
+    raise ScrapingError("Unexpected end of retry loop")
 
-            logger.info(f"Successfully scraped page {page}")
-            logger.debug(f"{response.status_code} - {url.format(page=page)}")
 
-            return response
+def scrape_page_with_retry(scraper: Any, url: str, page: int,
+                           retry_config: Optional[RetryConfig] = None,
+                           limiter: Optional[HostRateLimiter] = None,
+                           first_token_acquired: bool = False,
+                           cache: Optional[ResponseCache] = None) -> requests.Response:
+    """
+    Scrape a single listing page with retry logic
 
-        except CloudflareException as error:
-            logger.error(f"Cloudflare error (attempt {retry_count + 1}): {error}")
-            if retry_count < retry_config.max_retries - 1:
-                backoff_delay = calculate_backoff_delay(retry_count, CLOUDFLARE_TIMEOUT)
-                logger.info(f"Retrying in {backoff_delay} seconds...")
-                time.sleep(backoff_delay)
-            else:
-                logger.error("Max retries reached for Cloudflare error")
-                raise ScrapingError(f"Cloudflare error after {retry_config.max_retries} attempts: {error}")
-
-        except requests.RequestException as error:
-            action, should_retry = handle_request_error(error, retry_count)
-
-            if action == 'break':
-                raise ScrapingError(f"Non-retryable request error: {error}")
-
-            if not should_retry or retry_count >= retry_config.max_retries - 1:
-                if retry_count >= retry_config.max_retries - 1:
-                    logger.error("Max retries reached for request error")
-                raise ScrapingError(f"Request error after {retry_config.max_retries} attempts: {error}")
-
-        except Exception as error:
-            logger.error(f"Unexpected error (attempt {retry_count + 1}): {error}")
-            if retry_count < retry_config.max_retries - 1:
-                backoff_delay = calculate_backoff_delay(retry_count)
-                logger.info(f"Retrying in {backoff_delay} seconds...")
-                time.sleep(backoff_delay)
-            else:
-                logger.error("Max retries reached for unexpected error")
-                raise ScrapingError(f"Unexpected error after {retry_config.max_retries} attempts: {error}")
-
-    raise ScrapingError("Unexpected end of retry loop")
\ No newline at end of file
+    Args:
+        scraper: Cloudscraper instance
+        url: URL template with {page} placeholder
+        page: Page number to scrape
+        retry_config: Optional retry configuration
+        limiter: Optional rate limiter, a token is taken for the host before every attempt
+        first_token_acquired: The caller already took the token for the first attempt
+        cache: Optional response cache, see fetch_with_retry
+
+    Returns:
+        Response object on success
+
+    Raises:
+        ScrapingError: When all retries are exhausted
+    """
+    return fetch_with_retry(scraper, url.format(page=page), f"page {page}", retry_config, limiter,
+                            first_token_acquired, cache)
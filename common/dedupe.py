@@ -0,0 +1,368 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import struct
+import time
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from common.frontier import canonical_job_id
+from common.locations import load_locations, slugify
+from common.startup import configure_logging
+
+# Configuration constants - can be overridden when importing
+DEDUPE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl', 'duplicates.db')
+NUM_PERM = 64
+LSH_BANDS = 16
+SIMILARITY_THRESHOLD = 0.6
+COMPANY_THRESHOLD = 0.5
+MAX_CANDIDATES = 100
+MAX_BUCKET_SIZE = 100
+DEDUPE_BATCH_SIZE = 1000
+
+# Title words that advertise a posting rather than describe the job
+TITLE_NOISE = frozenset("""
+    tuyen gap can urgent hot hiring new moi nhieu luong cao thu nhap upto up to tr trieu usd vnd k thang nam
+    tai lam viec va cac cho
+""".split())
+
+# Legal forms and other words companies are written with or without
+COMPANY_NOISE = frozenset("""
+    cong ty co phan tnhh mtv trach nhiem huu han thanh vien mot hai tap doan chi nhanh van phong dai dien
+    jsc ltd company corporation corp group inc llc pte plc limited joint stock vietnam viet nam vn
+""".split())
+
+# Ways of writing the largest cities that slugify does not reduce to the province slug
+LOCATION_ALIASES = {
+    "hcm": "ho-chi-minh", "tp-hcm": "ho-chi-minh", "tphcm": "ho-chi-minh", "sai-gon": "ho-chi-minh",
+    "saigon": "ho-chi-minh", "ho-chi-minh-city": "ho-chi-minh", "hn": "ha-noi", "hanoi": "ha-noi",
+    "da-nang-city": "da-nang", "danang": "da-nang",
+}
+
+# Mersenne prime the MinHash permutations are computed modulo
+MERSENNE_PRIME = (1 << 61) - 1
+
+logger = logging.getLogger(__name__)
+
+_province_slugs: Optional[List[str]] = None
+
+
+def tokens(text: Optional[str], noise: frozenset = frozenset()) -> List[str]:
+    """Words of a text without diacritics, case, punctuation, numbers and noise words"""
+    if not text:
+        return []
+    return [word for word in slugify(text).split('-') if word and not word.isdigit() and word not in noise]
+
+
+def normalise_title(title: Optional[str]) -> List[str]:
+    return tokens(title, TITLE_NOISE)
+
+
+def normalise_company(company: Optional[str]) -> List[str]:
+    return tokens(company, COMPANY_NOISE)
+
+
+def normalise_location(location: Optional[str]) -> Set[str]:
+    """Slugs of the provinces a location mentions, e.g. "Quận 1, TP.HCM" -> {"ho-chi-minh"}"""
+    global _province_slugs
+    if not location:
+        return set()
+    if _province_slugs is None:
+        # Longest first, so "ba-ria-vung-tau" is matched before any shorter slug inside it
+        _province_slugs = sorted({slugify(name) for name in load_locations()}, key=len, reverse=True)
+    slug = f"-{slugify(location)}-"
+    for alias, province in LOCATION_ALIASES.items():
+        slug = slug.replace(f"-{alias}-", f"-{province}-")
+    return {province for province in _province_slugs if f"-{province}-" in slug}
+
+
+def shingles(title: List[str], company: List[str]) -> Set[str]:
+    """
+    Features compared between postings: words and word pairs of the title and the company
+
+    Company features are prefixed so they never match a title feature.
+    """
+    features = set(title)
+    features.update(f"{first} {second}" for first, second in zip(title, title[1:]))
+    features.update(f"@{word}" for word in company)
+    features.update(f"@{first} {second}" for first, second in zip(company, company[1:]))
+    return features
+
+
+class MinHasher:
+    """
+    MinHash signatures of NUM_PERM values
+
+    Every feature is hashed to 64 bits once with blake2b, and each of the num_perm
+    permutations is a universal hash (a * x + b) mod 2^61 - 1 over those hashes. The
+    share of equal positions in two signatures estimates the Jaccard similarity of the
+    feature sets. The permutations come from a fixed seed, so signatures stay comparable
+    between runs.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        generator = random.Random(seed)
+        self.num_perm = num_perm
+        self.permutations = [(generator.randrange(1, MERSENNE_PRIME), generator.randrange(MERSENNE_PRIME))
+                             for _ in range(num_perm)]
+
+    def signature(self, features: Iterable[str]) -> Optional[List[int]]:
+        """Signature of a feature set, None when it is empty"""
+        hashes = [int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+                  for feature in features]
+        if not hashes:
+            return None
+        return [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in self.permutations]
+
+
+def similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of the feature sets behind two signatures"""
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+def jaccard(first: Set[str], second: Set[str]) -> float:
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+class DuplicateIndex:
+    """
+    Incremental cross-site clustering of near-duplicate job postings, backed by SQLite
+
+    Each posting is normalised (see normalise_title, normalise_company and
+    normalise_location) and reduced to a MinHash signature of its shingles. The
+    signature is cut into bands of NUM_PERM / LSH_BANDS values. Postings that share any
+    band land in the same bucket and become candidates. With 16 bands of 4 values, a
+    pair with similarity 0.7 meets with 99% probability, 0.6 with 89%, and 0.3 with
+    only 12%. A candidate is a duplicate when its estimated similarity reaches
+    threshold, its company words overlap the posting's by COMPANY_THRESHOLD (when both
+    name a company) and its location does not name other provinces.
+
+    A bucket that fills up past MAX_BUCKET_SIZE stops taking postings and is no longer
+    searched: a band shared by that many postings is made of common title words
+    ("nhan vien kinh doanh") and says nothing about which of them is the same job.
+    Candidates are ranked by the number of bands they share, and at most MAX_CANDIDATES
+    are compared.
+
+    A posting joins the cluster of its most similar duplicate, or starts a cluster of
+    its own. Clusters are never merged, so a chain of postings that each look a bit
+    like the next cannot pull unrelated jobs together. Each posting only looks at its
+    own buckets, so adding one costs the same with a thousand postings or ten million.
+    Buckets and signatures live in the database, so memory stays flat. A posting that
+    is already indexed (same site and job ID) keeps its cluster.
+
+    Usage:
+        with DuplicateIndex() as index:
+            cluster = index.add(record)
+    """
+
+    def __init__(self, path: str = DEDUPE_PATH, num_perm: int = NUM_PERM, bands: int = LSH_BANDS,
+                 threshold: float = SIMILARITY_THRESHOLD, batch_size: int = DEDUPE_BATCH_SIZE):
+        if num_perm % bands:
+            raise ValueError(f"{bands} bands do not divide {num_perm} permutations")
+        self.path = path
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.added = 0
+        self.duplicates = 0
+        self._uncommitted = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS postings (
+                id INTEGER PRIMARY KEY,
+                site TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                url TEXT,
+                title TEXT,
+                company TEXT,
+                company_words TEXT,
+                provinces TEXT,
+                signature BLOB,
+                cluster INTEGER,
+                UNIQUE (site, job_id)
+            );
+            CREATE INDEX IF NOT EXISTS postings_cluster ON postings (cluster);
+            CREATE TABLE IF NOT EXISTS buckets (
+                key INTEGER NOT NULL,
+                posting INTEGER NOT NULL,
+                PRIMARY KEY (key, posting)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS bucket_sizes (
+                key INTEGER PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+        """)
+
+    def _band_keys(self, signature: List[int]) -> List[int]:
+        keys = []
+        for band in range(self.bands):
+            values = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(struct.pack(f"<H{self.rows}Q", band, *values), digest_size=8).digest()
+            keys.append(int.from_bytes(digest, 'little', signed=True))
+        return keys
+
+    def _open_keys(self, keys: List[int]) -> List[int]:
+        """The keys among the given ones whose bucket is not full"""
+        full = {key for (key,) in self._connection.execute(
+            f"SELECT key FROM bucket_sizes WHERE key IN ({', '.join('?' * len(keys))}) AND size >= ?",
+            (*keys, MAX_BUCKET_SIZE))}
+        return [key for key in keys if key not in full]
+
+    def _candidates(self, keys: List[int]) -> List[Tuple[bytes, str, str, int]]:
+        if not keys:
+            return []
+        return self._connection.execute(f"""
+            SELECT signature, company_words, provinces, cluster FROM postings WHERE id IN (
+                SELECT posting FROM buckets WHERE key IN ({', '.join('?' * len(keys))})
+                GROUP BY posting ORDER BY COUNT(*) DESC, posting DESC LIMIT {MAX_CANDIDATES})
+        """, keys).fetchall()
+
+    def add(self, record: Dict[str, Any]) -> Optional[int]:
+        """
+        Index a detail or listing record
+
+        Returns:
+            The posting's cluster ID, shared with its near-duplicates, or None when the
+            record has no title and company to compare
+        """
+        site, url = record.get("site"), record.get("url")
+        job_id = record.get("job_id") or canonical_job_id(site, url)
+        known = self._connection.execute("SELECT cluster FROM postings WHERE site = ? AND job_id = ?",
+                                         (site, job_id)).fetchone()
+        if known is not None:
+            return known[0]
+
+        company = normalise_company(record.get("company"))
+        signature = self.hasher.signature(shingles(normalise_title(record.get("title")), company))
+        if signature is None:
+            return None
+        company_words = set(company)
+        provinces = normalise_location(record.get("location"))
+        keys = self._band_keys(signature)
+        open_keys = self._open_keys(keys)
+
+        best, cluster = self.threshold, None
+        for blob, other_company, other_provinces, other_cluster in self._candidates(open_keys):
+            if provinces and other_provinces and provinces.isdisjoint(other_provinces.split(',')):
+                continue
+            if company_words and other_company and \
+                    jaccard(company_words, set(other_company.split())) < COMPANY_THRESHOLD:
+                continue
+            score = similarity(signature, array('Q', blob).tolist())
+            if score >= best:
+                best, cluster = score, other_cluster
+
+        cursor = self._connection.execute(
+            "INSERT INTO postings (site, job_id, url, title, company, company_words, provinces, signature, cluster) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (site, job_id, url, record.get("title"), record.get("company"), ' '.join(sorted(company_words)),
+             ','.join(sorted(provinces)), array('Q', signature).tobytes(), cluster))
+        posting = cursor.lastrowid
+        if cluster is None:
+            self._connection.execute("UPDATE postings SET cluster = ? WHERE id = ?", (posting, posting))
+        self._connection.executemany("INSERT OR IGNORE INTO buckets (key, posting) VALUES (?, ?)",
+                                     [(key, posting) for key in open_keys])
+        self._connection.executemany(
+            "INSERT INTO bucket_sizes (key, size) VALUES (?, 1) ON CONFLICT (key) DO UPDATE SET size = size + 1",
+            [(key,) for key in keys])
+
+        self.added += 1
+        if cluster is not None:
+            self.duplicates += 1
+        else:
+            cluster = posting
+        self._uncommitted += 1
+        if self._uncommitted >= self.batch_size:
+            self.commit()
+        return cluster
+
+    def tag(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Set the record's cluster_id and return it, for use in front of a record sink"""
+        record["cluster_id"] = self.add(record)
+        return record
+
+    def commit(self) -> None:
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Postings, clusters, clusters with more than one posting and clusters spanning several sites"""
+        postings, clusters = self._connection.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT cluster) FROM postings").fetchone()
+        multi, cross_site = self._connection.execute("""
+            SELECT COALESCE(SUM(size > 1), 0), COALESCE(SUM(sites > 1), 0) FROM (
+                SELECT COUNT(*) AS size, COUNT(DISTINCT site) AS sites FROM postings GROUP BY cluster)
+        """).fetchone()
+        return {"postings": postings, "clusters": clusters, "duplicated": multi, "cross_site": cross_site}
+
+    def largest_cross_site(self, limit: int) -> List[int]:
+        """IDs of the largest clusters spanning several sites"""
+        rows = self._connection.execute("""
+            SELECT cluster FROM postings GROUP BY cluster HAVING COUNT(DISTINCT site) > 1
+            ORDER BY COUNT(*) DESC LIMIT ?
+        """, (limit,)).fetchall()
+        return [cluster for (cluster,) in rows]
+
+    def cluster(self, cluster: int) -> List[Tuple[str, str, str]]:
+        """(site, URL, title) of every posting in a cluster"""
+        return self._connection.execute("SELECT site, url, title FROM postings WHERE cluster = ? ORDER BY id",
+                                        (cluster,)).fetchall()
+
+    def close(self) -> None:
+        self.commit()
+        self._connection.close()
+        logger.info(f"Duplicate index: {self.added} postings added, {self.duplicates} near-duplicates of earlier ones")
+
+    def __enter__(self) -> "DuplicateIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Records of a JSON Lines file, gzip-compressed or not"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate postings of exported detail or listing records")
+    parser.add_argument('files', nargs='+', help="JSON Lines exports, plain or .gz")
+    parser.add_argument('--path', default=DEDUPE_PATH, help="duplicate index database")
+    parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD,
+                        help="estimated similarity from which two postings are duplicates")
+    parser.add_argument('--show', type=int, default=0, metavar='N', help="log N of the largest cross-site clusters")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    with DuplicateIndex(args.path, threshold=args.threshold) as index:
+        for path in args.files:
+            for record in read_records(path):
+                index.add(record)
+            logger.info(f"Indexed {path}")
+        elapsed = time.perf_counter() - started
+        logger.info(f"{index.added} postings added in {elapsed:.1f}s ({index.added / max(elapsed, 1e-9):.0f}/s), "
+                    f"index: {index.stats()}")
+        for cluster in index.largest_cross_site(args.show):
+            logger.info(f"Cluster {cluster}:\n" + "\n".join(f"  [{site}] {title} {url}"
+                                                             for site, url, title in index.cluster(cluster)))
+
+
+if __name__ == '__main__':
+    configure_logging()
+    main()
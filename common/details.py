@@ -0,0 +1,345 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.cache import ResponseCache
+from common.common import (HostRateLimiter, RetryableError, RetryConfig, ScrapingError, fetch_attempt, get_host,
+                           rate_limiter)
+from common.frontier import canonical_job_id
+from common.metrics import metrics
+from common.parsing import PARSE_WORKERS, ParsePool, make_soup
+from common.recrawl import EXPIRED_STATUS_CODES, RecrawlStore, content_hash
+from common.retry import RetryScheduler
+from common.sites import load_site_module
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# Configuration constants - can be overridden when importing
+FETCH_CONCURRENCY = 8
+PER_HOST_CONCURRENCY = 2
+QUEUE_SIZE = 64
+RETRY_POLL_INTERVAL = 1.0
+
+# Fields every detail record carries, missing ones are None
+DETAIL_FIELDS = ("title", "company", "salary", "location", "deadline", "description")
+
+# Fields of a complete detail record, as written by output sinks. cluster_id is set by
+# the duplicate index (common.dedupe) when it is enabled.
+DETAIL_RECORD_FIELDS = ("site", "url", "job_id") + DETAIL_FIELDS + ("cluster_id", "fetched_at")
+
+logger = logging.getLogger(__name__)
+
+
+def iter_job_urls(path: str) -> Iterator[str]:
+    """Stream the URLs of a job_urls.txt file without loading it into memory"""
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def clean_text(value: Any) -> Optional[str]:
+    """Collapse whitespace in a string, or the text of a tag. Empty values become None."""
+    if value is None:
+        return None
+    if hasattr(value, 'get_text'):
+        value = value.get_text(" ")
+    value = " ".join(str(value).split())
+    return value or None
+
+
+def select_text(soup: "BeautifulSoup", *selectors: str) -> Optional[str]:
+    """Text of the first element matching any of the CSS selectors"""
+    for selector in selectors:
+        text = clean_text(soup.select_one(selector))
+        if text:
+            return text
+    return None
+
+
+def find_job_posting(soup: "BeautifulSoup") -> Dict[str, Any]:
+    """Return the schema.org JobPosting embedded as JSON-LD, or an empty dict"""
+    for script in soup.find_all("script", {"type": "application/ld+json"}):
+        try:
+            data = json.loads(script.string or "")
+        except ValueError:
+            continue
+        items = data if isinstance(data, list) else data.get("@graph", [data])
+        for item in items:
+            if isinstance(item, dict) and item.get("@type") == "JobPosting":
+                return item
+    return {}
+
+
+def _job_posting_location(posting: Dict[str, Any]) -> Optional[str]:
+    locations = posting.get("jobLocation") or []
+    if isinstance(locations, dict):
+        locations = [locations]
+    names = []
+    for location in locations:
+        address = location.get("address", {}) if isinstance(location, dict) else {}
+        if isinstance(address, dict):
+            name = address.get("addressRegion") or address.get("addressLocality")
+        else:
+            name = address
+        if name and name not in names:
+            names.append(clean_text(name))
+    return ", ".join(names) or None
+
+
+def _job_posting_salary(posting: Dict[str, Any]) -> Optional[str]:
+    salary = posting.get("baseSalary")
+    if not isinstance(salary, dict):
+        return clean_text(salary)
+    value = salary.get("value", {})
+    if not isinstance(value, dict):
+        return clean_text(value)
+    low, high = value.get("minValue"), value.get("maxValue")
+    amount = f"{low} - {high}" if low and high else value.get("value") or low or high
+    if not amount:
+        return None
+    return clean_text(f"{amount} {salary.get('currency', '')}")
+
+
+def parse_job_posting(soup: "BeautifulSoup") -> Dict[str, Optional[str]]:
+    """
+    Extract the detail fields from a JSON-LD JobPosting
+
+    All four crawled sites publish one for search engines, so it is the most stable
+    source. Site extractors fill in whatever it lacks from the page markup.
+    """
+    posting = find_job_posting(soup)
+    organization = posting.get("hiringOrganization")
+    description = posting.get("description")
+    if description:
+        description = clean_text(make_soup(description, "html.parser"))
+    return {
+        "title": clean_text(posting.get("title")),
+        "company": clean_text(organization.get("name") if isinstance(organization, dict) else organization),
+        "salary": _job_posting_salary(posting),
+        "location": _job_posting_location(posting),
+        "deadline": clean_text(posting.get("validThrough")),
+        "description": description,
+    }
+
+
+def merge_fields(primary: Dict[str, Optional[str]], fallback: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+    """Take each detail field from primary, falling back to the same field in fallback"""
+    return {field: primary.get(field) or fallback.get(field) for field in DETAIL_FIELDS}
+
+
+def parse_detail(site: str, url: str, html: str) -> Dict[str, Any]:
+    """
+    Parse a detail page with the site's extractor from crawl/<site>/get_details.py
+
+    Top-level function so it can be sent to a process pool.
+    """
+    extract = load_site_module(site, 'get_details.py').extract_job_detail
+    record = {"site": site, "url": url, "job_id": canonical_job_id(site, url)}
+    record.update(extract(make_soup(html)))
+    record["fetched_at"] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    return record
+
+
+class DetailPipeline:
+    """
+    Fetch job detail pages concurrently and parse them on a separate pool
+
+    Fetch workers hand raw HTML to a bounded queue and immediately move on to the next
+    URL. Parse workers take pages from that queue and run the extractors on a ParsePool
+    (threads by default, processes with use_processes=True). A slow parser therefore
+    never holds up the network, and the bounded queues keep memory flat while the
+    input URLs are streamed.
+
+    A failed fetch goes to the retry scheduler with its backoff deadline and is put back
+    on the job queue once the deadline has passed, so fetch workers never sleep.
+
+    With a RecrawlStore, pages are fetched with the validators of their last fetch and
+    hashed with content_hash. A 304 answer or an unchanged hash only reschedules the
+    page, so just new and changed pages are parsed. Pages answering 404 or 410 are
+    marked expired.
+    """
+
+    def __init__(self, scrapers: Dict[str, Any], fetch_concurrency: int = FETCH_CONCURRENCY,
+                 per_host_concurrency: int = PER_HOST_CONCURRENCY, parse_workers: int = PARSE_WORKERS,
+                 use_processes: bool = False, limiter: Optional[HostRateLimiter] = None,
+                 retry_config: Optional[RetryConfig] = None, cache: Optional[ResponseCache] = None,
+                 retries: Optional[RetryScheduler] = None, recrawl: Optional[RecrawlStore] = None):
+        self.scrapers = scrapers
+        self.fetch_concurrency = fetch_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.parse_workers = parse_workers
+        self.use_processes = use_processes
+        self.limiter = limiter or rate_limiter
+        self.retry_config = retry_config
+        self.cache = cache
+        self.retries = retries or RetryScheduler()
+        self.recrawl = recrawl
+        self.fetched = 0
+        self.parsed = 0
+        self.unchanged = 0
+        self.expired = 0
+        self.failed = 0
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_semaphores[host]
+
+    async def _fetch_worker(self, jobs: asyncio.Queue, pages: asyncio.Queue) -> None:
+        while True:
+            item = await jobs.get()
+            if item is None:
+                return
+            site, url, attempt = item
+            host = get_host(url)
+            validators = self.recrawl.conditional_headers(site, url) if self.recrawl is not None else None
+            try:
+                async with self._host_semaphore(host):
+                    cached = self.cache is not None and self.cache.is_fresh(self.cache.lookup(url))
+                    if not cached:
+                        await self.limiter.acquire_async(host)
+                    response = await asyncio.to_thread(fetch_attempt, self.scrapers[site], url, None, attempt,
+                                                       self.retry_config, self.limiter, not cached, self.cache,
+                                                       validators)
+            except ScrapingError as error:
+                if self.recrawl is not None and error.status_code in EXPIRED_STATUS_CODES:
+                    if self.recrawl.record_expired(site, url, error.status_code):
+                        self.expired += 1
+                elif not (isinstance(error, RetryableError)
+                          and self.retries.schedule("", host, (site, url), attempt + 1, error.delay)):
+                    self.failed += 1
+                    logger.warning(f"[{site}] Failed to fetch {url}: {error}")
+                continue
+            finally:
+                jobs.task_done()
+            self.retries.record_success(host)
+            self.fetched += 1
+            if self.recrawl is None:
+                await pages.put((site, url, response.text, None, None))
+                continue
+            if response.status_code == 304:
+                self.unchanged += 1
+                self.recrawl.record_unchanged(site, url)
+                continue
+            html = response.text
+            digest = await asyncio.to_thread(content_hash, html)
+            if digest == self.recrawl.stored_hash(site, url):
+                self.unchanged += 1
+                self.recrawl.record_content(site, url, digest, response.headers)
+                continue
+            await pages.put((site, url, html, digest, response.headers))
+
+    async def _requeue_due(self, jobs: asyncio.Queue) -> None:
+        """Put the retries whose deadline has passed back on the job queue"""
+        while True:
+            retry = self.retries.pop_due("")
+            if retry is None:
+                return
+            (site, url), attempt = retry
+            await jobs.put((site, url, attempt))
+
+    async def _feed_retries(self, jobs: asyncio.Queue) -> None:
+        while True:
+            await self._requeue_due(jobs)
+            if self.retries.pending():
+                await self.retries.wait(timeout=RETRY_POLL_INTERVAL)
+            else:
+                await asyncio.sleep(RETRY_POLL_INTERVAL)
+
+    async def _parse_worker(self, pages: asyncio.Queue, pool: ParsePool,
+                            on_record: Callable[[Dict[str, Any]], None]) -> None:
+        while True:
+            item = await pages.get()
+            if item is None:
+                return
+            site, url, html, digest, headers = item
+            try:
+                with metrics.timed("parse"):
+                    record = await pool.run(parse_detail, site, url, html)
+            except Exception as error:
+                self.failed += 1
+                logger.error(f"[{site}] Failed to parse {url}: {error}")
+                continue
+            # The hash is stored once the page parsed, so a page that failed is parsed again next time
+            if digest is not None:
+                self.recrawl.record_content(site, url, digest, headers)
+            self.parsed += 1
+            on_record(record)
+
+    async def run(self, jobs: Iterable[Tuple[str, str]], on_record: Callable[[Dict[str, Any]], None]) -> None:
+        """
+        Fetch and parse every (site, url) pair, passing records to on_record as they are parsed
+
+        Args:
+            jobs: (site, url) pairs, consumed lazily
+            on_record: Called in the event loop thread with every parsed record
+        """
+        job_queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+        page_queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+
+        with ParsePool(self.parse_workers, self.use_processes) as pool:
+            fetchers = [asyncio.create_task(self._fetch_worker(job_queue, page_queue))
+                        for _ in range(self.fetch_concurrency)]
+            parsers = [asyncio.create_task(self._parse_worker(page_queue, pool, on_record))
+                       for _ in range(self.parse_workers)]
+            feeder = asyncio.create_task(self._feed_retries(job_queue))
+
+            for site, url in jobs:
+                await job_queue.put((site, url, 0))
+            # Every job and retry is done once the queue is drained with nothing scheduled
+            while True:
+                await job_queue.join()
+                if not self.retries.pending():
+                    break
+                await self.retries.wait()
+                await self._requeue_due(job_queue)
+            feeder.cancel()
+            for _ in fetchers:
+                await job_queue.put(None)
+            await asyncio.gather(*fetchers)
+
+            for _ in parsers:
+                await page_queue.put(None)
+            await asyncio.gather(*parsers)
+
+        logger.info(f"Detail pipeline finished: {self.fetched} fetched, {self.parsed} parsed, "
+                    f"{self.unchanged} unchanged, {self.expired} expired, {self.failed} failed.")
+
+
+class JsonlWriter:
+    """Append records to a JSON Lines file as they arrive"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "JsonlWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def interleave(sources: Dict[str, Iterable[str]]) -> Iterator[Tuple[str, str]]:
+    """Round-robin (site, url) pairs over several URL streams so every host stays busy"""
+    iterators: List[Tuple[str, Iterator[str]]] = [(site, iter(urls)) for site, urls in sources.items()]
+    while iterators:
+        remaining = []
+        for site, urls in iterators:
+            url = next(urls, None)
+            if url is not None:
+                remaining.append((site, urls))
+                yield site, url
+        iterators = remaining
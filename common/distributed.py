@@ -0,0 +1,210 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from common.common import RetryableError, ScrapingError, fetch_attempt, get_host, rate_limiter
+from common.details import parse_detail
+from common.frontier import Frontier
+from common.metrics import metrics
+from common.parsing import PARSER_BACKEND, parse_listing
+from common.registry import get_spec
+from common.sessions import SessionPool
+from common.sharding import find_last_page, make_probe
+from common.work_queue import WORK_QUEUE_PATH, SharedRateLimiter, Task, WorkQueue, worker_name
+
+# Configuration constants - can be overridden when importing
+LEASE_BATCH = 4
+QUEUE_POLL_INTERVAL = 1.0
+COLLECT_BATCH = 500
+SESSIONS_PER_WORKER = 1
+
+logger = logging.getLogger(__name__)
+
+
+def discover_listings(names: List[str], backend: str = PARSER_BACKEND,
+                      limiter: Any = rate_limiter) -> List[Tuple[str, str, str, str, int]]:
+    """
+    Page tasks covering every partition of the given sites' listings
+
+    The last page of each listing is found with the probes of sharded mode, all
+    listings at once.
+    """
+    listings = [(name, f"{name}@{partition}" if partition else name, url)
+                for name in names for partition, url in get_spec(name).partitions()]
+    scrapers = {name: SessionPool(get_spec(name).url) for name in names}
+
+    def discover(listing: Tuple[str, str, str]) -> List[Tuple[str, str, str, str, int]]:
+        name, key, url = listing
+        last = find_last_page(make_probe(name, url, scrapers[name], backend, limiter))
+        logger.info(f"[{key}] Last listing page is {last}")
+        return [("page", name, key, url, page) for page in range(1, last + 1)]
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(listings), 1)) as executor:
+            return [task for tasks in executor.map(discover, listings) for task in tasks]
+    finally:
+        for scraper in scrapers.values():
+            scraper.close()
+
+
+def detail_tasks(frontier: Frontier, names: List[str],
+                 limit: Optional[int] = None) -> List[Tuple[str, str, str, str, int]]:
+    """Detail tasks for the job URLs of the given sites in the frontier"""
+    tasks = []
+    for name in names:
+        for count, url in enumerate(frontier.urls(name)):
+            if limit is not None and count >= limit:
+                break
+            tasks.append(("detail", name, name, url, 0))
+    return tasks
+
+
+class QueueWorker:
+    """
+    Lease tasks from a WorkQueue and run them until the queue is drained
+
+    Listing pages are parsed into their job URLs and detail pages into detail records;
+    either goes back to the queue as the task's result. Every request draws from the
+    shared per-host budget of the queue's SharedRateLimiter. A failed attempt is put
+    back in the queue with its backoff delay instead of being waited for, so the
+    worker moves straight on to other tasks. A page that cannot be parsed fails its
+    task, and the worker carries on with the rest of its leased batch.
+
+    Args:
+        path: Work queue database
+        owner: Lease owner name, defaults to host:pid
+        backend: Parser backend for listing pages
+        follow: Keep polling for new tasks once the queue is drained
+    """
+
+    def __init__(self, path: str = WORK_QUEUE_PATH, owner: Optional[str] = None, backend: str = PARSER_BACKEND,
+                 follow: bool = False):
+        self.queue = WorkQueue(path)
+        self.limiter = SharedRateLimiter(path)
+        self.owner = owner or worker_name()
+        self.backend = backend
+        self.follow = follow
+        self.done = 0
+        self.failed = 0
+        self._scrapers: Dict[str, SessionPool] = {}
+
+    def _scraper(self, url: str) -> SessionPool:
+        host = get_host(url)
+        if host not in self._scrapers:
+            self._scrapers[host] = SessionPool(url, size=SESSIONS_PER_WORKER)
+        return self._scrapers[host]
+
+    def run_task(self, task: Task) -> None:
+        url = task.target
+        label = f"{task.key} page {task.page}" if task.kind == "page" else url
+        try:
+            response = fetch_attempt(self._scraper(url), url, label, task.attempts - 1, limiter=self.limiter)
+        except RetryableError as error:
+            if self.queue.retry(task, self.owner, str(error), error.delay):
+                metrics.count_retry(get_host(url))
+                logger.info(f"[{self.owner}] {task} will be retried in {error.delay:.1f} seconds")
+            else:
+                self.failed += 1
+            return
+        except ScrapingError as error:
+            if task.kind == "page" and error.status_code == 404:
+                # The listing shrank since it was probed
+                self.queue.complete(task, self.owner, [])
+                return
+            self.failed += 1
+            logger.warning(f"[{self.owner}] {task} failed: {error}")
+            self.queue.fail(task, self.owner, str(error))
+            return
+
+        try:
+            if task.kind == "page":
+                result: Any = list(parse_listing(task.site, response.text, self.backend))
+            else:
+                result = parse_detail(task.site, url, response.text)
+        except Exception as error:
+            # A page that does not parse fails the same way on every worker, so it is not retried
+            self.failed += 1
+            logger.error(f"[{self.owner}] Failed to parse {task}: {error}")
+            self.queue.fail(task, self.owner, f"parse error: {error}")
+            return
+        self.queue.complete(task, self.owner, result)
+        self.done += 1
+
+    def run(self) -> None:
+        try:
+            while True:
+                tasks = self.queue.lease(self.owner, LEASE_BATCH)
+                if not tasks:
+                    if not self.follow and self.queue.drained():
+                        break
+                    due = self.queue.next_due()
+                    time.sleep(QUEUE_POLL_INTERVAL if due is None else min(max(due, 0.05), QUEUE_POLL_INTERVAL))
+                    continue
+                for task in tasks:
+                    self.run_task(task)
+        finally:
+            for scraper in self._scrapers.values():
+                scraper.close()
+            self.queue.close()
+        logger.info(f"[{self.owner}] Worker finished: {self.done} tasks done, {self.failed} failed")
+
+
+def run_worker(path: str = WORK_QUEUE_PATH, backend: str = PARSER_BACKEND, follow: bool = False) -> None:
+    """Entry point of a worker process"""
+    QueueWorker(path, backend=backend, follow=follow).run()
+
+
+def collect(queue: WorkQueue, frontier: Frontier,
+            on_page: Optional[Callable[[str, int, List[str]], None]] = None,
+            on_record: Optional[Callable[[Dict[str, Any]], None]] = None) -> int:
+    """
+    Drain the finished results of the queue into the central frontier and sinks
+
+    Job URLs of listing pages go through the frontier, which deduplicates them across
+    pages, partitions and workers, and only new ones are passed to on_page. Detail
+    records are passed to on_record. Results are acknowledged after they are handled,
+    so a collector that dies in between hands them over again on its next run.
+
+    Returns:
+        Number of results collected
+    """
+    collected = 0
+    while True:
+        rows = queue.results(COLLECT_BATCH)
+        if not rows:
+            return collected
+        for _receipt, kind, site, key, page, result in rows:
+            if kind == "page":
+                metrics.count_page(site, len(result))
+                new_urls = frontier.add_many(site, result, page)
+                if new_urls and on_page is not None:
+                    on_page(site, page, new_urls)
+            elif on_record is not None:
+                on_record(result)
+        frontier.flush()
+        queue.acknowledge([row[0] for row in rows])
+        collected += len(rows)
+
+
+def run_local(path: str, workers: int, frontier: Frontier, backend: str = PARSER_BACKEND,
+              on_page: Optional[Callable[[str, int, List[str]], None]] = None,
+              on_record: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+    """
+    Run worker processes on this machine and collect their results until the queue is drained
+
+    Workers on other machines can join the same queue at any time with the worker command.
+    """
+    context = multiprocessing.get_context()
+    processes = [context.Process(target=run_worker, args=(path, backend), daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    with WorkQueue(path) as queue:
+        while any(process.is_alive() for process in processes):
+            if not collect(queue, frontier, on_page, on_record):
+                time.sleep(QUEUE_POLL_INTERVAL)
+        collect(queue, frontier, on_page, on_record)
+        logger.info(f"Queue after the run: {queue.counts()}")
+    for process in processes:
+        process.join()
@@ -0,0 +1,200 @@
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from common.seen_index import SEEN_INDEX_KIND, SeenIndex
+
+# Configuration constants - can be overridden when importing
+FRONTIER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl', 'frontier.db')
+FLUSH_BATCH_SIZE = 500
+
+# Canonical job ID per site, taken from the end of the job URL
+JOB_ID_PATTERNS = {
+    # .../viec-lam/<slug>/1874558.html and .../brand/<brand>/tuyen-dung/<slug>-j1874567.html
+    "topcv": re.compile(r"[/j](\d+)\.html$"),
+    # .../tim-viec-lam/<slug>/3269762
+    "careerlink": re.compile(r"/(\d+)$"),
+    # .../it-jobs/<slug>-3434, the numeric suffix alone is not unique so the whole slug is used
+    "itviec": re.compile(r"/it-jobs/([^/]+)$"),
+    # .../viec-lam/<slug>-zrMLJoYA9d
+    "123job": re.compile(r"-([A-Za-z0-9]{10})$"),
+    # .../viec-lam/<slug>-12345678.html
+    "jobsgo": re.compile(r"-(\d+)\.html$"),
+    # .../viec-lam/<slug>-2025831
+    "topdev": re.compile(r"-(\d+)$"),
+    # .../<slug>-1834567-jv
+    "vietnamworks": re.compile(r"-(\d+)-jv$"),
+    # .../opportunities/jobs/[<slug>/]<uuid>
+    "glints": re.compile(r"/opportunities/jobs/(?:[^/]+/)?([0-9a-f]{8}-[0-9a-f-]{27})$"),
+    # .../<slug>-c1p2id200290123.html and .../<slug>-id200290123.html
+    "vieclam24h": re.compile(r"id(\d+)\.html$"),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_job_id(site: str, url: str) -> str:
+    """
+    Extract the canonical job ID from a job URL
+
+    Args:
+        site: Site name as used in websites.py
+        url: Job URL without query string
+
+    Returns:
+        The site's job ID, or the URL itself when the site has no known pattern
+    """
+    pattern = JOB_ID_PATTERNS.get(site)
+    if pattern is not None:
+        match = pattern.search(url)
+        if match:
+            return match.group(1)
+    return url
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class Frontier:
+    """
+    Deduplicated store of job URLs backed by SQLite
+
+    Jobs are keyed on (site, canonical job ID). The keys of every site are kept in a
+    compact SeenIndex (exact 64-bit IDs, or Bloom filters with index_kind="bloom"), so
+    checking and inserting a job does not touch the database. New jobs and last-seen
+    updates are buffered and written in batches of batch_size rows.
+
+    The index is saved next to the database (<path>.seen/) on close and memory-mapped
+    on the next open; only jobs added since it was saved are read from the database.
+
+    Usage:
+        with Frontier() as frontier:
+            new_urls = frontier.add_many("topcv", job_urls, page)
+    """
+
+    def __init__(self, path: str = FRONTIER_PATH, batch_size: int = FLUSH_BATCH_SIZE,
+                 index_kind: str = SEEN_INDEX_KIND):
+        self.path = path
+        self.batch_size = batch_size
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                site TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                listing_page INTEGER,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                PRIMARY KEY (site, job_id)
+            );
+        """)
+        self._index = self._load_index(index_kind)
+        self._pending: List[Tuple[str, str, str, Optional[int], str, str]] = []
+
+    def _max_rowid(self) -> int:
+        return self._connection.execute("SELECT COALESCE(MAX(rowid), 0) FROM jobs").fetchone()[0]
+
+    def _load_index(self, kind: str) -> SeenIndex:
+        """Map the saved seen index and catch it up with the jobs added since, or rebuild it"""
+        directory = None if self.path == ':memory:' else self.path + '.seen'
+        index = SeenIndex(kind, directory)
+        saved_through = index.load()
+        if saved_through is None or saved_through > self._max_rowid():
+            index = SeenIndex(kind, directory)
+            saved_through = 0
+        read = 0
+        for site, job_id in self._connection.execute("SELECT site, job_id FROM jobs WHERE rowid > ?",
+                                                     (saved_through,)):
+            index.add(site, job_id)
+            read += 1
+        logger.debug(f"Seen index of {self.path}: {len(index)} jobs, {read} read from the database")
+        return index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def count(self, site: str) -> int:
+        return self._index.count(site)
+
+    def contains(self, site: str, url: str) -> bool:
+        return self._index.contains(site, canonical_job_id(site, url))
+
+    def add(self, site: str, url: str, page: Optional[int] = None) -> bool:
+        """
+        Record a job URL seen on a listing page
+
+        Returns:
+            True if the job was not in the frontier yet
+        """
+        job_id = canonical_job_id(site, url)
+        is_new = self._index.add(site, job_id)
+
+        now = _now()
+        self._pending.append((site, job_id, url, page, now, now))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return is_new
+
+    def add_many(self, site: str, urls: Iterable[str], page: Optional[int] = None) -> List[str]:
+        """Record several job URLs and return the ones that were new"""
+        return [url for url in urls if self.add(site, url, page)]
+
+    def flush(self) -> None:
+        """Write buffered jobs in a single transaction"""
+        if not self._pending:
+            return
+        with self._connection:
+            self._connection.executemany("""
+                INSERT INTO jobs (site, job_id, url, listing_page, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (site, job_id) DO UPDATE SET last_seen = excluded.last_seen
+            """, self._pending)
+        logger.debug(f"Flushed {len(self._pending)} jobs to {self.path}")
+        self._pending = []
+
+    def urls(self, site: str) -> Iterator[str]:
+        """Job URLs of a site in the order they were first seen"""
+        self.flush()
+        cursor = self._connection.execute("SELECT url FROM jobs WHERE site = ? ORDER BY rowid", (site,))
+        for (url,) in cursor:
+            yield url
+
+    def import_txt(self, site: str, path: str) -> int:
+        """Load a job_urls.txt file into the frontier and return the number of new jobs"""
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding='utf-8') as file:
+            added = len(self.add_many(site, (line.strip() for line in file if line.strip())))
+        self.flush()
+        logger.info(f"[{site}] Imported {added} jobs from {path}")
+        return added
+
+    def export_txt(self, site: str, path: str) -> int:
+        """Rewrite a job_urls.txt file with the deduplicated URLs of a site"""
+        count = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            for url in self.urls(site):
+                file.write(url + '\n')
+                count += 1
+        os.replace(tmp_path, path)
+        return count
+
+    def close(self) -> None:
+        self.flush()
+        self._index.save(self._max_rowid())
+        self._connection.close()
+
+    def __enter__(self) -> "Frontier":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
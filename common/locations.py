@@ -0,0 +1,41 @@
+import os
+import re
+import unicodedata
+from typing import List, Tuple
+
+# Configuration constants - can be overridden when importing
+PROVINCES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'provinces.txt')
+
+# provinces.txt comes from the table of provinces (tỉnh), which leaves out the five
+# centrally governed cities - the largest job markets
+CENTRAL_CITIES = ("Hà Nội", "Hồ Chí Minh", "Hải Phòng", "Đà Nẵng", "Cần Thơ")
+
+
+def slugify(name: str) -> str:
+    """
+    URL slug of a Vietnamese place name, e.g. "Bà Rịa – Vũng Tàu" -> "ba-ria-vung-tau"
+
+    Diacritics are stripped after NFD decomposition; đ has no decomposition and is
+    mapped to d by hand.
+    """
+    decomposed = unicodedata.normalize('NFD', name.replace('đ', 'd').replace('Đ', 'D'))
+    ascii_name = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return re.sub(r'[^a-z0-9]+', '-', ascii_name.lower()).strip('-')
+
+
+def load_locations(path: str = PROVINCES_PATH) -> List[str]:
+    """Province names from provinces.txt, plus the central cities, without duplicates"""
+    with open(path, encoding='utf-8') as file:
+        names = [line.strip() for line in file if line.strip()]
+    return list(dict.fromkeys(list(CENTRAL_CITIES) + names))
+
+
+def expand_locations(url: str, locations: List[str]) -> List[Tuple[str, str]]:
+    """
+    Fill the {location} placeholder of a listing URL template for every location
+
+    Returns:
+        (slug, URL template with only {page} left) pairs, one per location
+    """
+    slugs = dict.fromkeys(slugify(name) for name in locations)
+    return [(slug, url.replace('{location}', slug)) for slug in slugs]
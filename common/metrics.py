@@ -0,0 +1,316 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Configuration constants - can be overridden when importing
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONNECTIONS_PER_HOST = 32
+
+# Where crawl time goes: waiting on rate limits and retry deadlines, requests, extraction
+PHASES = ("sleep", "fetch", "parse")
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, count) pairs, the last one being +Inf"""
+        total, pairs = 0, []
+        for bound, count in zip([str(bound) for bound in self.buckets] + ["+Inf"], self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for index, (_bound, total) in enumerate(self.cumulative()):
+            if total >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return None
+
+
+class ConnectionStats:
+    """Traffic of one keep-alive connection"""
+
+    def __init__(self, protocol: str):
+        self.protocol = protocol
+        self.requests = 0
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self.first_byte_seconds = 0.0
+        self.seconds = 0.0
+        self.last_used = time.monotonic()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"protocol": self.protocol, "requests": self.requests, "wire_bytes": self.wire_bytes,
+                "body_bytes": self.body_bytes,
+                "mean_first_byte": round(self.first_byte_seconds / self.requests, 3) if self.requests else None,
+                "mean_seconds": round(self.seconds / self.requests, 3) if self.requests else None}
+
+
+class CrawlMetrics:
+    """
+    Counters and histograms of a crawl run, safe to update from any thread
+
+    Updated by fetch_attempt (request latency, status, bytes, retries, Cloudflare
+    errors), the transport (traffic per connection), the rate limiter and retry
+    scheduler (time spent sleeping), session pools (challenge pages) and the engines
+    (parse time, pages and job URLs). Read it as a
+    JSON-friendly snapshot(), in the Prometheus text format with prometheus(), or as the
+    end-of-run summary().
+
+    Only the CONNECTIONS_PER_HOST most recently used connections of each host are kept,
+    as connections that were closed come back under new labels.
+
+    Metrics of sharded worker processes stay in those processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.latency: Dict[str, Histogram] = {}
+            self.requests: Dict[Tuple[str, str], int] = {}
+            self.bytes: Dict[str, int] = {}
+            self.retries: Dict[str, int] = {}
+            self.challenges: Dict[str, int] = {}
+            self.phase_seconds: Dict[str, float] = {phase: 0.0 for phase in PHASES}
+            self.pages: Dict[str, int] = {}
+            self.job_urls: Dict[str, int] = {}
+            self.connections: Dict[str, Dict[str, ConnectionStats]] = {}
+
+    def observe_request(self, host: str, seconds: float, status: Any, size: int = 0) -> None:
+        """Record one HTTP request; status is the code, or the exception name when there was no response"""
+        with self._lock:
+            self.latency.setdefault(host, Histogram()).observe(seconds)
+            key = (host, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes[host] = self.bytes.get(host, 0) + size
+            self.phase_seconds["fetch"] += seconds
+
+    def observe_connection(self, host: str, connection: str, protocol: str, wire_bytes: int, body_bytes: int,
+                           first_byte: float, seconds: float) -> None:
+        """Record one response read from a connection; wire_bytes are before decompression"""
+        with self._lock:
+            connections = self.connections.setdefault(host, {})
+            stats = connections.get(connection)
+            if stats is None:
+                if len(connections) >= CONNECTIONS_PER_HOST:
+                    del connections[min(connections, key=lambda label: connections[label].last_used)]
+                stats = connections[connection] = ConnectionStats(protocol)
+            stats.requests += 1
+            stats.wire_bytes += wire_bytes
+            stats.body_bytes += body_bytes
+            stats.first_byte_seconds += first_byte
+            stats.seconds += seconds
+            stats.last_used = time.monotonic()
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phase_seconds[phase] += seconds
+
+    @contextmanager
+    def timed(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def count_retry(self, host: str) -> None:
+        with self._lock:
+            self.retries[host] = self.retries.get(host, 0) + 1
+
+    def count_challenge(self, host: str) -> None:
+        with self._lock:
+            self.challenges[host] = self.challenges.get(host, 0) + 1
+
+    def count_page(self, site: str, job_urls: int) -> None:
+        with self._lock:
+            self.pages[site] = self.pages.get(site, 0) + 1
+            self.job_urls[site] = self.job_urls.get(site, 0) + job_urls
+
+    def urls_per_second(self) -> float:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return sum(self.job_urls.values()) / elapsed
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            hosts = sorted(set(self.latency) | set(self.retries) | set(self.challenges))
+            return {
+                "elapsed_seconds": round(time.time() - self.started_at, 3),
+                "phase_seconds": {phase: round(seconds, 3) for phase, seconds in self.phase_seconds.items()},
+                "job_urls_per_second": round(self.urls_per_second(), 3),
+                "sites": {site: {"pages": self.pages[site], "job_urls": self.job_urls.get(site, 0)}
+                          for site in sorted(self.pages)},
+                "hosts": {host: {
+                    "requests": {status: count for (name, status), count in sorted(self.requests.items())
+                                 if name == host},
+                    "bytes": self.bytes.get(host, 0),
+                    "retries": self.retries.get(host, 0),
+                    "cloudflare_challenges": self.challenges.get(host, 0),
+                    "latency": self._latency_summary(self.latency.get(host)),
+                    "connections": {label: stats.as_dict()
+                                    for label, stats in sorted(self.connections.get(host, {}).items())},
+                } for host in hosts},
+            }
+
+    @staticmethod
+    def _latency_summary(histogram: Optional[Histogram]) -> Dict[str, Any]:
+        if histogram is None or not histogram.count:
+            return {"count": 0}
+        return {"count": histogram.count, "mean": round(histogram.sum / histogram.count, 3),
+                "p50": histogram.quantile(0.5), "p95": histogram.quantile(0.95),
+                "buckets": dict(histogram.cumulative())}
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, Any]]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+        with self._lock:
+            lines.append("# HELP crawl_request_duration_seconds Request latency per host")
+            lines.append("# TYPE crawl_request_duration_seconds histogram")
+            for host, histogram in sorted(self.latency.items()):
+                for bound, total in histogram.cumulative():
+                    lines.append(f'crawl_request_duration_seconds_bucket{{host="{host}",le="{bound}"}} {total}')
+                lines.append(f'crawl_request_duration_seconds_sum{{host="{host}"}} {histogram.sum:.6f}')
+                lines.append(f'crawl_request_duration_seconds_count{{host="{host}"}} {histogram.count}')
+            metric("crawl_requests_total", "counter", "Requests per host and status",
+                   [(f'host="{host}",status="{status}"', count) for (host, status), count in sorted(self.requests.items())])
+            metric("crawl_response_bytes_total", "counter", "Response bytes per host",
+                   [(f'host="{host}"', size) for host, size in sorted(self.bytes.items())])
+            metric("crawl_retries_total", "counter", "Retries scheduled per host",
+                   [(f'host="{host}"', count) for host, count in sorted(self.retries.items())])
+            metric("crawl_cloudflare_challenges_total", "counter", "Cloudflare challenges per host",
+                   [(f'host="{host}"', count) for host, count in sorted(self.challenges.items())])
+            connections = [(f'host="{host}",connection="{label}",protocol="{stats.protocol}"', stats)
+                           for host, by_label in sorted(self.connections.items())
+                           for label, stats in sorted(by_label.items())]
+            metric("crawl_connection_requests_total", "counter", "Responses read per keep-alive connection",
+                   [(labels, stats.requests) for labels, stats in connections])
+            metric("crawl_connection_wire_bytes_total", "counter",
+                   "Bytes received per connection, before decompression",
+                   [(labels, stats.wire_bytes) for labels, stats in connections])
+            metric("crawl_connection_body_bytes_total", "counter",
+                   "Bytes received per connection, after decompression",
+                   [(labels, stats.body_bytes) for labels, stats in connections])
+            metric("crawl_connection_first_byte_seconds_total", "counter",
+                   "Time from sending requests to their response headers per connection",
+                   [(labels, f"{stats.first_byte_seconds:.6f}") for labels, stats in connections])
+            metric("crawl_connection_seconds_total", "counter",
+                   "Time from sending requests to their last byte per connection",
+                   [(labels, f"{stats.seconds:.6f}") for labels, stats in connections])
+            metric("crawl_phase_seconds_total", "counter", "Time spent sleeping, fetching and parsing",
+                   [(f'phase="{phase}"', f"{seconds:.6f}") for phase, seconds in self.phase_seconds.items()])
+            metric("crawl_pages_total", "counter", "Listing pages crawled per site",
+                   [(f'site="{site}"', count) for site, count in sorted(self.pages.items())])
+            metric("crawl_job_urls_total", "counter", "Job URLs found per site",
+                   [(f'site="{site}"', count) for site, count in sorted(self.job_urls.items())])
+            metric("crawl_job_urls_per_second", "gauge", "Job URLs found per second since the start of the run",
+                   [("", f"{self.urls_per_second():.3f}")])
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    def summary(self) -> None:
+        """Log where the time of the run went, per phase and per host"""
+        snapshot = self.snapshot()
+        phases = ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in snapshot["phase_seconds"].items())
+        logger.info(f"Run took {snapshot['elapsed_seconds']:.1f}s ({phases}), "
+                    f"{snapshot['job_urls_per_second']:.2f} job URLs/s")
+        for host, stats in snapshot["hosts"].items():
+            latency = stats["latency"]
+            requests = sum(stats["requests"].values())
+            logger.info(f"[{host}] {requests} requests {stats['requests']}, {stats['bytes'] / 1e6:.1f} MB, "
+                        f"mean {latency.get('mean', 0)}s p95 <= {latency.get('p95')}s, "
+                        f"{stats['retries']} retries, {stats['cloudflare_challenges']} Cloudflare challenges")
+            connections = stats["connections"].values()
+            if connections:
+                reads = sum(connection["requests"] for connection in connections)
+                wire = sum(connection["wire_bytes"] for connection in connections)
+                body = sum(connection["body_bytes"] for connection in connections)
+                protocols = sorted({connection["protocol"] for connection in connections})
+                logger.info(f"[{host}] {len(connections)} connections ({', '.join(protocols)}), "
+                            f"{reads / len(connections):.1f} responses each, "
+                            f"{wire / 1e6:.1f} MB on the wire for {body / 1e6:.1f} MB of content")
+
+
+metrics = CrawlMetrics()
+
+
+class MetricsServer:
+    """
+    Serve the metrics over HTTP while a crawl runs
+
+    GET /metrics returns the Prometheus text format, GET /metrics.json the snapshot.
+    """
+
+    def __init__(self, port: int, host: str = "127.0.0.1", registry: CrawlMetrics = metrics):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body, content_type = json.dumps(registry_ref.snapshot()).encode(), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, content_type = registry_ref.prometheus().encode(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        logger.info(f"Serving metrics at {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
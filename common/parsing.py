@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import importlib.util
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, List, Optional
+
+from common.registry import EmbeddedJsonSpec, ListingPage, get_spec
+from common.startup import configure_logging
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup, SoupStrainer
+
+# The parser packages are only looked up here. bs4, lxml and selectolax are imported when
+# the first page is parsed with them, so commands start without loading them.
+HAS_LXML = importlib.util.find_spec("lxml") is not None
+HAS_SELECTOLAX = importlib.util.find_spec("selectolax.lexbor") is not None
+
+# Configuration constants - can be overridden when importing
+PARSER_BACKEND = "lxml" if HAS_LXML else "html.parser"
+PARSE_WORKERS = 4
+
+# Backends: BeautifulSoup tree builders, plus selectolax
+BACKENDS = ("html.parser", "lxml", "selectolax")
+
+logger = logging.getLogger(__name__)
+
+
+def make_soup(html: str, backend: str = PARSER_BACKEND,
+              parse_only: Optional["SoupStrainer"] = None) -> "BeautifulSoup":
+    """
+    Build a BeautifulSoup tree with the given tree builder
+
+    Args:
+        html: Page HTML
+        backend: "html.parser" or "lxml"
+        parse_only: Optional strainer, only matching elements (and their children) are kept
+    """
+    if backend == "lxml" and not HAS_LXML:
+        raise ValueError("The lxml backend needs the lxml package")
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(html, backend, parse_only=parse_only)
+
+
+def parse_listing(site: str, html: str, backend: str = PARSER_BACKEND) -> ListingPage:
+    """
+    Extract the job URLs of a listing page with the site's spec from common.registry
+
+    BeautifulSoup backends use the strainer derived from the spec when there is one,
+    so only the job cards are turned into a tree. The selectolax backend runs the same
+    selectors on a lexbor tree. Sites that ship their jobs as JSON are read from it
+    whatever the backend, without building any tree.
+    """
+    spec = get_spec(site)
+    if isinstance(spec, EmbeddedJsonSpec):
+        return spec.extract_json(html)
+    if backend == "selectolax":
+        if not HAS_SELECTOLAX:
+            raise ValueError("The selectolax backend needs the selectolax package")
+        from selectolax.lexbor import LexborHTMLParser
+
+        return spec.extract_selectolax(LexborHTMLParser(html))
+    return spec.extract_soup(make_soup(html, backend, spec.strainer))
+
+
+class ListingStream:
+    """
+    Text of a listing page fed in as it downloads, parsed as soon as its jobs are complete
+
+    Pages that embed their jobs in a script (EmbeddedJsonSpec with a script_id) are
+    parsed once that script has arrived, on the downloading thread, while the rest of
+    the page is still coming in. result stays None until then, and for a page that
+    turns out not to hold the payload, which is parsed as a whole as usual.
+
+    Usage:
+        stream = stream_listing(site)
+        response = fetch_attempt(scraper, url, on_text=stream.feed if stream else None)
+    """
+
+    def __init__(self, spec: EmbeddedJsonSpec):
+        self.spec = spec
+        self.result: Optional[ListingPage] = None
+        self._parts: List[str] = []
+        self._tail = ""
+
+    def feed(self, text: str) -> None:
+        if self.result is not None:
+            return
+        self._parts.append(text)
+        # The payload can only be complete once a closing script tag came in
+        window, self._tail = self._tail + text, text[-8:]
+        if "</script" not in window.lower():
+            return
+        html = "".join(self._parts)
+        self._parts = [html]
+        payload = self.spec.payload(html)
+        if payload is not None:
+            self.result = self.spec.extract_payload(payload)
+            self._parts = []
+
+
+def stream_listing(site: str) -> Optional[ListingStream]:
+    """A ListingStream for a site whose pages can be parsed before they are complete, else None"""
+    spec = get_spec(site)
+    if isinstance(spec, EmbeddedJsonSpec) and spec.script_id is not None:
+        return ListingStream(spec)
+    return None
+
+
+class ListingParser:
+    """
+    Picklable HTML -> job URLs callable for one site
+
+    Only the site name and backend travel to pool workers; each worker process
+    looks the site's spec up itself.
+    """
+
+    def __init__(self, site: str, backend: str = PARSER_BACKEND):
+        self.site = site
+        self.backend = backend
+
+    def __call__(self, html: str) -> List[str]:
+        return parse_listing(self.site, html, self.backend)
+
+
+class ParsePool:
+    """Run parsing off the event loop, on threads or on a process pool to use every core"""
+
+    def __init__(self, workers: int = PARSE_WORKERS, use_processes: bool = False):
+        self.workers = workers
+        self.use_processes = use_processes
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> "ParsePool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
+
+
+def check_backends(site: str, paths: List[str], backends=BACKENDS) -> bool:
+    """
+    Compare every backend against the reference extraction (html.parser, full tree, no strainer)
+    on saved listing pages and log timings
+
+    Returns:
+        True when every backend returned exactly the reference URLs for every page
+    """
+    spec = get_spec(site)
+    missing = {"lxml": not HAS_LXML, "selectolax": not HAS_SELECTOLAX}
+    available = [backend for backend in backends if not missing.get(backend)]
+    timings = {backend: 0.0 for backend in ["reference"] + available}
+    matches = True
+
+    for path in paths:
+        with open(path, encoding='utf-8') as file:
+            html = file.read()
+
+        start = time.perf_counter()
+        expected = spec.extract_soup(make_soup(html, "html.parser"))
+        timings["reference"] += time.perf_counter() - start
+
+        for backend in available:
+            start = time.perf_counter()
+            result = parse_listing(site, html, backend)
+            timings[backend] += time.perf_counter() - start
+            if result != expected:
+                matches = False
+                logger.error(f"[{site}] {backend} differs on {path}: {len(result)} URLs, expected {len(expected)}")
+
+    for backend, elapsed in timings.items():
+        logger.info(f"[{site}] {backend}: {elapsed * 1000 / max(len(paths), 1):.2f} ms/page")
+    return matches
+
+
+if __name__ == '__main__':
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Check that every parser backend matches the reference extractor")
+    parser.add_argument('site')
+    parser.add_argument('pages', nargs='+', help="saved listing pages")
+    args = parser.parse_args()
+    raise SystemExit(0 if check_backends(args.site, args.pages) else 1)
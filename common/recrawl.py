@@ -0,0 +1,228 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Mapping, Optional
+
+from common.frontier import canonical_job_id
+
+# Configuration constants - can be overridden when importing
+RECRAWL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl', 'recrawl.db')
+INITIAL_INTERVAL = 24 * 60 * 60
+MIN_INTERVAL = 6 * 60 * 60
+MAX_INTERVAL = 30 * 24 * 60 * 60
+CHANGED_FACTOR = 0.5
+UNCHANGED_FACTOR = 1.5
+
+# Statuses meaning the posting was taken down
+EXPIRED_STATUS_CODES = (404, 410)
+
+# Parts of a page that change on every request without the posting changing: scripts
+# other than JSON-LD (tokens, tracking), styles, comments and hidden form inputs
+VOLATILE_MARKUP = re.compile(
+    r"<script(?![^>]*ld\+json)[^>]*>.*?</script>|<style[^>]*>.*?</style>|<!--.*?-->|<input[^>]*hidden[^>]*>",
+    re.IGNORECASE | re.DOTALL)
+WHITESPACE = re.compile(r"\s+")
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(html: str) -> str:
+    """
+    Hash of a detail page that ignores markup changing on every request
+
+    Volatile markup is stripped and whitespace collapsed with regular expressions,
+    which is much cheaper than parsing the page, so unchanged pages can be recognised
+    before they are handed to an extractor.
+    """
+    text = WHITESPACE.sub(" ", VOLATILE_MARKUP.sub("", html))
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _at(moment: datetime) -> str:
+    return moment.isoformat(timespec='seconds')
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class RecrawlStore:
+    """
+    Content hashes and re-crawl schedule of fetched job detail pages, backed by SQLite
+
+    Every page is keyed on (site, canonical job ID) and keeps the hash of its content,
+    its ETag and Last-Modified validators and the time of its next check. The interval
+    between checks adapts to how often the posting changes: it is multiplied by
+    CHANGED_FACTOR when a check finds new content and by UNCHANGED_FACTOR when it does
+    not, within MIN_INTERVAL and MAX_INTERVAL. Pages answering 404 or 410 are marked
+    expired and never checked again.
+
+    Usage:
+        with RecrawlStore() as store:
+            for url in store.due("topcv"):
+                ...
+    """
+
+    def __init__(self, path: str = RECRAWL_PATH, initial_interval: float = INITIAL_INTERVAL,
+                 min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL):
+        self.path = path
+        self.initial_interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.changed = 0
+        self.unchanged = 0
+        self.expired = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS pages (
+                site TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                content_hash TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                first_fetched TEXT NOT NULL,
+                last_checked TEXT NOT NULL,
+                last_changed TEXT NOT NULL,
+                next_check TEXT NOT NULL,
+                interval REAL NOT NULL,
+                checks INTEGER NOT NULL DEFAULT 1,
+                changes INTEGER NOT NULL DEFAULT 0,
+                expired_at TEXT,
+                PRIMARY KEY (site, job_id)
+            );
+            CREATE INDEX IF NOT EXISTS pages_due ON pages (site, next_check) WHERE expired_at IS NULL;
+        """)
+
+    def _row(self, site: str, url: str) -> Optional[tuple]:
+        return self._connection.execute(
+            "SELECT content_hash, etag, last_modified, interval FROM pages WHERE site = ? AND job_id = ?",
+            (site, canonical_job_id(site, url))).fetchone()
+
+    def knows(self, site: str, url: str) -> bool:
+        """Whether the page of a job was fetched before"""
+        return self._row(site, url) is not None
+
+    def stored_hash(self, site: str, url: str) -> Optional[str]:
+        row = self._row(site, url)
+        return row[0] if row is not None else None
+
+    def conditional_headers(self, site: str, url: str) -> Dict[str, str]:
+        """If-None-Match/If-Modified-Since headers from the validators of the last fetch"""
+        headers = {}
+        row = self._row(site, url)
+        if row is not None:
+            if row[1]:
+                headers["If-None-Match"] = row[1]
+            if row[2]:
+                headers["If-Modified-Since"] = row[2]
+        return headers
+
+    def _reschedule(self, site: str, url: str, changed: bool, assignments: str = "",
+                    parameters: tuple = ()) -> None:
+        row = self._row(site, url)
+        interval = row[3] * (CHANGED_FACTOR if changed else UNCHANGED_FACTOR)
+        interval = min(self.max_interval, max(self.min_interval, interval))
+        now = _now()
+        with self._connection:
+            self._connection.execute(f"""
+                UPDATE pages SET last_checked = ?, next_check = ?, interval = ?, checks = checks + 1,
+                    changes = changes + ?{assignments}
+                WHERE site = ? AND job_id = ?
+            """, (_at(now), _at(now + timedelta(seconds=interval)), interval, int(changed)) + parameters
+                 + (site, canonical_job_id(site, url)))
+
+    def record_content(self, site: str, url: str, digest: str, headers: Mapping[str, str]) -> bool:
+        """
+        Record the content hash and validators of a fetched page
+
+        Returns:
+            True when the page is new or its content changed since the last fetch
+        """
+        row = self._row(site, url)
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        if row is None:
+            now = _now()
+            with self._connection:
+                self._connection.execute("""
+                    INSERT INTO pages (site, job_id, url, content_hash, etag, last_modified, first_fetched,
+                                       last_checked, last_changed, next_check, interval)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (site, canonical_job_id(site, url), url, digest, etag, last_modified, _at(now), _at(now),
+                      _at(now), _at(now + timedelta(seconds=self.initial_interval)), self.initial_interval))
+            return True
+        changed = row[0] != digest
+        if changed:
+            self.changed += 1
+            self._reschedule(site, url, True, ", content_hash = ?, etag = ?, last_modified = ?, last_changed = ?",
+                             (digest, etag, last_modified, _at(_now())))
+        else:
+            self.unchanged += 1
+            self._reschedule(site, url, False, ", etag = ?, last_modified = ?", (etag, last_modified))
+        return changed
+
+    def record_unchanged(self, site: str, url: str) -> None:
+        """Record a check that found the page unchanged: a 304 answer or the same content hash"""
+        if self._row(site, url) is not None:
+            self.unchanged += 1
+            self._reschedule(site, url, False)
+
+    def record_expired(self, site: str, url: str, status_code: Optional[int] = None) -> bool:
+        """
+        Mark the page of a job that was taken down
+
+        A job that was never fetched before gets an expired row of its own, so it is
+        known and not requested again on the next run.
+
+        Returns:
+            True when the page was not marked expired yet
+        """
+        now = _now()
+        with self._connection:
+            cursor = self._connection.execute("""
+                INSERT INTO pages (site, job_id, url, first_fetched, last_checked, last_changed, next_check,
+                                   interval, expired_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (site, job_id) DO UPDATE SET expired_at = excluded.expired_at,
+                    last_checked = excluded.last_checked, checks = checks + 1
+                WHERE expired_at IS NULL
+            """, (site, canonical_job_id(site, url), url, _at(now), _at(now), _at(now), _at(now),
+                  self.initial_interval, _at(now)))
+        if not cursor.rowcount:
+            return False
+        self.expired += 1
+        logger.info(f"[{site}] {url} answered {status_code}, marked expired")
+        return True
+
+    def due(self, site: str, limit: Optional[int] = None) -> List[str]:
+        """URLs of a site's live pages whose next check is due, most overdue first"""
+        rows = self._connection.execute(
+            "SELECT url FROM pages WHERE site = ? AND expired_at IS NULL AND next_check <= ? "
+            "ORDER BY next_check LIMIT ?", (site, _at(_now()), -1 if limit is None else limit)).fetchall()
+        return [url for (url,) in rows]
+
+    def counts(self, site: str) -> Dict[str, int]:
+        """Number of live, due and expired pages of a site"""
+        live, due, expired = self._connection.execute("""
+            SELECT COALESCE(SUM(expired_at IS NULL), 0), COALESCE(SUM(expired_at IS NULL AND next_check <= ?), 0),
+                   COALESCE(SUM(expired_at IS NOT NULL), 0)
+            FROM pages WHERE site = ?
+        """, (_at(_now()), site)).fetchone()
+        return {"live": live, "due": due, "expired": expired}
+
+    def close(self) -> None:
+        self._connection.close()
+        logger.info(f"Re-crawl: {self.changed} pages changed, {self.unchanged} unchanged, {self.expired} expired")
+
+    def __enter__(self) -> "RecrawlStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,332 @@
+import json
+import re
+import string
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from common.locations import expand_locations, load_locations
+from websites import websites
+
+if TYPE_CHECKING:
+    from bs4 import SoupStrainer
+
+# Selectors a SoupStrainer can be derived from: tag.class.class and tag[class="exact value"]
+CLASS_SELECTOR = re.compile(r"^([a-zA-Z][\w-]*)((?:\.[\w-]+)*)$")
+EXACT_CLASS_SELECTOR = re.compile(r'^([a-zA-Z][\w-]*)\[class="([^"]+)"\]$')
+
+JSON_DECODER = json.JSONDecoder()
+WHITESPACE = re.compile(r"\s*")
+
+
+def class_token(name: str) -> "re.Pattern[str]":
+    """
+    Match a single CSS class in a SoupStrainer
+
+    Strainers see the raw class attribute before it is split into a list, so
+    class_="title" would miss class="title big" while find_all(class_="title") matches it.
+    """
+    return re.compile(rf"(^|\s){re.escape(name)}(\s|$)")
+
+
+class ListingPage(list):
+    """
+    Job URLs of a listing page, with is_last set when the page says it is the last one
+
+    Sites read from embedded JSON also fill fields with the listing fields of each job
+    URL (title, company, ...), taken from the same payload.
+    """
+
+    def __init__(self, urls: List[str] = (), is_last: bool = False,
+                 fields: Optional[Dict[str, Dict[str, Optional[str]]]] = None):
+        super().__init__(urls)
+        self.is_last = is_last
+        self.fields = fields or {}
+
+    def only(self, urls: List[str]) -> "ListingPage":
+        """The same page narrowed down to some of its URLs, such as the new ones"""
+        return ListingPage(urls, self.is_last, {url: self.fields[url] for url in urls if url in self.fields})
+
+
+class PayloadFormatter(string.Formatter):
+    """
+    str.format over a JSON object
+
+    Fields are reached the usual way, "{company[name]}" or "{locations[0][city]}". A
+    field that is missing or null makes the whole template fail with KeyError, and a
+    list of plain values is joined with ", ".
+    """
+
+    def get_field(self, field_name: str, args: Any, kwargs: Any) -> Any:
+        value, first = super().get_field(field_name, args, kwargs)
+        if value is None or value == "":
+            raise KeyError(field_name)
+        return value, first
+
+    def format_field(self, value: Any, format_spec: str) -> str:
+        if isinstance(value, list):
+            value = ", ".join(str(item) for item in value if isinstance(item, (str, int, float)))
+        return super().format_field(value, format_spec)
+
+
+_payload_formatter = PayloadFormatter()
+
+
+def fill_template(template: str, item: Dict[str, Any]) -> Optional[str]:
+    """Format template with the fields of a JSON object, or None when one of them is missing"""
+    try:
+        return _payload_formatter.vformat(template, (), item) or None
+    except (KeyError, IndexError, TypeError, AttributeError, ValueError):
+        return None
+
+
+def find_script_json(html: str, script_id: str) -> Any:
+    """
+    Decode the JSON in the <script> with the given id, without building a DOM
+
+    The tag is found with a regular expression and the payload decoded straight out of
+    the page string, so no copy of it is made. Returns None when there is no such
+    script or it does not hold valid JSON.
+    """
+    match = re.search(rf"<script[^>]*\bid=[\"']?{re.escape(script_id)}[\"']?[^>]*>", html)
+    if match is None:
+        return None
+    try:
+        return JSON_DECODER.raw_decode(html, WHITESPACE.match(html, match.end()).end())[0]
+    except ValueError:
+        return None
+
+
+def iter_job_objects(payload: Any, keys: Tuple[str, ...]) -> Iterator[Dict[str, Any]]:
+    """
+    Every object of a JSON payload that has all of keys, in document order
+
+    The objects are found wherever they are nested, in lists or in the id-keyed caches
+    of Apollo and Redux states, so the spec does not depend on the payload's layout.
+    A matching object is not searched any further.
+    """
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if all(key in node for key in keys):
+                yield node
+                continue
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+
+
+class SiteSpec:
+    """
+    Declarative description of a site's listing pages
+
+    Every element matching card is a job; the URL is read from the attribute of the
+    card's first element matching link (or of the card itself), stripped of its query
+    and fragment and joined onto base_url. When url_pattern is set, URLs that do not
+    match it (category or ad links caught by a loose selector) are skipped. The same CSS selectors drive every parser
+    backend, and a SoupStrainer keeping only the cards is derived from card when it is
+    a plain tag.class or tag[class="..."] selector.
+
+    A listing ends at the first page without jobs or with a 404. When next_link is
+    set, a page that has no element matching it is also taken as the last one.
+
+    A URL template with a {location} placeholder is crawled as one partition per
+    province, see partitions().
+
+    Args:
+        name: Site name, the key in websites.py
+        card: CSS selector of a job card
+        link: CSS selector, inside the card, of the element carrying the URL
+        attribute: Attribute holding the job URL
+        base_url: Base for relative URLs, defaults to the site's origin
+        url: Listing URL template with {page}, defaults to websites[name]
+        next_link: CSS selector of the link to the next listing page
+        url_pattern: Regular expression job URLs must contain
+    """
+
+    def __init__(self, name: str, card: str, link: Optional[str] = None, attribute: str = "href",
+                 base_url: Optional[str] = None, url: Optional[str] = None, next_link: Optional[str] = None,
+                 url_pattern: Optional[str] = None):
+        self.name = name
+        self.card = card
+        self.link = link
+        self.attribute = attribute
+        self.url = url or websites[name]
+        parts = urlsplit(self.url)
+        self.base_url = base_url or f"{parts.scheme}://{parts.netloc}/"
+        self.next_link = next_link
+        self.url_pattern = re.compile(url_pattern) if url_pattern else None
+
+    def partitions(self) -> List[Tuple[Optional[str], str]]:
+        """
+        The listings to crawl as (partition, URL template) pairs
+
+        A template with {location} is expanded over every province into slug-named
+        partitions; any other template is a single listing with no partition name.
+        """
+        if '{location}' not in self.url:
+            return [(None, self.url)]
+        return expand_locations(self.url, load_locations())
+
+    @property
+    def strainer(self) -> Optional["SoupStrainer"]:
+        """Keep only the job cards (and the next-page link) when building a BeautifulSoup tree"""
+        # Imported here so listing the registered sites does not load bs4
+        from bs4 import SoupStrainer
+
+        if self.next_link is not None:
+            return None
+        match = EXACT_CLASS_SELECTOR.match(self.card)
+        if match is not None:
+            return SoupStrainer(match.group(1), {"class": match.group(2)})
+        match = CLASS_SELECTOR.match(self.card)
+        if match is None:
+            return None
+        tag, classes = match.groups()
+        if not classes:
+            return SoupStrainer(tag)
+        return SoupStrainer(tag, class_=class_token(classes.split('.')[1]))
+
+    def normalise(self, url: Optional[str]) -> Optional[str]:
+        if not url:
+            return None
+        cleaned_url = url.split('#')[0].split('?')[0].strip()
+        if not cleaned_url:
+            return None
+        cleaned_url = urljoin(self.base_url, cleaned_url)
+        if self.url_pattern is not None and not self.url_pattern.search(cleaned_url):
+            return None
+        return cleaned_url
+
+    def extract_soup(self, soup: Any) -> ListingPage:
+        """Job URLs of a BeautifulSoup listing page"""
+        job_urls = []
+        for card in soup.select(self.card):
+            node = card.select_one(self.link) if self.link else card
+            url = self.normalise(node.get(self.attribute)) if node is not None else None
+            if url:
+                job_urls.append(url)
+        is_last = self.next_link is not None and soup.select_one(self.next_link) is None
+        return ListingPage(job_urls, is_last)
+
+    def extract_selectolax(self, tree: Any) -> ListingPage:
+        """Job URLs of a selectolax listing page, node for node like extract_soup"""
+        job_urls = []
+        for card in tree.css(self.card):
+            node = card.css_first(self.link) if self.link else card
+            url = self.normalise(node.attributes.get(self.attribute)) if node is not None else None
+            if url:
+                job_urls.append(url)
+        is_last = self.next_link is not None and tree.css_first(self.next_link) is None
+        return ListingPage(job_urls, is_last)
+
+
+class EmbeddedJsonSpec(SiteSpec):
+    """
+    A site whose listing ships its jobs as JSON, read without rendering or parsing the HTML
+
+    Listing pages of JS front-ends embed the data they render, such as Next.js's
+    __NEXT_DATA__ script, which is found with find_script_json. With script_id=None the
+    listing URL is a JSON API instead, usually with a far larger page size than the
+    HTML listing.
+
+    Jobs are the objects of the payload that have all of keys (see iter_job_objects).
+    The job URL is job_url filled in with an object's fields (see fill_template) and then
+    normalised like an HTML link. Each entry of fields is a template read the same way,
+    and the results go to the ListingPage's fields. A page with fewer than page_size jobs
+    is the last one.
+
+    Args:
+        name: Site name, the key in websites.py
+        keys: Keys every job object has
+        job_url: Template of the job URL, relative to base_url or absolute
+        fields: Listing field name to template
+        script_id: Id of the script holding the payload, None when the whole response is JSON
+        page_size: Jobs on a full listing page
+        url: Listing URL template with {page}, defaults to websites[name]
+        base_url: Base for relative URLs, defaults to the site's origin
+        url_pattern: Regular expression job URLs must contain
+    """
+
+    def __init__(self, name: str, keys: Tuple[str, ...], job_url: str, fields: Optional[Dict[str, str]] = None,
+                 script_id: Optional[str] = "__NEXT_DATA__", page_size: Optional[int] = None,
+                 url: Optional[str] = None, base_url: Optional[str] = None, url_pattern: Optional[str] = None):
+        super().__init__(name, card="script", base_url=base_url, url=url, url_pattern=url_pattern)
+        self.keys = keys
+        self.job_url = job_url
+        self.fields = fields or {}
+        self.script_id = script_id
+        self.page_size = page_size
+
+    @property
+    def strainer(self) -> None:
+        return None
+
+    def payload(self, text: str) -> Any:
+        if self.script_id is not None:
+            return find_script_json(text, self.script_id)
+        try:
+            return JSON_DECODER.raw_decode(text, WHITESPACE.match(text).end())[0]
+        except ValueError:
+            return None
+
+    def extract_json(self, text: str) -> ListingPage:
+        """Job URLs and listing fields of a listing page or API response"""
+        return self.extract_payload(self.payload(text))
+
+    def extract_payload(self, payload: Any) -> ListingPage:
+        job_urls: List[str] = []
+        fields: Dict[str, Dict[str, Optional[str]]] = {}
+        jobs = 0
+        for item in iter_job_objects(payload, self.keys):
+            jobs += 1
+            url = self.normalise(fill_template(self.job_url, item))
+            if url and url not in fields:
+                job_urls.append(url)
+                fields[url] = {name: fill_template(template, item) for name, template in self.fields.items()}
+        is_last = self.page_size is not None and jobs < self.page_size
+        return ListingPage(job_urls, is_last, fields)
+
+    def extract_soup(self, soup: Any) -> ListingPage:
+        return self.extract_json(str(soup))
+
+    def extract_selectolax(self, tree: Any) -> ListingPage:
+        return self.extract_json(tree.html)
+
+
+# Adding a site to the crawl only takes an entry here
+SITE_SPECS: Dict[str, SiteSpec] = {spec.name: spec for spec in [
+    SiteSpec("topcv", card="div.job-item-search-result", link="h3.title a"),
+    SiteSpec("itviec", card='h3[class="imt-3 text-break"]', attribute="data-url"),
+    SiteSpec("123job", card="h2.job__list-item-title", link="a"),
+    SiteSpec("careerlink", card='a[class="job-link clickable-outside"]'),
+    # Crawled per province; cards are matched on their job links, which end in -<id>.html
+    SiteSpec("jobsgo", card='a[href*="/viec-lam/"]', url_pattern=r"/viec-lam/[^/]+-\d+\.html$"),
+    # JS front-ends, read from the JSON they ship. The keys follow the sites' front-end
+    # data and are the first thing to check when one of them stops yielding jobs.
+    EmbeddedJsonSpec("topdev", keys=("id", "title", "detail_url"), job_url="{detail_url}", script_id=None,
+                     url="https://api.topdev.vn/td/v2/jobs?page={page}&page_size=100&locale=vi_VN",
+                     base_url="https://topdev.vn/", page_size=100,
+                     fields={"title": "{title}", "company": "{company[display_name]}", "salary": "{salary[value]}",
+                             "location": "{addresses[sort_addresses]}"}),
+    EmbeddedJsonSpec("vietnamworks", keys=("jobId", "jobTitle", "jobUrl"), job_url="{jobUrl}",
+                     fields={"title": "{jobTitle}", "company": "{companyName}", "salary": "{prettySalary}",
+                             "location": "{workingLocations[0][cityName]}"}),
+    EmbeddedJsonSpec("glints", keys=("id", "title", "company"), job_url="/vn/opportunities/jobs/{id}",
+                     fields={"title": "{title}", "company": "{company[name]}", "location": "{city[name]}"}),
+    EmbeddedJsonSpec("vieclam24h", keys=("id", "title", "title_slug"), job_url="/{title_slug}-id{id}.html",
+                     fields={"title": "{title}", "company": "{employer_info[name]}",
+                             "location": "{province_names}"}),
+]}
+
+
+def get_spec(name: str) -> SiteSpec:
+    try:
+        return SITE_SPECS[name]
+    except KeyError:
+        raise ValueError(f"No site spec registered for {name}") from None
+
+
+def registered_sites() -> List[str]:
+    """Sites that can be crawled, in websites.py order"""
+    return [name for name in websites if name in SITE_SPECS]
@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.common import MAX_RETRIES
+from common.metrics import metrics
+
+# Configuration constants - can be overridden when importing
+RETRY_BUDGET = 20
+RETRY_BUDGET_RATIO = 0.1
+
+logger = logging.getLogger(__name__)
+
+
+class RetryScheduler:
+    """
+    Delay queue of failed requests waiting for their retry deadline
+
+    A worker whose request fails schedules it with the delay from RetryableError
+    (Retry-After or jittered backoff) and moves on to other work; the request comes
+    back from pop_due once its deadline has passed. Requests are queued per owner
+    (a site, or a listing partition) so every owner's workers pick up their own retries.
+
+    Each host has a retry budget: it starts with budget retries and earns budget_ratio
+    of a retry per successful request, up to budget. A host that keeps failing runs out
+    and its failures are given up at once instead of piling up in the queue.
+
+    Not thread-safe; use it from the event loop thread.
+    """
+
+    def __init__(self, max_retries: int = MAX_RETRIES, budget: float = RETRY_BUDGET,
+                 budget_ratio: float = RETRY_BUDGET_RATIO):
+        self.max_retries = max_retries
+        self.budget = budget
+        self.budget_ratio = budget_ratio
+        self.scheduled = 0
+        self.denied = 0
+        self._budgets: Dict[str, float] = {}
+        self._queues: Dict[str, List[Tuple[float, int, Any, int]]] = {}
+        self._counter = itertools.count()
+
+    def record_success(self, host: str) -> None:
+        self._budgets[host] = min(self.budget, self._budgets.get(host, self.budget) + self.budget_ratio)
+
+    def schedule(self, owner: str, host: str, item: Any, attempt: int, delay: float) -> bool:
+        """
+        Queue item for another attempt in delay seconds
+
+        Args:
+            owner: Queue the retry belongs to
+            host: Host whose retry budget pays for it
+            item: What to retry (a page number, a URL...)
+            attempt: Number of the attempt to make next (0-based)
+            delay: Seconds to wait before retrying
+
+        Returns:
+            False when the attempts or the host's budget are used up and the item is given up
+        """
+        budget = self._budgets.get(host, self.budget)
+        if attempt >= self.max_retries or budget < 1:
+            if budget < 1:
+                logger.warning(f"[{host}] Retry budget exhausted, giving up on {item}")
+            self.denied += 1
+            return False
+        self._budgets[host] = budget - 1
+        heapq.heappush(self._queues.setdefault(owner, []),
+                       (time.monotonic() + delay, next(self._counter), item, attempt))
+        self.scheduled += 1
+        metrics.count_retry(host)
+        return True
+
+    def pop_due(self, owner: str) -> Optional[Tuple[Any, int]]:
+        """The oldest (item, attempt) of owner whose deadline has passed, or None"""
+        queue = self._queues.get(owner)
+        if not queue or queue[0][0] > time.monotonic():
+            return None
+        _deadline, _order, item, attempt = heapq.heappop(queue)
+        return item, attempt
+
+    def next_deadline(self, owner: Optional[str] = None) -> Optional[float]:
+        """The earliest deadline (time.monotonic) of owner, or of every owner"""
+        queues = [self._queues.get(owner, [])] if owner is not None else self._queues.values()
+        deadlines = [queue[0][0] for queue in queues if queue]
+        return min(deadlines) if deadlines else None
+
+    def pending(self, owner: Optional[str] = None) -> int:
+        if owner is not None:
+            return len(self._queues.get(owner, []))
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def wait(self, owner: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        """Sleep until the next deadline of owner (or of every owner), at most timeout seconds"""
+        deadline = self.next_deadline(owner)
+        if deadline is None:
+            return
+        delay = max(0.0, deadline - time.monotonic())
+        if timeout is not None:
+            delay = min(delay, timeout)
+        await asyncio.sleep(delay)
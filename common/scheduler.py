@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from common.async_crawler import KNOWN_PAGES_BEFORE_STOP, AsyncCrawler, SiteCrawl
+from common.common import HostRateLimiter, get_host
+from common.registry import get_spec
+
+# Configuration constants - can be overridden when importing
+SCHEDULE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl', 'schedule.db')
+RECENT_RUNS = 5
+DEFAULT_JOBS_PER_PAGE = 20
+MIN_EXPECTED_NEW_JOBS = 5
+CRAWL_WINDOW = 60 * 60
+
+logger = logging.getLogger(__name__)
+
+
+def _at(moment: datetime) -> str:
+    return moment.isoformat(timespec='seconds')
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _hours(since: str, until: datetime) -> float:
+    return (until - datetime.fromisoformat(since)).total_seconds() / 3600
+
+
+class SiteHistory:
+    """
+    What the last RECENT_RUNS runs of a site found
+
+    new_per_hour is the rate at which the site gains postings: the new jobs each run
+    found over the hours since the run before it started. Only intervals starting at a
+    complete run count, as the run after one cut short also finds its backlog. It is
+    None until there are two such runs.
+
+    backlog_pages counts the pages of the latest runs that the crawl window closed on.
+    Their jobs are known now, while the older jobs below them were never reached.
+    """
+
+    def __init__(self, runs: List[tuple]):
+        # Rows of (started_at, pages, requests, job_urls, new_jobs, complete), newest first
+        self.runs = len(runs)
+        self.backlog_pages = 0
+        for row in runs:
+            if row[5]:
+                break
+            self.backlog_pages += row[1]
+        self.last_started = runs[0][0] if runs else None
+        pages = sum(row[1] for row in runs)
+        requests = sum(row[2] for row in runs)
+        self.jobs_per_page = sum(row[3] for row in runs) / pages if pages else None
+        self.new_per_request = sum(row[4] for row in runs) / requests if requests else None
+        new_jobs, hours = 0, 0.0
+        for newer, older in zip(runs, runs[1:]):
+            if older[5]:
+                new_jobs += newer[4]
+                hours += _hours(older[0], datetime.fromisoformat(newer[0]))
+        self.new_per_hour = new_jobs / hours if hours > 0 else None
+
+
+class SitePlan:
+    """
+    A site's expected yield in the next run and the priority of its pages
+
+    Listings are sorted newest first, so the expected new jobs fill the first pages:
+    page_yield(page) is the number of new jobs a page is expected to hold, from a full
+    page down to 0 past the expected ones. A site without enough history to estimate
+    from is given its observed yield per request for every page, or a full page when
+    it was never crawled. The expected new jobs grow with the time since the last run.
+
+    page_priority(page) is that yield times the host's rate, the new jobs per second
+    the page's host lets the crawl collect. Within the window a slow host gets through
+    few pages whatever their order, so a fast host's pages go first at equal yield.
+
+    known_pages is how many pages of known jobs the site's incremental crawl goes
+    through before stopping. After runs cut short by the crawl window it also covers
+    their pages, so the crawl gets past them to the jobs they did not reach.
+    """
+
+    def __init__(self, site: str, history: SiteHistory, rate: float, now: datetime):
+        self.site = site
+        self.host = get_host(get_spec(site).url)
+        self.rate = rate
+        self.partitions = len(get_spec(site).partitions())
+        self.jobs_per_page = history.jobs_per_page or DEFAULT_JOBS_PER_PAGE
+        self.new_per_request = history.new_per_request
+        self.new_per_hour = history.new_per_hour
+        self.known_pages = KNOWN_PAGES_BEFORE_STOP + history.backlog_pages
+        self.hours_since = _hours(history.last_started, now) if history.last_started else None
+        self.expected_new: Optional[float] = None
+        if self.new_per_hour is not None and self.hours_since is not None:
+            self.expected_new = self.new_per_hour * self.hours_since
+        self.due = self.expected_new is None or self.expected_new >= MIN_EXPECTED_NEW_JOBS
+
+    @property
+    def pages(self) -> Optional[int]:
+        """Listing pages expected to hold new jobs, over all partitions"""
+        if self.expected_new is None:
+            return None
+        return math.ceil(self.expected_new / self.jobs_per_page)
+
+    def page_yield(self, page: int) -> float:
+        if self.expected_new is None:
+            return self.jobs_per_page if self.new_per_request is None else self.new_per_request
+        # Partitions are crawled side by side, each holding its share of the new jobs
+        remaining = self.expected_new / self.partitions - (page - 1) * self.jobs_per_page
+        return min(self.jobs_per_page, max(0.0, remaining))
+
+    def page_priority(self, page: int) -> float:
+        return self.page_yield(page) * self.rate
+
+    @property
+    def priority(self) -> float:
+        return self.page_priority(1)
+
+    def describe(self) -> str:
+        def value(number: Optional[float], unit: str = "") -> str:
+            return "-" if number is None else f"{number:.1f}{unit}"
+
+        return (f"{self.site:<16} {value(self.hours_since, 'h'):>8} {value(self.new_per_hour):>8} "
+                f"{value(self.expected_new):>8} {self.pages if self.pages is not None else '-':>6} "
+                f"{value(self.new_per_request):>8} {self.rate:>6.2f} {self.priority:>8.2f}  "
+                f"{'due' if self.due else 'not due'}")
+
+
+PLAN_HEADER = (f"{'site':<16} {'since':>8} {'new/h':>8} {'expect':>8} {'pages':>6} {'new/req':>8} "
+               f"{'req/s':>6} {'priority':>8}")
+
+
+class CrawlSchedule:
+    """
+    Run history of every site and learned host rates, backed by SQLite, and the plan
+    of the next run made from them
+
+    Every run records, per site, when it started, the listing pages and requests it
+    took, the job URLs it saw and how many of them were new, and whether it reached
+    the site's known jobs (or the end of its listing) before the crawl window closed.
+    The final rate of every host's rate limiter is kept too, so the next run starts
+    each host at the rate it sustained instead of ramping up from the default again.
+
+    Usage:
+        with CrawlSchedule() as schedule:
+            limiter = HostRateLimiter(host_rates=schedule.host_rates())
+            plans = schedule.plan(registered_sites(), limiter)
+    """
+
+    def __init__(self, path: str = SCHEDULE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS runs (
+                site TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                finished_at TEXT NOT NULL,
+                pages INTEGER NOT NULL,
+                requests INTEGER NOT NULL,
+                job_urls INTEGER NOT NULL,
+                new_jobs INTEGER NOT NULL,
+                complete INTEGER NOT NULL,
+                PRIMARY KEY (site, started_at)
+            );
+            CREATE TABLE IF NOT EXISTS host_rates (
+                host TEXT PRIMARY KEY,
+                rate REAL NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+        """)
+
+    def history(self, site: str) -> SiteHistory:
+        return SiteHistory(self._connection.execute(
+            "SELECT started_at, pages, requests, job_urls, new_jobs, complete FROM runs WHERE site = ? "
+            "ORDER BY started_at DESC LIMIT ?", (site, RECENT_RUNS)).fetchall())
+
+    def host_rates(self) -> Dict[str, float]:
+        """Rates the hosts' limiters ended the last runs at, in requests per second"""
+        return dict(self._connection.execute("SELECT host, rate FROM host_rates"))
+
+    def plan(self, sites: Iterable[str], limiter: HostRateLimiter) -> List["SitePlan"]:
+        """Plans of the given sites, highest priority first"""
+        now = _now()
+        rates = {**limiter.host_rates, **limiter.rates()}
+        plans = [SitePlan(site, self.history(site), rates.get(get_host(get_spec(site).url), limiter.default_rate),
+                          now) for site in sites]
+        return sorted(plans, key=lambda plan: plan.priority, reverse=True)
+
+    def record_run(self, site: str, started_at: datetime, pages: int, requests: int, job_urls: int,
+                   new_jobs: int, complete: bool) -> None:
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (site, _at(started_at), _at(_now()), pages, requests, job_urls, new_jobs, int(complete)))
+
+    def record_rates(self, rates: Dict[str, float]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO host_rates VALUES (?, ?, ?)",
+                [(host, rate, _at(_now())) for host, rate in rates.items()])
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "CrawlSchedule":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+async def crawl_within(crawler: AsyncCrawler, sites: List[SiteCrawl], window: float) -> Set[str]:
+    """
+    Crawl sites at once until they are done or window seconds have passed
+
+    When the window closes, no new page is handed out and the pages in flight are
+    finished. A site cut short keeps the jobs it found, and its next plan makes up for
+    the pages it did not reach (see SitePlan.known_pages).
+
+    Returns:
+        Keys of the sites the window closed on
+    """
+    cut: Set[str] = set()
+
+    async def close_window() -> None:
+        await asyncio.sleep(window)
+        for site in sites:
+            if not site.finished:
+                cut.add(site.key)
+                site.mark_end(site.first_unclaimed)
+        if cut:
+            logger.warning(f"Crawl window of {window / 60:g} minutes closed on {', '.join(sorted(cut))}")
+
+    timer = asyncio.create_task(close_window())
+    try:
+        await crawler.crawl(sites)
+    finally:
+        timer.cancel()
+    return cut
@@ -0,0 +1,253 @@
+import hashlib
+import itertools
+import json
+import logging
+import math
+import mmap
+import os
+import string
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Optional, Sequence, Set
+
+# Configuration constants - can be overridden when importing
+SEEN_INDEX_KIND = "exact"
+BLOOM_CAPACITY = 2_000_000
+BLOOM_ERROR_RATE = 0.001
+COMPACT_MIN = 65536
+COMPACT_RATIO = 8
+
+# Index kinds: sorted 64-bit ID arrays, or Bloom filters that may report a new job as seen
+SEEN_INDEX_KINDS = ("exact", "bloom")
+
+BASE62 = string.digits + string.ascii_uppercase + string.ascii_lowercase
+MANIFEST_NAME = "manifest.json"
+
+logger = logging.getLogger(__name__)
+
+
+def job_key(job_id: str) -> int:
+    """
+    Pack a canonical job ID into an unsigned 64-bit integer
+
+    Numeric IDs (topcv 1874567, careerlink 3269762) are stored as they are. Short
+    alphanumeric IDs (123job zrMLJoYA9d) are read as base-62 numbers and tagged with
+    bit 61. Anything else - itviec slugs, URLs of sites without an ID pattern, IDs with
+    leading zeros - is hashed to 63 bits and tagged with bit 63, so the three kinds
+    never collide with each other.
+    """
+    if job_id.isascii() and job_id.isalnum() and not job_id.startswith('0'):
+        if job_id.isdigit() and len(job_id) <= 18:
+            return int(job_id)
+        if len(job_id) <= 10:
+            value = 0
+            for char in job_id:
+                value = value * 62 + BASE62.index(char)
+            return value | (1 << 61)
+    digest = hashlib.blake2b(job_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') | (1 << 63)
+
+
+class IntSet:
+    """
+    Set of unsigned 64-bit integers in a sorted array
+
+    Lookups bisect the array, which can be a memoryview over a memory-mapped file, so
+    a set loaded from disk costs no memory until its pages are touched. New values go
+    to a small Python set that is merged into a new sorted array once it outgrows
+    COMPACT_MIN or 1/COMPACT_RATIO of the array, keeping merges amortised O(1) per value.
+    """
+
+    def __init__(self, values: Sequence[int] = ()):
+        self._sorted: Sequence[int] = values if len(values) else array('Q')
+        self._added: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._added)
+
+    def __contains__(self, value: int) -> bool:
+        if value in self._added:
+            return True
+        index = bisect_left(self._sorted, value)
+        return index < len(self._sorted) and self._sorted[index] == value
+
+    def add(self, value: int) -> bool:
+        """Add value and return True when it was not in the set yet"""
+        if value in self:
+            return False
+        self._added.add(value)
+        if len(self._added) > max(COMPACT_MIN, len(self._sorted) // COMPACT_RATIO):
+            self.compact()
+        return True
+
+    def compact(self) -> None:
+        if self._added:
+            # The array is already one sorted run, so Timsort mostly pays for the new values
+            self._sorted = array('Q', sorted(itertools.chain(self._sorted, self._added)))
+            self._added = set()
+
+    def tobytes(self) -> bytes:
+        self.compact()
+        return self._sorted.tobytes()
+
+
+class BloomFilter:
+    """
+    Bloom filter sized for capacity items at error_rate false positives
+
+    Positions come from double hashing one blake2b digest. The bits live in a
+    bytearray or in a copy-on-write memory map of a saved filter.
+    """
+
+    def __init__(self, capacity: int = BLOOM_CAPACITY, error_rate: float = BLOOM_ERROR_RATE,
+                 bits: Optional[Any] = None, count: int = 0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = count
+        self._bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+        if len(self._bits) != (self.size + 7) // 8:
+            raise ValueError("Bloom filter bits do not match its capacity and error rate")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def add(self, key: str) -> bool:
+        """Add key and return True when it was (probably) not in the filter yet"""
+        is_new = False
+        for position in self._positions(key):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self._bits[byte] & bit:
+                self._bits[byte] |= bit
+                is_new = True
+        if is_new:
+            self.count += 1
+            if self.count == self.capacity + 1:
+                logger.warning(f"Bloom filter holds more than its capacity of {self.capacity} items, "
+                               f"false positives will exceed {self.error_rate}")
+        return is_new
+
+    def tobytes(self) -> bytes:
+        return bytes(self._bits)
+
+
+class SeenIndex:
+    """
+    Compact per-site index of the job IDs already seen
+
+    With kind "exact", job IDs are packed into 64-bit integers by job_key and kept in
+    an IntSet per site: 8 bytes per job instead of a Python string in a set. With kind
+    "bloom", each site has a BloomFilter sized for capacity jobs; it is smaller still
+    but may report a new job as seen with probability error_rate.
+
+    save() writes one file per site plus a manifest to directory, and load() maps
+    those files back into memory without reading them, so startup does not depend on
+    the number of jobs.
+    """
+
+    def __init__(self, kind: str = SEEN_INDEX_KIND, directory: Optional[str] = None,
+                 capacity: int = BLOOM_CAPACITY, error_rate: float = BLOOM_ERROR_RATE):
+        if kind not in SEEN_INDEX_KINDS:
+            raise ValueError(f"Unknown seen index kind {kind}, expected one of {', '.join(SEEN_INDEX_KINDS)}")
+        self.kind = kind
+        self.directory = directory
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._sites: Dict[str, Any] = {}
+
+    def _new_set(self) -> Any:
+        return IntSet() if self.kind == "exact" else BloomFilter(self.capacity, self.error_rate)
+
+    def _key(self, job_id: str) -> Any:
+        return job_key(job_id) if self.kind == "exact" else job_id
+
+    def __len__(self) -> int:
+        return sum(len(seen) for seen in self._sites.values())
+
+    def count(self, site: str) -> int:
+        seen = self._sites.get(site)
+        return len(seen) if seen is not None else 0
+
+    def contains(self, site: str, job_id: str) -> bool:
+        seen = self._sites.get(site)
+        return seen is not None and self._key(job_id) in seen
+
+    def add(self, site: str, job_id: str) -> bool:
+        """Record a job ID and return True when it was not seen before"""
+        if site not in self._sites:
+            self._sites[site] = self._new_set()
+        return self._sites[site].add(self._key(job_id))
+
+    def _path(self, site: str) -> str:
+        return os.path.join(self.directory, f"{site}.{'ids' if self.kind == 'exact' else 'bloom'}")
+
+    def load(self) -> Optional[int]:
+        """
+        Map the saved index of every site into memory
+
+        Returns:
+            The stamp given to save(), or None when there is no usable saved index
+        """
+        if self.directory is None:
+            return None
+        try:
+            with open(os.path.join(self.directory, MANIFEST_NAME), encoding='utf-8') as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if (manifest.get("kind") != self.kind or manifest.get("byteorder") != sys.byteorder
+                or (self.kind == "bloom" and (manifest.get("capacity"), manifest.get("error_rate"))
+                    != (self.capacity, self.error_rate))):
+            logger.info(f"Saved seen index in {self.directory} has other settings, rebuilding it")
+            return None
+
+        sites = {}
+        try:
+            for site, count in manifest["sites"].items():
+                sites[site] = self._map(site, count)
+        except (OSError, ValueError) as error:
+            logger.warning(f"Could not load the seen index from {self.directory}: {error}")
+            return None
+        self._sites = sites
+        return manifest.get("stamp")
+
+    def _map(self, site: str, count: int) -> Any:
+        with open(self._path(site), 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return self._new_set()
+            if self.kind == "exact":
+                values = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)).cast('Q')
+                if len(values) != count:
+                    raise ValueError(f"{self._path(site)} holds {len(values)} IDs, expected {count}")
+                return IntSet(values)
+            return BloomFilter(self.capacity, self.error_rate, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY),
+                               count)
+
+    def save(self, stamp: Optional[int] = None) -> None:
+        """Write every site's index and then the manifest, each file replaced atomically"""
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for site, seen in self._sites.items():
+            tmp_path = f"{self._path(site)}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(seen.tobytes())
+            os.replace(tmp_path, self._path(site))
+        manifest = {"kind": self.kind, "byteorder": sys.byteorder, "stamp": stamp,
+                    "sites": {site: len(seen) for site, seen in self._sites.items()}}
+        if self.kind == "bloom":
+            manifest.update(capacity=self.capacity, error_rate=self.error_rate)
+        tmp_path = os.path.join(self.directory, f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, os.path.join(self.directory, MANIFEST_NAME))
@@ -0,0 +1,215 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import cloudscraper
+import requests
+from cloudscraper.exceptions import CloudflareChallengeError, CloudflareException
+
+from common.common import REQUEST_TIMEOUT, get_host
+from common.transport import POOL_MAXSIZE, configure_pools, pool_size
+
+# Configuration constants - can be overridden when importing
+POOL_SIZE = 3
+SESSION_STATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl', '.sessions')
+WARMUP_TIMEOUT = 60
+
+# Browser profiles of cloudscraper's browsers.json sessions are made from. Each one
+# brings the cipher suite and headers of its browser, and a User-Agent of it.
+BROWSER_PROFILES: List[Dict[str, Any]] = [
+    {'browser': browser, 'platform': platform, 'mobile': False}
+    for browser in ('chrome', 'firefox') for platform in ('windows', 'darwin', 'linux')
+]
+
+logger = logging.getLogger(__name__)
+
+
+def is_challenge(response: requests.Response) -> bool:
+    """Whether a response is a Cloudflare challenge page rather than real content"""
+    if response.status_code not in (403, 503):
+        return False
+    if response.headers.get("cf-mitigated") == "challenge":
+        return True
+    return "cloudflare" in response.headers.get("Server", "").lower() and "challenge" in response.text[:4096]
+
+
+class PooledSession:
+    """
+    A cloudscraper session bound to one browser profile
+
+    The User-Agent is the one cloudscraper picks for the profile, so it matches the TLS
+    cipher suite and headers the session sends. Cloudflare ties the clearance cookie to
+    it, so every request of the session sends the same one, including after the
+    session is restored from saved state. The session keeps up to pool_size keep-alive
+    connections per host.
+    """
+
+    def __init__(self, browser: Dict[str, Any], pool_size: int = POOL_MAXSIZE, user_agent: Optional[str] = None):
+        self.browser = browser
+        self.scraper = cloudscraper.create_scraper(browser=dict(browser))
+        if user_agent is not None:
+            self.scraper.headers["User-Agent"] = user_agent
+        self.user_agent = self.scraper.headers["User-Agent"]
+        configure_pools(self.scraper, pool_size)
+        self.created_at = time.time()
+        self.requests = 0
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers["User-Agent"] = self.user_agent
+        self.requests += 1
+        return self.scraper.get(url, headers=headers, **kwargs)
+
+    def warm(self, base_url: str) -> None:
+        """Visit the site's home page so the Cloudflare clearance is obtained up front"""
+        self.get(base_url, timeout=REQUEST_TIMEOUT)
+
+    def export_state(self) -> Dict[str, Any]:
+        cookies = [[cookie.name, cookie.value, cookie.domain, cookie.path, cookie.expires]
+                   for cookie in self.scraper.cookies]
+        return {"browser": self.browser, "user_agent": self.user_agent, "cookies": cookies}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], pool_size: int = POOL_MAXSIZE) -> "PooledSession":
+        session = cls(state["browser"], pool_size, state["user_agent"])
+        now = time.time()
+        for name, value, domain, path, expires in state["cookies"]:
+            if expires is None or expires > now:
+                session.scraper.cookies.set(name, value, domain=domain, path=path, expires=expires)
+        return session
+
+    def close(self) -> None:
+        self.scraper.close()
+
+
+class SessionPool:
+    """
+    Pool of warmed, reusable cloudscraper sessions for one host
+
+    Sessions are created and warmed in background threads, and their cookies are saved
+    to SESSION_STATE_DIR on close and restored on the next run, so Cloudflare clearance is
+    rarely obtained on the critical path. Requests rotate over the ready sessions, each
+    keeping its own browser profile and keep-alive connections (common.transport.pool_size
+    of them per session). A session that gets challenged is retired and a fresh one is
+    warmed in the background, and the request fails with a CloudflareChallengeError, so
+    fetch_attempt retries it, on another session.
+
+    The pool is a drop-in replacement for a cloudscraper instance in fetch_with_retry.
+    """
+
+    def __init__(self, base_url: str, size: int = POOL_SIZE, state_dir: str = SESSION_STATE_DIR):
+        parts = urlsplit(base_url)
+        self.base_url = f"{parts.scheme}://{parts.netloc}/"
+        self.host = get_host(base_url)
+        self.size = size
+        self.pool_size = pool_size(self.host)
+        self.state_path = os.path.join(state_dir, f"{self.host}.json")
+        self.retired = 0
+        self._ready: Deque[PooledSession] = deque()
+        self._condition = threading.Condition()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self) -> None:
+        """Restore saved sessions and warm the missing ones in the background"""
+        with self._condition:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix=f"warm-{self.host}")
+            # States saved before sessions had a browser profile cannot be matched to a cipher suite
+            for state in [state for state in self._load_state() if "browser" in state][:self.size]:
+                self._ready.append(PooledSession.from_state(state, self.pool_size))
+            missing = self.size - len(self._ready)
+        if self._ready:
+            logger.info(f"[{self.host}] Restored {len(self._ready)} sessions")
+        for _ in range(missing):
+            self._executor.submit(self._spawn)
+
+    def _load_state(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.state_path):
+            return []
+        try:
+            with open(self.state_path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError) as error:
+            logger.warning(f"[{self.host}] Ignoring unreadable session state: {error}")
+            return []
+
+    def _pick_browser(self) -> Dict[str, Any]:
+        with self._condition:
+            in_use = [session.browser for session in self._ready]
+        unused = [browser for browser in BROWSER_PROFILES if browser not in in_use]
+        return random.choice(unused or BROWSER_PROFILES)
+
+    def _spawn(self) -> None:
+        session = PooledSession(self._pick_browser(), self.pool_size)
+        try:
+            session.warm(self.base_url)
+            logger.info(f"[{self.host}] Warmed a new session")
+        except (CloudflareException, requests.RequestException) as error:
+            logger.warning(f"[{self.host}] Session warm-up failed, using it cold: {error}")
+        with self._condition:
+            self._ready.append(session)
+            self._condition.notify_all()
+
+    def _checkout(self) -> PooledSession:
+        self.start()
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._ready, timeout=WARMUP_TIMEOUT):
+                logger.warning(f"[{self.host}] No warm session after {WARMUP_TIMEOUT} seconds, creating one inline")
+                self._ready.append(PooledSession(self._pick_browser(), self.pool_size))
+            session = self._ready[0]
+            self._ready.rotate(-1)
+            return session
+
+    def retire(self, session: PooledSession) -> None:
+        """Drop a challenged session and warm a replacement in the background"""
+        with self._condition:
+            if session not in self._ready:
+                return
+            self._ready.remove(session)
+            self.retired += 1
+        logger.info(f"[{self.host}] Retired a challenged session after {session.requests} requests")
+        session.close()
+        self._executor.submit(self._spawn)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        session = self._checkout()
+        try:
+            response = session.get(url, **kwargs)
+        except CloudflareException:
+            self.retire(session)
+            raise
+        if is_challenge(response):
+            response.close()
+            self.retire(session)
+            raise CloudflareChallengeError(f"{url} answered with a Cloudflare challenge ({response.status_code})")
+        return response
+
+    def save(self) -> None:
+        """Persist the cookies of the ready sessions for the next run"""
+        with self._condition:
+            states = [session.export_state() for session in self._ready]
+        if not states:
+            return
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(states, file)
+        os.replace(tmp_path, self.state_path)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.save()
+        with self._condition:
+            for session in self._ready:
+                session.close()
+            self._ready.clear()
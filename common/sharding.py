@@ -0,0 +1,347 @@
+import logging
+import multiprocessing
+import queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from common.common import (DEFAULT_REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND, MIN_REQUESTS_PER_SECOND,
+                           HostRateLimiter, ScrapingError, rate_limiter, scrape_page_with_retry)
+from common.metrics import metrics
+from common.parsing import PARSER_BACKEND, parse_listing
+from common.sessions import SessionPool
+
+if TYPE_CHECKING:
+    from common.async_crawler import SiteCrawl
+
+# Configuration constants - can be overridden when importing
+SHARD_SIZE = 25
+SHARD_WORKERS = 4
+WORKER_POLL_INTERVAL = 1.0
+MAX_WORKER_DEATHS = 3
+
+logger = logging.getLogger(__name__)
+
+
+def find_last_page(has_jobs: Callable[[int], bool], start: int = 1) -> int:
+    """
+    Find the last listing page that still has jobs
+
+    Probes start, start+1, start+2, start+4, ... until a page comes back empty, then
+    binary searches between the last full and the first empty probe. That takes about
+    2*log2(last) requests instead of one per page.
+
+    Args:
+        has_jobs: Fetches a page and tells whether it lists any job
+        start: First page of the listing
+
+    Returns:
+        The last page with jobs, or start - 1 when the listing is empty
+    """
+    if not has_jobs(start):
+        return start - 1
+
+    low, step = start, 1
+    high = start + step
+    while has_jobs(high):
+        low = high
+        step *= 2
+        high = start + step
+
+    # low has jobs, high does not
+    while high - low > 1:
+        middle = (low + high) // 2
+        if has_jobs(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def make_probe(site: str, url: str, scraper: Any, backend: str = PARSER_BACKEND,
+               limiter: Optional[HostRateLimiter] = None) -> Callable[[int], bool]:
+    """A has_jobs callable for find_last_page that fetches and parses listing pages"""
+    def has_jobs(page: int) -> bool:
+        try:
+            response = scrape_page_with_retry(scraper, url, page, limiter=limiter)
+        except ScrapingError as error:
+            if error.status_code == 404:
+                return False
+            raise
+        found = bool(parse_listing(site, response.text, backend))
+        logger.info(f"[{site}] Probe page {page}: {'jobs' if found else 'empty'}")
+        return found
+
+    return has_jobs
+
+
+class Shard:
+    """A contiguous range of listing pages of one site, with the next page still to crawl"""
+
+    def __init__(self, site: str, url: str, first: int, last: int, key: Optional[str] = None):
+        self.site = site
+        self.url = url
+        self.first = first
+        self.last = last
+        self.key = key or site
+        self.next_page = first
+
+    def remaining(self) -> Optional["Shard"]:
+        """The part of the shard that has not been crawled yet, or None when it is complete"""
+        if self.next_page > self.last:
+            return None
+        return Shard(self.site, self.url, self.next_page, self.last, self.key)
+
+    def as_task(self) -> Tuple[str, str, str, int, int]:
+        return self.key, self.site, self.url, self.first, self.last
+
+    def __repr__(self) -> str:
+        return f"{self.key}[{self.first}-{self.last}]"
+
+
+def split_pages(site: str, url: str, first: int, last: int, shard_size: int = SHARD_SIZE,
+                key: Optional[str] = None) -> List[Shard]:
+    return [Shard(site, url, start, min(start + shard_size - 1, last), key)
+            for start in range(first, last + 1, shard_size)]
+
+
+def page_runs(pages: List[int]) -> List[Tuple[int, int]]:
+    """Group page numbers into contiguous (first, last) ranges"""
+    runs: List[Tuple[int, int]] = []
+    for page in sorted(pages):
+        if runs and runs[-1][1] == page - 1:
+            runs[-1] = (runs[-1][0], page)
+        else:
+            runs.append((page, page))
+    return runs
+
+
+def interleave_shards(shards_by_site: Dict[str, List[Shard]]) -> List[Shard]:
+    """Order shards round-robin over sites so concurrent workers spread over hosts"""
+    ordered = []
+    queues = [deque(shards) for shards in shards_by_site.values()]
+    while queues:
+        for shards in queues:
+            ordered.append(shards.popleft())
+        queues = [shards for shards in queues if shards]
+    return ordered
+
+
+def _shard_worker(tasks: multiprocessing.Queue, results: multiprocessing.Queue, backend: str,
+                  limits: Dict[str, Any]) -> None:
+    """Worker process: crawl assigned shards page by page and report every page"""
+    limiter = HostRateLimiter(**limits)
+    pools: Dict[str, SessionPool] = {}
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            key, site, url, first, last = task
+            if site not in pools:
+                pools[site] = SessionPool(url, size=1)
+            for page in range(first, last + 1):
+                try:
+                    response = scrape_page_with_retry(pools[site], url, page, limiter=limiter)
+                    results.put(("page", key, page, parse_listing(site, response.text, backend)))
+                except ScrapingError as error:
+                    results.put(("failed", key, page, str(error)))
+                except Exception as error:
+                    # A page that breaks the parser must not take the worker down with it
+                    results.put(("failed", key, page, f"{type(error).__name__}: {error}"))
+            results.put(("done", key, first, last))
+    finally:
+        for pool in pools.values():
+            pool.close()
+
+
+class ShardCoordinator:
+    """
+    Crawl shards on independent worker processes
+
+    Each worker gets one shard at a time on its own task queue, so the coordinator
+    always knows which pages a worker still owes. Workers report every page as it is
+    crawled. When a worker dies, the uncrawled rest of its shard goes back to the queue
+    and a replacement worker is started; a shard that has killed MAX_WORKER_DEATHS
+    workers is given up and its remaining pages are failed. Every worker's limiter
+    starts at, and adapts between, the workers' share of each host's rates (rate,
+    max_rate and host_rates divided by workers), so the per-host budget holds across
+    processes.
+
+    Listings shift while they are crawled (new jobs push older ones to later pages), so
+    a few jobs can appear in two shards. on_page receives them twice and the frontier
+    deduplicates them.
+    """
+
+    def __init__(self, workers: int = SHARD_WORKERS, backend: str = PARSER_BACKEND,
+                 rate: float = DEFAULT_REQUESTS_PER_SECOND, max_rate: float = MAX_REQUESTS_PER_SECOND,
+                 host_rates: Optional[Dict[str, float]] = None):
+        self.workers = workers
+        self.backend = backend
+        self.rate = rate
+        self.max_rate = max_rate
+        self.host_rates = host_rates or {}
+        self.failed_pages: List[Tuple[str, int]] = []
+        self.reassigned = 0
+        self.abandoned = 0
+        self._context = multiprocessing.get_context()
+
+    def worker_limits(self) -> Dict[str, Any]:
+        """HostRateLimiter arguments of one worker, its share of every rate"""
+        return {
+            "default_rate": self.rate / self.workers,
+            "min_rate": MIN_REQUESTS_PER_SECOND / self.workers,
+            "max_rate": self.max_rate / self.workers,
+            "host_rates": {host: rate / self.workers for host, rate in self.host_rates.items()},
+        }
+
+    def _start_worker(self, results: multiprocessing.Queue) -> Tuple[Any, multiprocessing.Queue]:
+        tasks = self._context.Queue()
+        process = self._context.Process(target=_shard_worker,
+                                        args=(tasks, results, self.backend, self.worker_limits()), daemon=True)
+        process.start()
+        return process, tasks
+
+    def run(self, shards: List[Shard], on_page: Callable[[str, int, List[str]], None],
+            on_failure: Optional[Callable[[str, int], None]] = None) -> None:
+        """
+        Crawl every shard, calling on_page(key, page, job_urls) in this process as pages
+        arrive and on_failure(key, page) for pages that could not be fetched
+        """
+        pending: Deque[Shard] = deque(shards)
+        results = self._context.Queue()
+        workers = [self._start_worker(results) for _ in range(min(self.workers, len(shards)))]
+        assigned: Dict[int, Optional[Shard]] = {index: None for index in range(len(workers))}
+        by_key: Dict[Tuple[str, int], int] = {}
+
+        def assign(index: int) -> None:
+            if pending:
+                shard = pending.popleft()
+                assigned[index] = shard
+                by_key[(shard.key, shard.first)] = index
+                workers[index][1].put(shard.as_task())
+            else:
+                assigned[index] = None
+
+        for index in assigned:
+            assign(index)
+
+        def fail(key: str, page: int, reason: str) -> None:
+            logger.warning(f"[{key}] Failed to scrape page {page}: {reason}")
+            self.failed_pages.append((key, page))
+            if on_failure is not None:
+                on_failure(key, page)
+
+        # Shards keep their key and last page when what is left of them is reassigned
+        deaths: Dict[Tuple[str, int], int] = {}
+        next_check = time.monotonic() + WORKER_POLL_INTERVAL
+        while any(shard is not None for shard in assigned.values()):
+            try:
+                message = results.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                message = None
+
+            if message is not None and message[0] == "done":
+                index = by_key.pop((message[1], message[2]), None)
+                if index is not None:
+                    assign(index)
+            elif message is not None:
+                kind, key, page = message[0], message[1], message[2]
+                owner = next((shard for shard in assigned.values()
+                              if shard is not None and shard.key == key and shard.first <= page <= shard.last), None)
+                if owner is not None:
+                    owner.next_page = max(owner.next_page, page + 1)
+                if kind == "page":
+                    on_page(key, page, message[3])
+                else:
+                    fail(key, page, message[3])
+
+            # Busy workers keep the queue from timing out, so look for dead ones on a clock
+            if message is not None and time.monotonic() < next_check:
+                continue
+            next_check = time.monotonic() + WORKER_POLL_INTERVAL
+            for index, (process, _tasks) in enumerate(workers):
+                if process.is_alive() or assigned[index] is None:
+                    continue
+                shard = assigned[index]
+                logger.error(f"Worker {index} died (exit code {process.exitcode}) while crawling {shard}")
+                by_key.pop((shard.key, shard.first), None)
+                rest = shard.remaining()
+                deaths[(shard.key, shard.last)] = deaths.get((shard.key, shard.last), 0) + 1
+                if rest is not None and deaths[(shard.key, shard.last)] >= MAX_WORKER_DEATHS:
+                    logger.error(f"Giving up on {rest} after {MAX_WORKER_DEATHS} worker deaths")
+                    self.abandoned += 1
+                    for page in range(rest.first, rest.last + 1):
+                        fail(rest.key, page, "worker died")
+                elif rest is not None:
+                    pending.appendleft(rest)
+                    self.reassigned += 1
+                workers[index] = self._start_worker(results)
+                assign(index)
+
+        for process, tasks in workers:
+            tasks.put(None)
+        for process, _tasks in workers:
+            process.join()
+        logger.info(f"Sharded crawl finished: {len(self.failed_pages)} failed pages, "
+                    f"{self.reassigned} shards reassigned, {self.abandoned} given up.")
+
+
+def crawl_sharded(sites: List["SiteCrawl"], workers: int = SHARD_WORKERS, backend: str = PARSER_BACKEND,
+                  shard_size: int = SHARD_SIZE) -> ShardCoordinator:
+    """
+    Crawl full listings by discovering their last page and splitting them into shards
+
+    The last page of every site is found first (concurrently, with the site's own
+    scraper), then all shards are interleaved and crawled by worker processes. Pages are
+    merged back through SiteCrawl.record, so the frontier deduplicates jobs that a
+    shifting listing showed in two shards. Sites resumed from a checkpoint only get
+    shards for the pages they have not completed.
+
+    Args:
+        sites: Sites to crawl from their current page; incremental crawls are not sharded
+        workers: Number of worker processes
+        backend: Parser backend used by the workers
+        shard_size: Pages per shard
+
+    Returns:
+        The coordinator, with the failed pages and reassignment count
+    """
+    if any(site.incremental for site in sites):
+        raise ValueError("Incremental crawls stop at known jobs and cannot be sharded")
+    by_key = {site.key: site for site in sites}
+
+    def discover(site: "SiteCrawl") -> List[Shard]:
+        probe = make_probe(site.name, site.url, site.scraper, backend, rate_limiter)
+        last = find_last_page(probe, site.first_unclaimed)
+        site.mark_end(last + 1)
+        logger.info(f"[{site.key}] Last listing page is {last}")
+        return [shard for first, end in page_runs(site.claim_through(last))
+                for shard in split_pages(site.name, site.url, first, end, shard_size, site.key)]
+
+    with ThreadPoolExecutor(max_workers=max(len(sites), 1)) as executor:
+        shards_by_site = dict(zip(by_key, executor.map(discover, sites)))
+
+    def on_page(key: str, page: int, job_urls: List[str]) -> None:
+        site = by_key[key]
+        site.pages_done += 1
+        metrics.count_page(site.name, len(job_urls))
+        new_urls = site.record(page, job_urls)
+        site.urls_found += len(new_urls)
+        site.complete(page)
+        if new_urls and site.on_page is not None:
+            site.on_page(site.name, page, new_urls)
+
+    def on_failure(key: str, page: int) -> None:
+        by_key[key].fail(page)
+
+    coordinator = ShardCoordinator(workers, backend)
+    try:
+        coordinator.run(interleave_shards(shards_by_site), on_page, on_failure)
+    finally:
+        for site in sites:
+            site.finish_checkpoint()
+    for site in sites:
+        logger.info(f"[{site.key}] {site.pages_done} pages, {site.urls_found} job URLs")
+    return coordinator
@@ -0,0 +1,321 @@
+import argparse
+import gzip
+import importlib
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, IO, List, Optional, Sequence
+
+from common.frontier import canonical_job_id
+
+# Configuration constants - can be overridden when importing
+SINK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl', 'exports')
+SINK_BATCH_SIZE = 1000
+SINK_ROTATE_BYTES = 256 * 1024 * 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+PARQUET_COMPRESSION = "zstd"
+
+# Output formats: JSON Lines (plain, gzip or zstd), Parquet and SQLite
+SINK_FORMATS = ("jsonl", "jsonl.gz", "jsonl.zst", "parquet", "sqlite")
+
+# Fields of a listing record: one job URL seen on a listing page. Title, company, salary
+# and location are only known for sites read from embedded JSON and None for the others.
+LISTING_FIELDS = ("site", "job_id", "url", "page", "title", "company", "salary", "location", "crawled_at")
+
+# Fields stored as integers by the typed formats, every other field is text
+INTEGER_FIELDS = ("page",)
+
+logger = logging.getLogger(__name__)
+
+
+def _optional_import(name: str) -> Any:
+    """
+    Import an optional dependency when a sink first needs it, or return None
+
+    pyarrow alone takes longer to import than the rest of the crawler, so it is only
+    loaded by runs that write Parquet.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class RecordSink:
+    """
+    Buffer records and write them in batches
+
+    Records are dicts projected onto fields (missing fields are None). They are kept in
+    memory until batch_size have arrived and then handed to _write_batch together, so
+    a large run makes one write per batch instead of one per record. close() (or leaving
+    the with block) writes what is left.
+
+    A sink can be passed anywhere a record callback is expected, and add_page matches
+    the on_page callback of SiteCrawl.
+
+    Not thread-safe; write to it from one thread.
+    """
+
+    def __init__(self, fields: Sequence[str] = LISTING_FIELDS, batch_size: int = SINK_BATCH_SIZE):
+        self.fields = tuple(fields)
+        self.batch_size = batch_size
+        self.written = 0
+        self._batch: List[Dict[str, Any]] = []
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._batch.append({field: record.get(field) for field in self.fields})
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    __call__ = write
+
+    def add_page(self, site: str, page: int, job_urls: List[str]) -> None:
+        """Write a listing record for every job URL of a listing page, with the fields the page carries"""
+        crawled_at = _now()
+        fields = getattr(job_urls, 'fields', {})
+        for url in job_urls:
+            record = dict(fields.get(url, ()))
+            record.update(site=site, job_id=canonical_job_id(site, url), url=url, page=page, crawled_at=crawled_at)
+            self.write(record)
+
+    def flush(self) -> None:
+        if not self._batch:
+            return
+        self._write_batch(self._batch)
+        self.written += len(self._batch)
+        self._batch = []
+
+    def _write_batch(self, rows: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.flush()
+        self._close()
+
+    def _close(self) -> None:
+        pass
+
+    def __enter__(self) -> "RecordSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class RotatingFileSink(RecordSink):
+    """
+    A sink writing numbered files that are rotated by size
+
+    Files are named <prefix>-<run start>-<number><extension> in directory, so runs
+    never overwrite each other. Once a batch takes the current file past max_bytes on
+    disk, it is closed and the next batch starts a new one; every file is complete
+    and readable on its own. paths lists the files written.
+    """
+
+    def __init__(self, directory: str, prefix: str, extension: str, fields: Sequence[str] = LISTING_FIELDS,
+                 batch_size: int = SINK_BATCH_SIZE, max_bytes: int = SINK_ROTATE_BYTES):
+        super().__init__(fields, batch_size)
+        self.directory = directory
+        self.prefix = prefix
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.paths: List[str] = []
+        self._stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        self._open_path: Optional[str] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _write_batch(self, rows: List[Dict[str, Any]]) -> None:
+        if self._open_path is None:
+            self._open_path = os.path.join(self.directory,
+                                           f"{self.prefix}-{self._stamp}-{len(self.paths) + 1:04d}{self.extension}")
+            self.paths.append(self._open_path)
+            self._open(self._open_path)
+        self._write_rows(rows)
+        if self._size() >= self.max_bytes:
+            self._close_file()
+            logger.info(f"Rotated {self._open_path} at {self.max_bytes / 1e6:.0f} MB")
+            self._open_path = None
+
+    def _close(self) -> None:
+        if self._open_path is not None:
+            self._close_file()
+            self._open_path = None
+
+    def _open(self, path: str) -> None:
+        raise NotImplementedError
+
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def _size(self) -> int:
+        """Bytes of the open file on disk"""
+        raise NotImplementedError
+
+    def _close_file(self) -> None:
+        raise NotImplementedError
+
+
+class JsonlSink(RotatingFileSink):
+    """
+    JSON Lines files, optionally compressed
+
+    Args:
+        compression: None, "gzip" or "zstd" (needs the zstandard package)
+    """
+
+    EXTENSIONS = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+    def __init__(self, directory: str, prefix: str, compression: Optional[str] = "gzip",
+                 fields: Sequence[str] = LISTING_FIELDS, batch_size: int = SINK_BATCH_SIZE,
+                 max_bytes: int = SINK_ROTATE_BYTES):
+        if compression not in self.EXTENSIONS:
+            raise ValueError(f"Unknown JSON Lines compression {compression}")
+        self._zstandard = _optional_import("zstandard") if compression == "zstd" else None
+        if compression == "zstd" and self._zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        super().__init__(directory, prefix, self.EXTENSIONS[compression], fields, batch_size, max_bytes)
+        self.compression = compression
+        self._raw: Optional[IO[bytes]] = None
+        self._stream: Optional[IO[bytes]] = None
+
+    def _open(self, path: str) -> None:
+        self._raw = open(path, 'wb')
+        if self.compression == "gzip":
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=GZIP_LEVEL)
+        elif self.compression == "zstd":
+            self._stream = self._zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        self._stream.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode('utf-8'))
+
+    def _size(self) -> int:
+        return self._raw.tell()
+
+    def _close_file(self) -> None:
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        self._raw = self._stream = None
+
+
+class ParquetSink(RotatingFileSink):
+    """
+    Parquet files with one row group per batch, needs the pyarrow package
+
+    Integer fields (INTEGER_FIELDS) are int64 columns, every other field a string column.
+    """
+
+    def __init__(self, directory: str, prefix: str, fields: Sequence[str] = LISTING_FIELDS,
+                 batch_size: int = SINK_BATCH_SIZE, max_bytes: int = SINK_ROTATE_BYTES,
+                 compression: str = PARQUET_COMPRESSION):
+        pyarrow = _optional_import("pyarrow")
+        self._parquet = _optional_import("pyarrow.parquet")
+        if pyarrow is None or self._parquet is None:
+            raise ValueError("The Parquet sink needs the pyarrow package")
+        super().__init__(directory, prefix, ".parquet", fields, batch_size, max_bytes)
+        self.compression = compression
+        self._pyarrow = pyarrow
+        self.schema = pyarrow.schema([(field, pyarrow.int64() if field in INTEGER_FIELDS else pyarrow.string())
+                                      for field in self.fields])
+        self._writer = None
+
+    def _open(self, path: str) -> None:
+        self._writer = self._parquet.ParquetWriter(path, self.schema, compression=self.compression)
+
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.write_table(self._pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def _size(self) -> int:
+        return os.path.getsize(self._open_path)
+
+    def _close_file(self) -> None:
+        self._writer.close()
+        self._writer = None
+
+
+class SqliteSink(RecordSink):
+    """
+    Rows of a SQLite table, one transaction per batch
+
+    The table is created with a column per field when it does not exist, and columns
+    for fields added since are added to an existing table. A database is a single file
+    that can be queried while it grows, so it is not rotated.
+    """
+
+    def __init__(self, path: str, table: str, fields: Sequence[str] = LISTING_FIELDS,
+                 batch_size: int = SINK_BATCH_SIZE):
+        super().__init__(fields, batch_size)
+        self.path = path
+        self.table = table
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        columns = ", ".join(f"{field} {'INTEGER' if field in INTEGER_FIELDS else 'TEXT'}" for field in self.fields)
+        self._connection.executescript(f"""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS {table} ({columns});
+        """)
+        existing = {row[1] for row in self._connection.execute(f"PRAGMA table_info({table})")}
+        for field in self.fields:
+            if field not in existing:
+                self._connection.execute(f"ALTER TABLE {table} ADD COLUMN {field} "
+                                         f"{'INTEGER' if field in INTEGER_FIELDS else 'TEXT'}")
+        self._insert = f"INSERT INTO {table} ({', '.join(self.fields)}) VALUES ({', '.join('?' * len(self.fields))})"
+
+    def _write_batch(self, rows: List[Dict[str, Any]]) -> None:
+        with self._connection:
+            self._connection.executemany(self._insert, [tuple(row[field] for field in self.fields) for row in rows])
+
+    def _close(self) -> None:
+        self._connection.close()
+
+
+def open_sink(output_format: str, prefix: str, directory: str = SINK_DIR, fields: Sequence[str] = LISTING_FIELDS,
+              batch_size: int = SINK_BATCH_SIZE, max_bytes: int = SINK_ROTATE_BYTES) -> RecordSink:
+    """
+    Open a sink for one of SINK_FORMATS
+
+    Files are written to directory and named after prefix; SQLite writes the table
+    prefix in <directory>/<prefix>.db.
+    """
+    if output_format == "jsonl":
+        return JsonlSink(directory, prefix, None, fields, batch_size, max_bytes)
+    if output_format == "jsonl.gz":
+        return JsonlSink(directory, prefix, "gzip", fields, batch_size, max_bytes)
+    if output_format == "jsonl.zst":
+        return JsonlSink(directory, prefix, "zstd", fields, batch_size, max_bytes)
+    if output_format == "parquet":
+        return ParquetSink(directory, prefix, fields, batch_size, max_bytes)
+    if output_format == "sqlite":
+        return SqliteSink(os.path.join(directory, f"{prefix}.db"), prefix, fields, batch_size)
+    raise ValueError(f"Unknown output format {output_format}, expected one of {', '.join(SINK_FORMATS)}")
+
+
+def add_sink_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """Add the options streaming records to an output sink"""
+    parser.add_argument('--sink', choices=SINK_FORMATS, help="stream the records to files of this format")
+    parser.add_argument('--sink-dir', default=SINK_DIR, help="directory of the sink files")
+    parser.add_argument('--sink-batch', type=int, default=SINK_BATCH_SIZE, metavar='RECORDS',
+                        help="records buffered before they are written")
+    parser.add_argument('--rotate-mb', type=float, default=SINK_ROTATE_BYTES / 1024 / 1024, metavar='MB',
+                        help="start a new file once the current one reaches this size")
+    return parser
+
+
+def open_sink_from_args(args: argparse.Namespace, prefix: str,
+                        fields: Sequence[str] = LISTING_FIELDS) -> Optional[RecordSink]:
+    """The sink requested with the options of add_sink_arguments, if any"""
+    if not args.sink:
+        return None
+    return open_sink(args.sink, prefix, args.sink_dir, fields, args.sink_batch, int(args.rotate_mb * 1024 * 1024))
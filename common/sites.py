@@ -0,0 +1,35 @@
+import importlib.util
+import os
+from types import ModuleType
+from typing import Dict, List
+
+from websites import websites
+
+CRAWL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl')
+
+_modules: Dict[str, ModuleType] = {}
+
+
+def site_script_path(name: str, script: str = 'get_details.py') -> str:
+    return os.path.join(CRAWL_DIR, name, script)
+
+
+def job_urls_path(name: str) -> str:
+    return os.path.join(CRAWL_DIR, name, 'job_urls.txt')
+
+
+def load_site_module(name: str, script: str = 'get_details.py') -> ModuleType:
+    """Load crawl/<name>/<script>, which is not importable as a regular package. Modules are loaded once."""
+    path = site_script_path(name, script)
+    if path not in _modules:
+        module_name = f"crawl_{name}_{os.path.splitext(script)[0]}".replace('.', '_')
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[path] = module
+    return _modules[path]
+
+
+def available_sites(script: str = 'get_details.py') -> List[str]:
+    """Sites from websites.py that have the given script under crawl/"""
+    return [name for name in websites if os.path.isfile(site_script_path(name, script))]
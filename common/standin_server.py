@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+JOBS_PER_PAGE = 20
+
+
+def render_listing_page(page: int, jobs_per_page: int = JOBS_PER_PAGE) -> str:
+    """Render a listing page using the topcv job card markup"""
+    items = []
+    for index in range(jobs_per_page):
+        job_id = page * 1000 + index
+        items.append(
+            f'<div class="job-item-search-result">'
+            f'<h3 class="title"><a href="/viec-lam/job-{job_id}/{job_id}.html?ta_source=standin">Job {job_id}</a></h3>'
+            f'</div>'
+        )
+    return f"<html><body>{''.join(items)}</body></html>"
+
+
+class StandinServer:
+    """
+    Local HTTP stand-in for a listing site
+
+    Serves `/?page=N` with a rendered listing page for pages 1..pages and a 404 after
+    that, so crawlers can be exercised without touching the real sites. Pages carry an
+    ETag and answer a matching If-None-Match with 304.
+
+    Faults can be injected to look like a real site under load: every response is
+    delayed by latency seconds (plus up to jitter more), and a throttle_rate share of
+    requests gets a 429 with Retry-After: retry_after while an error_rate share gets a
+    502. Faults are drawn from a random generator seeded with seed.
+
+    Usage:
+        with StandinServer(pages=5) as server:
+            url = server.url + "/?page={page}"
+    """
+
+    def __init__(self, pages: int = 10, render: Callable[[int], str] = render_listing_page,
+                 host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 throttle_rate: float = 0.0, error_rate: float = 0.0, retry_after: int = 1,
+                 seed: Optional[int] = None):
+        self.pages = pages
+        self.render = render
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.requests_served = 0
+        self.not_modified = 0
+        self.throttled = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _draw_fault(self) -> Tuple[float, Optional[int]]:
+        """The delay of the next response and the error status to answer with, if any"""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            draw = self._random.random()
+            if draw < self.throttle_rate:
+                self.throttled += 1
+                return delay, 429
+            if draw < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                return delay, 502
+            return delay, None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.requests_served += 1
+
+                delay, status = server._draw_fault()
+                if delay:
+                    time.sleep(delay)
+                if status == 429:
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(server.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if status is not None:
+                    self.send_error(status)
+                    return
+
+                query = parse_qs(urlsplit(self.path).query)
+                page = int(query.get("page", ["1"])[0])
+                if page < 1 or page > server.pages:
+                    self.send_error(404)
+                    return
+
+                body = server.render(page).encode("utf-8")
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    with server._lock:
+                        server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+    def start(self) -> "StandinServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StandinServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    standin = StandinServer(pages=50, port=8000)
+    logger.info(f"Serving stand-in listing at {standin.url}/?page={{page}}")
+    standin._httpd.serve_forever()
@@ -0,0 +1,84 @@
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+# Configuration constants - can be overridden when importing
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Set up the log format of the command line scripts. Library modules never call this."""
+    logging.basicConfig(level=level, format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process was started, read from /proc; None where that is not available"""
+    try:
+        with open('/proc/self/stat', encoding='utf-8') as file:
+            # Fields after the parenthesised command name start at field 3, starttime is field 22
+            fields = file.read().rsplit(')', 1)[1].split()
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupProfile:
+    """
+    Where the time between starting a command and its first request goes
+
+    The interpreter's own startup (including the imports made before this module) is
+    read from /proc, named stages are timed with stage(), and fetch_attempt calls
+    first_request() before the first request of the process goes out. Every stage also
+    counts the modules it imported, which points at the imports worth deferring.
+
+    Usage:
+        with startup.stage("open frontier"):
+            frontier = open_frontier(outputs)
+        logger.info(startup.report())
+    """
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.interpreter = process_age()
+        self.stages: List[Tuple[str, float, int]] = []
+        self.to_first_request: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        modules = len(sys.modules)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - started, len(sys.modules) - modules))
+
+    def first_request(self) -> None:
+        """Note the time of the first request of the process; later calls are ignored"""
+        if self.to_first_request is None:
+            with self._lock:
+                if self.to_first_request is None:
+                    self.to_first_request = time.perf_counter() - self.created
+
+    def report(self) -> str:
+        lines = ["Startup profile:"]
+        if self.interpreter is not None:
+            lines.append(f"  {'interpreter and early imports':<32} {self.interpreter * 1000:8.1f} ms")
+        for name, seconds, modules in self.stages:
+            lines.append(f"  {name:<32} {seconds * 1000:8.1f} ms  {modules:4d} modules imported")
+        if self.to_first_request is not None:
+            total = self.to_first_request + (self.interpreter or 0.0)
+            lines.append(f"  {'first request after':<32} {total * 1000:8.1f} ms")
+        lines.append(f"  {'modules loaded':<32} {len(sys.modules):8d}")
+        return "\n".join(lines)
+
+
+startup = StartupProfile()
@@ -0,0 +1,117 @@
+import codecs
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.util.request import ACCEPT_ENCODING as DECODABLE_ENCODINGS
+
+from common.metrics import metrics
+
+# Configuration constants - can be overridden when importing
+POOL_MAXSIZE = 4
+POOL_BLOCK = False
+STREAM_CHUNK_SIZE = 16 * 1024
+DEFAULT_ENCODING = "utf-8"
+
+# Keep-alive connections per session for hosts that need more or fewer than POOL_MAXSIZE
+HOST_POOL_SIZES: Dict[str, int] = {}
+
+# Content codings responses can be decompressed from. urllib3 lists br and zstd only
+# when the brotli and zstandard packages are installed, so a server is never invited
+# to send a body that could not be decoded.
+ACCEPT_ENCODING = DECODABLE_ENCODINGS.replace(",", ", ")
+
+# Protocol names of urllib3's HTTPResponse.version
+HTTP_VERSIONS = {9: "HTTP/0.9", 10: "HTTP/1.0", 11: "HTTP/1.1", 20: "HTTP/2", 30: "HTTP/3"}
+
+logger = logging.getLogger(__name__)
+
+
+def pool_size(host: str) -> int:
+    return HOST_POOL_SIZES.get(host, POOL_MAXSIZE)
+
+
+def configure_pools(session: requests.Session, size: int, block: bool = POOL_BLOCK) -> None:
+    """
+    Set the number of keep-alive connections every adapter of a session keeps per host
+
+    The pool managers are rebuilt through the adapters' own init_poolmanager, so
+    cloudscraper's adapter keeps its TLS context. With block=False a burst beyond size
+    opens extra connections that are closed after use instead of waiting for a free one.
+    """
+    for adapter in session.adapters.values():
+        if isinstance(adapter, requests.adapters.HTTPAdapter):
+            adapter.poolmanager.clear()
+            adapter.init_poolmanager(adapter._pool_connections, size, block=block)
+
+
+def connection_label(response: requests.Response) -> Optional[str]:
+    """Local port of the connection a streamed response arrives on, which tells keep-alive connections apart"""
+    connection = getattr(response.raw, 'connection', None)
+    sock = getattr(connection, 'sock', None)
+    if sock is None:
+        return None
+    try:
+        return str(sock.getsockname()[1])
+    except OSError:
+        return None
+
+
+def read_body(response: requests.Response, on_text: Optional[Callable[[str], None]] = None) -> bytes:
+    """
+    Read a response sent with stream=True, decompressing and decoding it chunk by chunk
+
+    Each chunk is decompressed as it arrives, and when on_text is given it is also
+    decoded and passed on straight away, so a caller can start on the page before the
+    rest has been received. The body is kept on the response afterwards, so content
+    and text work as usual. Bytes on the wire, decoded bytes, time to the first byte
+    and total time are recorded per connection in metrics.
+
+    Raises:
+        requests.RequestException: The connection broke or the body could not be decompressed
+    """
+    if response._content_consumed:
+        # Already read, by a Cloudflare challenge check or a caller that did not stream
+        if on_text is not None:
+            on_text(response.text)
+        return response.content
+
+    label = connection_label(response)
+    protocol = HTTP_VERSIONS.get(getattr(response.raw, 'version', None), "unknown")
+    if response.encoding is None:
+        response.encoding = DEFAULT_ENCODING
+    decoder = codecs.getincrementaldecoder(response.encoding)(errors='replace') if on_text is not None else None
+
+    started = time.perf_counter()
+    chunks = []
+    for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+        chunks.append(chunk)
+        if decoder is not None:
+            text = decoder.decode(chunk)
+            if text:
+                on_text(text)
+    if decoder is not None:
+        text = decoder.decode(b"", final=True)
+        if text:
+            on_text(text)
+    response._content = b"".join(chunks)
+
+    if label is not None:
+        wire_bytes = response.raw.tell() if hasattr(response.raw, 'tell') else len(response._content)
+        metrics.observe_connection(urlsplit(response.url).netloc, label, protocol, wire_bytes,
+                                   len(response._content), response.elapsed.total_seconds(),
+                                   response.elapsed.total_seconds() + time.perf_counter() - started)
+    return response._content
+
+
+def stream_get(scraper: Any, url: str, on_text: Optional[Callable[[str], None]] = None,
+               **kwargs: Any) -> requests.Response:
+    """GET a URL as a stream and read its body with read_body, returning the complete response"""
+    response = scraper.get(url, stream=True, **kwargs)
+    try:
+        read_body(response, on_text)
+    finally:
+        response.close()
+    return response
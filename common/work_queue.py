@@ -0,0 +1,327 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.common import (DEFAULT_REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND, MAX_RETRIES, MIN_REQUESTS_PER_SECOND,
+                           RATE_DECREASE_FACTOR, RATE_INCREASE_STEP, SUCCESSES_BEFORE_SPEEDUP, HostRateLimiter)
+
+# Configuration constants - can be overridden when importing
+WORK_QUEUE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'crawl', 'work_queue.db')
+LEASE_TIMEOUT = 120.0
+BUSY_TIMEOUT = 60.0
+
+# Task kinds: a listing page (url is the listing template) and a job detail page
+TASK_KINDS = ("page", "detail")
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+    PRAGMA journal_mode = WAL;
+    PRAGMA synchronous = NORMAL;
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        site TEXT NOT NULL,
+        key TEXT NOT NULL,
+        url TEXT NOT NULL,
+        page INTEGER NOT NULL DEFAULT 0,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        generation INTEGER NOT NULL DEFAULT 0,
+        not_before REAL NOT NULL DEFAULT 0,
+        lease_owner TEXT,
+        lease_expires REAL,
+        error TEXT,
+        UNIQUE (kind, key, url, page)
+    );
+    CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (state, not_before);
+    CREATE TABLE IF NOT EXISTS results (
+        task_id INTEGER NOT NULL,
+        generation INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        site TEXT NOT NULL,
+        key TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        worker TEXT NOT NULL,
+        finished_at REAL NOT NULL,
+        collected INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (task_id, generation)
+    );
+    CREATE INDEX IF NOT EXISTS results_uncollected ON results (collected, finished_at);
+    CREATE TABLE IF NOT EXISTS host_budgets (
+        host TEXT PRIMARY KEY,
+        rate REAL NOT NULL,
+        next_at REAL NOT NULL,
+        successes INTEGER NOT NULL DEFAULT 0
+    );
+"""
+
+
+def worker_name() -> str:
+    """A lease owner name unique across the machines sharing a queue"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open the queue database in autocommit mode; transactions are started explicitly"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+@contextmanager
+def immediate(connection: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """A write transaction taken up front, so concurrent read-modify-writes serialise"""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+class Task:
+    """A leased row of the work queue"""
+
+    def __init__(self, task_id: int, kind: str, site: str, key: str, url: str, page: int, generation: int,
+                 attempts: int):
+        self.id = task_id
+        self.kind = kind
+        self.site = site
+        self.key = key
+        self.url = url
+        self.page = page
+        self.generation = generation
+        self.attempts = attempts
+
+    @property
+    def target(self) -> str:
+        """The URL to fetch"""
+        return self.url.format(page=self.page) if self.kind == "page" else self.url
+
+    def __repr__(self) -> str:
+        return f"{self.kind} {self.key} page {self.page}" if self.kind == "page" else f"{self.kind} {self.url}"
+
+
+class WorkQueue:
+    """
+    Crawl tasks shared by worker processes on one or more machines, in a SQLite database
+
+    Workers lease tasks: leasing marks a pending task with the worker's name and a
+    deadline lease_timeout seconds away, in one IMMEDIATE transaction so no two workers
+    get the same task. A worker that dies simply stops renewing anything; once the
+    deadline passes the task can be leased again. Failed attempts go back to pending
+    with a not_before time, the shared equivalent of the retry scheduler, until
+    max_attempts have been made.
+
+    Results are stored in the results table keyed by task and generation (the run the
+    task was queued for), so a task finished twice - its lease ran out while the first
+    worker was still busy - yields one result. A single collector drains them into the
+    frontier and the output sinks and marks them collected.
+
+    Machines can share the database over a network filesystem with working POSIX locks.
+
+    Usage:
+        with WorkQueue() as work:
+            work.enqueue([("page", "topcv", "topcv", url, page) for page in range(1, 11)])
+    """
+
+    def __init__(self, path: str = WORK_QUEUE_PATH, lease_timeout: float = LEASE_TIMEOUT,
+                 max_attempts: int = MAX_RETRIES):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self._connection = connect(path)
+
+    def enqueue(self, tasks: Iterable[Tuple[str, str, str, str, int]]) -> int:
+        """
+        Add (kind, site, key, url, page) tasks; tasks already queued are left alone and
+        finished ones are made pending again for a new run
+
+        Returns:
+            Number of tasks added or reset
+        """
+        rows = list(tasks)
+        with immediate(self._connection):
+            before = self._connection.total_changes
+            self._connection.executemany("""
+                INSERT INTO tasks (kind, site, key, url, page) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (kind, key, url, page) DO UPDATE
+                SET state = 'pending', attempts = 0, not_before = 0, error = NULL, generation = generation + 1
+                WHERE state IN ('done', 'failed')
+            """, rows)
+            changed = self._connection.total_changes - before
+            self._connection.execute("""
+                DELETE FROM results WHERE collected = 1
+                AND generation < (SELECT generation FROM tasks WHERE tasks.id = results.task_id)
+            """)
+            return changed
+
+    def lease(self, owner: str, limit: int = 1) -> List[Task]:
+        """Lease up to limit tasks that are due, taking over tasks whose lease has run out"""
+        now = time.time()
+        with immediate(self._connection):
+            # A task whose every lease ran out keeps killing or hanging its workers
+            self._connection.execute("""
+                UPDATE tasks SET state = 'failed', lease_owner = NULL, error = 'lease expired on every attempt'
+                WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?
+            """, (now, self.max_attempts))
+            rows = self._connection.execute("""
+                SELECT id, kind, site, key, url, page, generation, attempts FROM tasks
+                WHERE (state = 'pending' AND not_before <= ?) OR (state = 'leased' AND lease_expires < ?)
+                ORDER BY not_before, id LIMIT ?
+            """, (now, now, limit)).fetchall()
+            self._connection.executemany("""
+                UPDATE tasks SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE id = ?
+            """, [(owner, now + self.lease_timeout, row[0]) for row in rows])
+        return [Task(*row[:7], row[7] + 1) for row in rows]
+
+    def complete(self, task: Task, owner: str, result: Any) -> None:
+        """Store the result of a task and mark it done"""
+        with immediate(self._connection):
+            self._connection.execute("""
+                INSERT OR IGNORE INTO results (task_id, generation, kind, site, key, page, payload, worker,
+                                               finished_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (task.id, task.generation, task.kind, task.site, task.key, task.page,
+                  json.dumps(result, ensure_ascii=False), owner, time.time()))
+            self._connection.execute("UPDATE tasks SET state = 'done', lease_owner = NULL, error = NULL WHERE id = ?",
+                                     (task.id,))
+
+    def retry(self, task: Task, owner: str, error: str, delay: float) -> bool:
+        """
+        Put a task back for another attempt in delay seconds
+
+        Returns:
+            False when the task has used up its attempts and was marked failed instead
+        """
+        if task.attempts >= self.max_attempts:
+            self.fail(task, owner, error)
+            return False
+        with immediate(self._connection):
+            self._connection.execute("""
+                UPDATE tasks SET state = 'pending', not_before = ?, lease_owner = NULL, error = ?
+                WHERE id = ? AND lease_owner = ?
+            """, (time.time() + delay, error, task.id, owner))
+        return True
+
+    def fail(self, task: Task, owner: str, error: str) -> None:
+        with immediate(self._connection):
+            self._connection.execute("""
+                UPDATE tasks SET state = 'failed', lease_owner = NULL, error = ? WHERE id = ? AND lease_owner = ?
+            """, (error, task.id, owner))
+
+    def results(self, limit: int = 500) -> List[Tuple[int, str, str, str, int, Any]]:
+        """The oldest uncollected (receipt, kind, site, key, page, result) rows"""
+        rows = self._connection.execute("""
+            SELECT rowid, kind, site, key, page, payload FROM results WHERE collected = 0
+            ORDER BY finished_at LIMIT ?
+        """, (limit,)).fetchall()
+        return [(*row[:5], json.loads(row[5])) for row in rows]
+
+    def acknowledge(self, receipts: List[int]) -> None:
+        """Mark results as collected; they are kept until the next run to reject late duplicates"""
+        with immediate(self._connection):
+            self._connection.executemany("UPDATE results SET collected = 1, payload = '' WHERE rowid = ?",
+                                         [(receipt,) for receipt in receipts])
+
+    def counts(self) -> Dict[str, int]:
+        """Number of tasks per state, plus uncollected results"""
+        counts = {state: 0 for state in ("pending", "leased", "done", "failed")}
+        counts.update(self._connection.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+        counts["results"] = self._connection.execute("SELECT COUNT(*) FROM results WHERE collected = 0").fetchone()[0]
+        return counts
+
+    def drained(self) -> bool:
+        """True when no task is pending or leased"""
+        return self._connection.execute(
+            "SELECT NOT EXISTS (SELECT 1 FROM tasks WHERE state IN ('pending', 'leased'))").fetchone()[0] == 1
+
+    def next_due(self) -> Optional[float]:
+        """Seconds until the next pending task or expired lease can be leased, None when there is none"""
+        due = self._connection.execute("""
+            SELECT MIN(CASE state WHEN 'pending' THEN not_before ELSE lease_expires END) FROM tasks
+            WHERE state IN ('pending', 'leased')
+        """).fetchone()[0]
+        return None if due is None else max(0.0, due - time.time())
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "WorkQueue":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class SharedRateLimiter(HostRateLimiter):
+    """
+    HostRateLimiter whose per-host budgets live in the work queue database
+
+    Every worker on every machine draws its request slots for a host from the same row:
+    a reservation takes the host's next free slot and moves it 1/rate seconds on, so the
+    host sees at most rate requests per second whatever the number of workers. Throttles
+    and successes adjust that shared rate the same way HostRateLimiter does locally.
+    Slots are wall-clock times, so the machines' clocks must be in sync.
+    """
+
+    def __init__(self, path: str = WORK_QUEUE_PATH, default_rate: float = DEFAULT_REQUESTS_PER_SECOND,
+                 min_rate: float = MIN_REQUESTS_PER_SECOND, max_rate: float = MAX_REQUESTS_PER_SECOND,
+                 host_rates: Optional[Dict[str, float]] = None):
+        super().__init__(default_rate, min_rate, max_rate, host_rates=host_rates)
+        self.path = path
+        self._shared = connect(path)
+
+    def _row(self, host: str) -> Tuple[float, float, int]:
+        row = self._shared.execute("SELECT rate, next_at, successes FROM host_budgets WHERE host = ?",
+                                   (host,)).fetchone()
+        if row is None:
+            row = (self.host_rates.get(host, self.default_rate), 0.0, 0)
+            self._shared.execute("INSERT INTO host_budgets (host, rate, next_at, successes) VALUES (?, ?, ?, ?)",
+                                 (host, *row))
+        return row
+
+    def reserve(self, host: str) -> float:
+        with self._lock, immediate(self._shared):
+            rate, next_at, _successes = self._row(host)
+            now = time.time()
+            slot = max(now, next_at)
+            self._shared.execute("UPDATE host_budgets SET next_at = ? WHERE host = ?", (slot + 1.0 / rate, host))
+        return slot - now
+
+    def record_success(self, host: str) -> None:
+        with self._lock, immediate(self._shared):
+            rate, _next_at, successes = self._row(host)
+            successes += 1
+            if successes >= SUCCESSES_BEFORE_SPEEDUP:
+                successes = 0
+                rate = max(rate, min(self.max_rate, rate + RATE_INCREASE_STEP))
+            self._shared.execute("UPDATE host_budgets SET rate = ?, successes = ? WHERE host = ?",
+                                 (rate, successes, host))
+
+    def record_throttle(self, host: str, retry_after: Optional[float] = None) -> None:
+        with self._lock, immediate(self._shared):
+            rate, next_at, _successes = self._row(host)
+            rate = max(self.min_rate, rate * RATE_DECREASE_FACTOR)
+            if retry_after:
+                next_at = max(next_at, time.time() + retry_after)
+            self._shared.execute("UPDATE host_budgets SET rate = ?, next_at = ?, successes = 0 WHERE host = ?",
+                                 (rate, next_at, host))
+        logger.warning(f"[{host}] Throttled, shared rate lowered to {rate:.3f} req/s"
+                       + (f", paused for {retry_after:.1f} seconds" if retry_after else ""))
+
+    def rates(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._shared.execute("SELECT host, rate FROM host_budgets").fetchall())
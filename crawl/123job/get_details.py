@@ -0,0 +1,12 @@
+from common.details import merge_fields, parse_job_posting, select_text
+
+
+def extract_job_detail(soup):
+    return merge_fields(parse_job_posting(soup), {
+        "title": select_text(soup, "h1.job-title", "h1"),
+        "company": select_text(soup, ".company-name a", ".company-name", ".company-info .name"),
+        "salary": select_text(soup, ".job-salary", ".salary"),
+        "location": select_text(soup, ".job-location", ".address"),
+        "deadline": select_text(soup, ".job-deadline", ".deadline"),
+        "description": select_text(soup, ".job-description", ".content-group"),
+    })
@@ -0,0 +1,12 @@
+from common.details import merge_fields, parse_job_posting, select_text
+
+
+def extract_job_detail(soup):
+    return merge_fields(parse_job_posting(soup), {
+        "title": select_text(soup, "h1.job-title", "h1"),
+        "company": select_text(soup, ".org-name a", ".org-name", "p.org-name"),
+        "salary": select_text(soup, "#job-salary .text-primary", "#job-salary"),
+        "location": select_text(soup, "#job-location a", "#job-location"),
+        "deadline": select_text(soup, "#job-date .day-expired", "#job-date"),
+        "description": select_text(soup, "#section-job-description", ".job-description"),
+    })
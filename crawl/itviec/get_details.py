@@ -0,0 +1,12 @@
+from common.details import merge_fields, parse_job_posting, select_text
+
+
+def extract_job_detail(soup):
+    return merge_fields(parse_job_posting(soup), {
+        "title": select_text(soup, "h1.ipt-xl-6", "h1"),
+        "company": select_text(soup, ".employer-name", "div.employer-long-overview__name"),
+        "salary": select_text(soup, ".salary .ips-2", ".salary"),
+        "location": select_text(soup, ".job-show-header .normal-text.text-rich-grey"),
+        "deadline": None,
+        "description": select_text(soup, ".job-description", ".imy-5.paragraph"),
+    })
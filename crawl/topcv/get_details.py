@@ -0,0 +1,15 @@
+from common.details import merge_fields, parse_job_posting, select_text
+
+
+def extract_job_detail(soup):
+    return merge_fields(parse_job_posting(soup), {
+        "title": select_text(soup, "h1.job-detail__info--title", "h2.premium-job-basic-information__content--title",
+                             "h1"),
+        "company": select_text(soup, ".company-name-label a", ".job-detail__company--information-item.company-name",
+                               "h2.company-name-label"),
+        "salary": select_text(soup, ".job-detail__info--section-content-value"),
+        "location": select_text(soup, ".job-detail__info--section.section-location "
+                                      ".job-detail__info--section-content-value"),
+        "deadline": select_text(soup, ".job-detail__info--deadline", ".job-detail__information-detail--actions-label"),
+        "description": select_text(soup, ".job-description", ".job-detail__information-detail--content"),
+    })
@@ -0,0 +1,47 @@
+import argparse
+import logging
+import sys
+from typing import List, Optional
+
+from common.async_crawler import add_crawl_arguments, build_sites, export_job_urls, open_frontier, run_crawl
+from common.registry import registered_sites
+from common.sinks import open_sink_from_args
+from common.sites import job_urls_path
+from common.startup import configure_logging, startup
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Crawl the listing pages of one or more sites at once")
+    parser.add_argument('sites', nargs='*', help="sites to crawl (default: every site in common/registry.py)")
+    args = add_crawl_arguments(parser).parse_args(argv)
+
+    names = args.sites or registered_sites()
+    unknown = [name for name in names if name not in registered_sites()]
+    if unknown:
+        logger.error(f"No site spec for: {', '.join(unknown)}")
+        sys.exit(1)
+
+    outputs = {name: job_urls_path(name) for name in names}
+    sink = open_sink_from_args(args, "listings")
+    with startup.stage("open frontier"):
+        frontier = open_frontier(outputs, index_kind=args.seen_index)
+    with frontier:
+        on_page = sink.add_page if sink is not None else None
+        with startup.stage("build sites"):
+            sites = [site for name in names for site in build_sites(name, frontier, args, on_page)]
+        try:
+            run_crawl(sites, args)
+        finally:
+            for scraper in {id(site.scraper): site.scraper for site in sites}.values():
+                scraper.close()
+            if sink is not None:
+                sink.close()
+                logger.info(f"Streamed {sink.written} listing records to the {args.sink} sink")
+        export_job_urls(frontier, outputs)
+
+
+if __name__ == '__main__':
+    configure_logging()
+    main()
@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import sys
+from typing import List, Optional
+
+from common.async_crawler import (add_cache_arguments, add_metrics_arguments, finish_metrics, open_cache, open_frontier,
+                                  start_metrics)
+from common.dedupe import DEDUPE_PATH, DuplicateIndex
+from common.details import DETAIL_RECORD_FIELDS, PARSE_WORKERS, DetailPipeline, JsonlWriter, interleave
+from common.recrawl import RECRAWL_PATH, RecrawlStore
+from common.sessions import SessionPool
+from common.sinks import add_sink_arguments, open_sink_from_args
+from common.sites import CRAWL_DIR, available_sites, job_urls_path
+from common.startup import configure_logging, startup
+from websites import websites
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fetch and parse the job detail pages collected in the frontier")
+    parser.add_argument('sites', nargs='*', help="sites to fetch (default: every site with a detail extractor)")
+    parser.add_argument('--limit', type=int, help="fetch at most this many jobs per site")
+    parser.add_argument('--recrawl', action='store_true',
+                        help="revisit the fetched jobs whose next check is due instead of fetching new ones")
+    parser.add_argument('--all', action='store_true', help="fetch every job in the frontier, even ones fetched before")
+    parser.add_argument('--recrawl-db', default=RECRAWL_PATH, help="content hashes and re-crawl schedule of the jobs")
+    parser.add_argument('--dedupe', action='store_true',
+                        help="cluster near-duplicate postings across sites and tag records with their cluster_id")
+    parser.add_argument('--dedupe-db', default=DEDUPE_PATH, help="duplicate index database")
+    parser.add_argument('--parse-workers', type=int, default=PARSE_WORKERS, help="size of the parsing pool")
+    parser.add_argument('--processes', action='store_true', help="parse in a process pool instead of threads")
+    parser.add_argument('--output', default=os.path.join(CRAWL_DIR, 'job_details.jsonl'),
+                        help="JSON Lines file the records are appended to, unless --sink is given")
+    args = add_sink_arguments(add_metrics_arguments(add_cache_arguments(parser))).parse_args(argv)
+
+    names = args.sites or available_sites('get_details.py')
+    unknown = [name for name in names if name not in available_sites('get_details.py')]
+    if unknown:
+        logger.error(f"No detail extractor for: {', '.join(unknown)}")
+        sys.exit(1)
+
+    scrapers = {name: SessionPool(websites[name]) for name in names}
+    cache = open_cache(args)
+    recrawl = RecrawlStore(args.recrawl_db)
+    pipeline = DetailPipeline(scrapers, parse_workers=args.parse_workers, use_processes=args.processes, cache=cache,
+                              recrawl=recrawl)
+
+    writer = open_sink_from_args(args, "details", DETAIL_RECORD_FIELDS) or JsonlWriter(args.output)
+    duplicates = DuplicateIndex(args.dedupe_db) if args.dedupe else None
+    on_record = (lambda record: writer(duplicates.tag(record))) if duplicates is not None else writer
+    with startup.stage("open frontier"):
+        frontier = open_frontier({name: job_urls_path(name) for name in names})
+    with frontier, writer, recrawl:
+        if args.recrawl:
+            sources = {name: recrawl.due(name, args.limit) for name in names}
+            for name in names:
+                logger.info(f"[{name}] {len(sources[name])} of {recrawl.counts(name)['live']} live jobs are due")
+        elif args.all:
+            sources = {name: itertools.islice(frontier.urls(name), args.limit) for name in names}
+        else:
+            sources = {name: itertools.islice((url for url in frontier.urls(name) if not recrawl.knows(name, url)),
+                                              args.limit)
+                       for name in names}
+        server = start_metrics(args)
+        try:
+            asyncio.run(pipeline.run(interleave(sources), on_record))
+        finally:
+            for scraper in scrapers.values():
+                scraper.close()
+            if duplicates is not None:
+                logger.info(f"Duplicate index: {duplicates.stats()}")
+                duplicates.close()
+            finish_metrics(args, server)
+    if cache is not None:
+        cache.close()
+
+
+if __name__ == '__main__':
+    configure_logging()
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import List, Optional
+
+from common.async_crawler import export_job_urls, open_frontier
+from common.details import DETAIL_RECORD_FIELDS, JsonlWriter
+from common.distributed import QUEUE_POLL_INTERVAL, QueueWorker, collect, detail_tasks, discover_listings, run_local
+from common.parsing import BACKENDS, PARSER_BACKEND
+from common.registry import registered_sites
+from common.sinks import add_sink_arguments, open_sink_from_args
+from common.sites import CRAWL_DIR, available_sites, job_urls_path
+from common.startup import configure_logging
+from common.work_queue import WORK_QUEUE_PATH, SharedRateLimiter, WorkQueue
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(args: argparse.Namespace, names: list) -> None:
+    with WorkQueue(args.queue) as queue:
+        if args.details:
+            with open_frontier({name: job_urls_path(name) for name in names}) as frontier:
+                tasks = detail_tasks(frontier, names, args.limit)
+        else:
+            tasks = discover_listings(names, args.parser, SharedRateLimiter(args.queue))
+        logger.info(f"Queued {queue.enqueue(tasks)} of {len(tasks)} tasks")
+
+
+def collect_results(args: argparse.Namespace, names: list, run=None) -> None:
+    """Collect results into the frontier and sinks, running local workers first when run is given"""
+    outputs = {name: job_urls_path(name) for name in names}
+    listing_sink = open_sink_from_args(args, "listings")
+    on_page = listing_sink.add_page if listing_sink is not None else None
+    detail_sink = None
+
+    def on_record(record: dict) -> None:
+        # Opened on the first detail result, so listing runs leave no empty details file behind
+        nonlocal detail_sink
+        if detail_sink is None:
+            detail_sink = open_sink_from_args(args, "details", DETAIL_RECORD_FIELDS) or JsonlWriter(args.details_output)
+        detail_sink(record)
+
+    try:
+        with open_frontier(outputs) as frontier:
+            if run is not None:
+                run(frontier, on_page, on_record)
+            else:
+                with WorkQueue(args.queue) as queue:
+                    while True:
+                        collected = collect(queue, frontier, on_page, on_record)
+                        logger.info(f"Collected {collected} results, queue: {queue.counts()}")
+                        if not args.follow or (queue.drained() and not queue.counts()["results"]):
+                            break
+                        time.sleep(QUEUE_POLL_INTERVAL)
+            export_job_urls(frontier, outputs)
+    finally:
+        if listing_sink is not None:
+            listing_sink.close()
+        if detail_sink is not None:
+            detail_sink.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Crawl through a work queue shared by workers on several machines")
+    parser.add_argument('command', choices=("enqueue", "worker", "collect", "run", "status"),
+                        help="enqueue tasks, run a worker, collect results into the frontier, "
+                             "do all three on this machine, or show the queue")
+    parser.add_argument('sites', nargs='*', help="sites to enqueue or collect (default: every registered site)")
+    parser.add_argument('--queue', default=WORK_QUEUE_PATH, help="work queue database shared by every worker")
+    parser.add_argument('--details', action='store_true',
+                        help="enqueue the detail pages of the jobs in the frontier instead of listing pages")
+    parser.add_argument('--limit', type=int, help="enqueue at most this many detail pages per site")
+    parser.add_argument('--workers', type=int, default=4, help="worker processes started by run")
+    parser.add_argument('--follow', action='store_true',
+                        help="worker: keep polling for new tasks; collect: keep collecting until the queue is drained")
+    parser.add_argument('--parser', choices=BACKENDS, default=PARSER_BACKEND, help="HTML parser backend")
+    parser.add_argument('--details-output', default=os.path.join(CRAWL_DIR, 'job_details.jsonl'),
+                        help="JSON Lines file detail records are appended to, unless --sink is given")
+    args = add_sink_arguments(parser).parse_args(argv)
+
+    known = available_sites('get_details.py') if args.details else registered_sites()
+    names = args.sites or known
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        logger.error(f"Cannot crawl: {', '.join(unknown)}")
+        sys.exit(1)
+
+    if args.command == "status":
+        with WorkQueue(args.queue) as queue:
+            logger.info(f"Queue {args.queue}: {queue.counts()}, shared rates {SharedRateLimiter(args.queue).rates()}")
+    elif args.command == "enqueue":
+        enqueue(args, names)
+    elif args.command == "worker":
+        QueueWorker(args.queue, backend=args.parser, follow=args.follow).run()
+    elif args.command == "collect":
+        collect_results(args, names)
+    else:
+        enqueue(args, names)
+        collect_results(args, names, lambda frontier, on_page, on_record: run_local(
+            args.queue, args.workers, frontier, args.parser, on_page, on_record))
+
+
+if __name__ == '__main__':
+    configure_logging()
+    main()
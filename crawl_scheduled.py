@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from common.async_crawler import (AsyncCrawler, SiteCrawl, add_crawl_arguments, build_sites, export_job_urls,
+                                  finish_metrics, open_cache, open_frontier, start_metrics)
+from common.common import HostRateLimiter
+from common.metrics import metrics
+from common.parsing import ParsePool
+from common.registry import registered_sites
+from common.scheduler import CRAWL_WINDOW, PLAN_HEADER, SCHEDULE_PATH, CrawlSchedule, SitePlan, crawl_within
+from common.sinks import open_sink_from_args
+from common.sites import job_urls_path
+from common.startup import configure_logging, startup
+from websites import websites
+
+logger = logging.getLogger(__name__)
+
+
+def log_plan(plans: List[SitePlan]) -> None:
+    lines = [PLAN_HEADER] + [plan.describe() for plan in plans]
+    logger.info("Crawl plan, highest priority first:\n" + "\n".join(lines))
+
+
+def record_run(schedule: CrawlSchedule, plans: List[SitePlan], sites: List[SiteCrawl], cut: set,
+               started_at: datetime, limiter: HostRateLimiter) -> None:
+    """Store what every site of the run yielded, and the rates its hosts ended at"""
+    snapshot = metrics.snapshot()
+    for plan in plans:
+        partitions = [site for site in sites if site.name == plan.site]
+        requests = sum(snapshot["hosts"].get(plan.host, {}).get("requests", {}).values())
+        job_urls = snapshot["sites"].get(plan.site, {}).get("job_urls", 0)
+        schedule.record_run(plan.site, started_at, sum(site.pages_done for site in partitions), requests,
+                            job_urls, sum(site.urls_found for site in partitions),
+                            complete=not any(site.key in cut or site.aborted for site in partitions))
+    schedule.record_rates(limiter.rates())
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Crawl every site at once within a time window, the pages most likely to hold new jobs first")
+    parser.add_argument('sites', nargs='*', help="sites to plan (default: every site in common/registry.py)")
+    parser.add_argument('--window', type=float, default=CRAWL_WINDOW / 60, metavar='MINUTES',
+                        help="stop handing out pages after this many minutes")
+    parser.add_argument('--all', action='store_true', help="also crawl the sites that are not due")
+    parser.add_argument('--plan', action='store_true', help="show the plan and exit without crawling")
+    parser.add_argument('--schedule-db', default=SCHEDULE_PATH, help="run history and host rates")
+    args = add_crawl_arguments(parser).parse_args(argv)
+    if args.shards or args.resume:
+        parser.error("--shards and --resume do not apply to scheduled crawls")
+
+    names = args.sites or registered_sites()
+    unknown = [name for name in names if name not in registered_sites()]
+    if unknown:
+        parser.error(f"No site spec for: {', '.join(unknown)}")
+    if not args.sites:
+        skipped = [name for name in websites if name not in names]
+        if skipped:
+            logger.info(f"Not crawlable yet (no site spec): {', '.join(skipped)}")
+
+    with CrawlSchedule(args.schedule_db) as schedule:
+        limiter = HostRateLimiter(host_rates=schedule.host_rates())
+        plans = schedule.plan(names, limiter)
+        log_plan(plans)
+        plans = [plan for plan in plans if plan.due or args.all]
+        if args.plan or not plans:
+            return
+
+        by_site: Dict[str, SitePlan] = {plan.site: plan for plan in plans}
+        outputs = {plan.site: job_urls_path(plan.site) for plan in plans}
+        # Listings are crawled down to their known jobs only
+        args.incremental = True
+        sink = open_sink_from_args(args, "listings")
+        with startup.stage("open frontier"):
+            frontier = open_frontier(outputs, index_kind=args.seen_index)
+        with frontier:
+            on_page = sink.add_page if sink is not None else None
+            with startup.stage("build sites"):
+                sites = [site for plan in plans for site in build_sites(plan.site, frontier, args, on_page)]
+            for site in sites:
+                site.known_pages = by_site[site.name].known_pages
+            crawler = AsyncCrawler(limiter=limiter, parse_pool=ParsePool(use_processes=args.parse_processes),
+                                   cache=open_cache(args),
+                                   priority=lambda site, page: by_site[site.name].page_priority(page))
+
+            started_at = datetime.now(timezone.utc)
+            server = start_metrics(args)
+            try:
+                cut = asyncio.run(crawl_within(crawler, sites, args.window * 60))
+                record_run(schedule, plans, sites, cut, started_at, limiter)
+            finally:
+                finish_metrics(args, server)
+                for scraper in {id(site.scraper): site.scraper for site in sites}.values():
+                    scraper.close()
+                if sink is not None:
+                    sink.close()
+                    logger.info(f"Streamed {sink.written} listing records to the {args.sink} sink")
+            export_job_urls(frontier, outputs)
+
+
+if __name__ == '__main__':
+    configure_logging()
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import importlib
+import logging
+import sys
+from typing import List, Optional
+
+from common.startup import configure_logging, startup
+
+# Subcommand: (script module, description). Scripts are imported only when their command runs.
+COMMANDS = {
+    "listings": ("crawl_all", "crawl the listing pages of one or more sites"),
+    "details": ("crawl_details", "fetch and parse job detail pages, or re-crawl the due ones"),
+    "distributed": ("crawl_distributed", "crawl through the shared work queue"),
+    "scheduled": ("crawl_scheduled", "crawl every due site within a time window, by expected new jobs"),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def list_sites() -> None:
+    from common.registry import registered_sites
+    from common.sites import available_sites
+
+    with_details = set(available_sites('get_details.py'))
+    for name in registered_sites():
+        print(f"{name}{'  (details)' if name in with_details else ''}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    commands = "\n".join(f"  {name:<12} {description}" for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        description="Single entry point of the crawlers",
+        epilog=f"commands:\n{commands}\n  {'sites':<12} list the sites that can be crawled\n\n"
+               f"Options after the command go to it, see <command> --help.",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=list(COMMANDS) + ["sites"], metavar='command',
+                        help="one of the commands below")
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="log where the time before the first request went")
+    parser.add_argument('--quiet', action='store_true', help="log warnings and errors only")
+    args = parser.parse_args(argv)
+
+    configure_logging(logging.WARNING if args.quiet else logging.INFO)
+    if args.command == "sites":
+        list_sites()
+        return 0
+
+    script, _ = COMMANDS[args.command]
+    with startup.stage(f"import {script}"):
+        module = importlib.import_module(script)
+    try:
+        module.main(args.arguments)
+    finally:
+        if args.profile_startup:
+            logger.warning(startup.report())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+import pytest
+import requests
+
+from common.async_crawler import KNOWN_PAGES_BEFORE_STOP, PER_HOST_CONCURRENCY, AsyncCrawler, SiteCrawl
+from common.common import HostRateLimiter, RetryConfig
+from common.frontier import Frontier
+from common.parsing import ListingParser
+from common.standin_server import JOBS_PER_PAGE, StandinServer, render_listing_page
+
+# Fast enough that the tests take about a second, slow enough to tell pacing apart
+FAST_RATE = 100.0
+PACED_RATE = 5.0
+
+
+class FaultyServer(StandinServer):
+    """Stand-in that answers its first requests with the given statuses, then serves normally"""
+
+    def __init__(self, faults: List[int], **kwargs):
+        super().__init__(**kwargs)
+        self.faults = list(faults)
+        self.arrivals: List[float] = []
+
+    def _draw_fault(self) -> Tuple[float, Optional[int]]:
+        with self._lock:
+            self.arrivals.append(time.monotonic())
+            if self.faults:
+                status = self.faults.pop(0)
+                if status == 429:
+                    self.throttled += 1
+                else:
+                    self.errors += 1
+                return 0.0, status
+            return 0.0, None
+
+
+extract = ListingParser("topcv")
+
+
+def make_site(server: StandinServer, **kwargs) -> SiteCrawl:
+    return SiteCrawl("topcv", server.url + "/?page={page}", extract, requests.Session(),
+                     retry_config=RetryConfig(initial_delay=0), **kwargs)
+
+
+def crawl(sites: List[SiteCrawl], rate: float = FAST_RATE) -> None:
+    limiter = HostRateLimiter(default_rate=rate, max_rate=rate)
+    asyncio.run(AsyncCrawler(limiter=limiter).crawl(sites))
+
+
+def test_stops_at_first_404():
+    with StandinServer(pages=5) as server:
+        site = make_site(server)
+        crawl([site])
+
+    assert site.end_page == 5
+    assert site.pages_done == 5
+    assert site.urls_found == 5 * JOBS_PER_PAGE
+    assert not site.failed_pages
+    # Only the pages in flight when the 404 came back are requested past the end
+    assert server.requests_served <= 5 + PER_HOST_CONCURRENCY
+
+
+def test_retries_throttled_and_failed_pages():
+    with FaultyServer([429, 502, 502], pages=4, retry_after=0) as server:
+        site = make_site(server)
+        crawl([site])
+
+    assert server.throttled == 1
+    assert server.errors == 2
+    assert site.pages_done == 4
+    assert site.urls_found == 4 * JOBS_PER_PAGE
+    assert not site.failed_pages
+
+
+def test_paces_each_host_on_its_own():
+    with FaultyServer([], pages=4) as first, FaultyServer([], pages=4) as second:
+        sites = [make_site(first), make_site(second)]
+        started = time.monotonic()
+        crawl(sites, PACED_RATE)
+        elapsed = time.monotonic() - started
+
+    for server in (first, second):
+        requests_made = len(server.arrivals)
+        span = server.arrivals[-1] - server.arrivals[0]
+        assert span >= (requests_made - 1) / PACED_RATE * 0.9
+    # The hosts are paced side by side, not one after the other
+    slowest = max(len(server.arrivals) for server in (first, second))
+    assert elapsed < (len(first.arrivals) + len(second.arrivals) - 1) / PACED_RATE
+    assert elapsed >= (slowest - 1) / PACED_RATE * 0.9
+
+
+def test_page_that_does_not_parse_fails_on_its_own():
+    def extract_or_fail(html: str) -> List[str]:
+        job_urls = extract(html)
+        if any("/3000.html" in url for url in job_urls):
+            raise AttributeError("'NoneType' object has no attribute 'get'")
+        return job_urls
+
+    with StandinServer(pages=5) as server:
+        site = make_site(server)
+        site.extract = extract_or_fail
+        crawl([site])
+
+    assert site.end_page == 5
+    assert site.failed_pages == {3}
+    assert site.pages_done == 4
+    assert site.urls_found == 4 * JOBS_PER_PAGE
+
+
+@pytest.mark.parametrize("known_pages", [KNOWN_PAGES_BEFORE_STOP, 3])
+def test_incremental_crawl_stops_after_known_pages(tmp_path, known_pages):
+    with Frontier(str(tmp_path / "frontier.db")) as frontier:
+        # A previous run saw everything from page 3 on, the listing grew by two pages since
+        for page in range(3, 21):
+            frontier.add_many("topcv", extract(render_listing_page(page)), page)
+        with StandinServer(pages=20) as server:
+            site = make_site(server, frontier=frontier, incremental=True, known_pages=known_pages)
+            crawl([site])
+
+    assert site.end_page == 2 + known_pages
+    assert site.urls_found == 2 * JOBS_PER_PAGE
+    assert server.requests_served <= site.end_page + PER_HOST_CONCURRENCY
+
+
+def test_known_pages_completing_out_of_order_end_the_listing(tmp_path):
+    with Frontier(str(tmp_path / "frontier.db")) as frontier:
+        site = SiteCrawl("topcv", "http://127.0.0.1/?page={page}", extract, requests.Session(),
+                         frontier=frontier, incremental=True, known_pages=3)
+        # Pages 4 to 6 come back before page 3
+        for page in (4, 5, 6, 3):
+            site.record(page, [])
+    assert site.end_page == 5
@@ -0,0 +1,28 @@
+from common.benchmark import compare, main
+
+
+def parse_results(html_parser, selectolax, job_urls=20):
+    return {"parse": {"topcv/html.parser": {"ms_per_page": html_parser, "job_urls": job_urls},
+                      "topcv/selectolax": {"ms_per_page": selectolax, "job_urls": job_urls}}}
+
+
+def test_parsing_is_compared_relative_to_the_reference_backend():
+    baseline = parse_results(60.0, 3.0)
+    # A machine twice as slow is not a regression
+    assert compare(parse_results(120.0, 6.0), baseline) == []
+    [regression] = compare(parse_results(60.0, 6.0), baseline)
+    assert regression.startswith("parse topcv/selectolax: 0.10x")
+    assert len(compare(parse_results(60.0, 3.0, job_urls=19), baseline)) == 2
+
+
+def test_crawl_throughput_drop_is_a_regression():
+    baseline = {"crawl": {"8x4": {"pages_per_second": 40.0}}}
+    assert compare({"crawl": {"8x4": {"pages_per_second": 35.0}}}, baseline) == []
+    assert compare({"crawl": {"8x4": {"pages_per_second": 20.0}}}, baseline)
+
+
+def test_baseline_is_only_compared_when_asked_for(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text('{"parse": {"topcv/html.parser": {"ms_per_page": 1.0, "job_urls": 0}}}', encoding="utf-8")
+    assert main(["topcv", "--skip-crawl", "--repeats", "1"]) == 0
+    assert main(["topcv", "--skip-crawl", "--repeats", "1", "--baseline", str(baseline)]) == 1
@@ -0,0 +1,94 @@
+import os
+
+import pytest
+import requests
+
+from common import cache as cache_module
+from common.cache import ResponseCache
+from common.common import fetch_with_retry
+from common.standin_server import StandinServer
+
+
+class Clock:
+    """Stands in for the time module in common.cache, so entries age on demand"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def response(body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response._content = body
+    response.headers["Content-Type"] = "text/html; charset=utf-8"
+    return response
+
+
+def test_fresh_pages_are_served_and_stale_ones_revalidated(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache"), ttl=60)
+    session = requests.Session()
+    with StandinServer(pages=1) as server:
+        url = server.url + "/?page=1"
+        first = fetch_with_retry(session, url, cache=cache)
+        assert fetch_with_retry(session, url, cache=cache).text == first.text
+        assert server.requests_served == 1
+
+        clock.now += 61
+        revalidated = fetch_with_retry(session, url, cache=cache)
+        assert server.not_modified == 1
+        assert revalidated.text == first.text
+        # The 304 made the entry fresh again
+        assert cache.is_fresh(cache.lookup(url))
+        assert (cache.hits, cache.revalidated, cache.misses) == (1, 1, 1)
+    cache.close()
+
+
+def test_evicted_body_is_fetched_again_after_a_304(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache"), ttl=60)
+    session = requests.Session()
+    with StandinServer(pages=1) as server:
+        url = server.url + "/?page=1"
+        first = fetch_with_retry(session, url, cache=cache)
+        clock.now += 61
+        entry = cache.lookup(url)
+        os.remove(cache._blob_path(entry.key))
+
+        again = fetch_with_retry(session, url, cache=cache)
+        assert again.text == first.text
+        assert server.not_modified == 1
+        assert server.requests_served == 3
+        assert cache.misses == 2
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    bodies = {name: os.urandom(1000) for name in "abcd"}
+    cache = ResponseCache(str(tmp_path / "cache"), max_bytes=3500)
+    for name in "abc":
+        cache.store(f"https://example.com/{name}", response(bodies[name]))
+        clock.now += 1
+    # Reading a makes b the least recently used
+    assert cache.get("https://example.com/a").content == bodies["a"]
+    clock.now += 1
+    cache.store("https://example.com/d", response(bodies["d"]))
+
+    assert cache.lookup("https://example.com/b") is None
+    for name in "acd":
+        assert cache.get(f"https://example.com/{name}").content == bodies[name]
+    assert cache._total_size <= 3500 * 0.9
+    cache.close()
+
+    # The index and its size survive a restart
+    reopened = ResponseCache(str(tmp_path / "cache"), max_bytes=3500)
+    assert reopened._total_size == cache._total_size
+    reopened.close()
@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from common import checkpoint as checkpoint_module
+from common.async_crawler import SiteCrawl
+from common.checkpoint import Checkpoint
+
+URL = "https://www.topcv.vn/tim-viec-lam-moi-nhat?page={page}"
+
+
+def make_site(directory, resume=False):
+    return SiteCrawl("topcv", URL, None, None, checkpoint=Checkpoint("topcv", resume, str(directory), every=2))
+
+
+def test_interrupted_run_resumes_without_refetching_completed_pages(tmp_path):
+    site = make_site(tmp_path)
+    assert [site.next_page() for _ in range(5)] == [1, 2, 3, 4, 5]
+    site.pages_done = 3
+    for page in (1, 2, 4):
+        site.complete(page)
+    site.fail(3)
+    # Interrupted with page 5 in flight
+    site.finish_checkpoint()
+
+    resumed = make_site(tmp_path, resume=True)
+    assert resumed.checkpoint.run_id == site.checkpoint.run_id
+    assert resumed.pages_done == 3
+    assert [resumed.next_page() for _ in range(3)] == [3, 5, 6]
+
+
+def test_checkpoint_is_saved_every_few_pages_and_cleared_after_a_clean_run(tmp_path):
+    site = make_site(tmp_path)
+    path = site.checkpoint.path
+    site.next_page(), site.next_page()
+    site.complete(1)
+    assert not os.path.exists(path)
+    site.complete(2)
+    with open(path, encoding="utf-8") as file:
+        assert json.load(file)["done_through"] == 2
+
+    site.mark_end(3)
+    assert site.next_page() is None
+    site.finish_checkpoint()
+    assert not os.path.exists(path)
+
+
+def test_failed_save_keeps_the_previous_checkpoint(tmp_path, monkeypatch):
+    checkpoint = Checkpoint("topcv", directory=str(tmp_path))
+    checkpoint.save({"done_through": 4})
+
+    def dump(state, file):
+        file.write('{"done_through": ')
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(checkpoint_module.json, "dump", dump)
+    with pytest.raises(OSError):
+        checkpoint.save({"done_through": 8})
+    monkeypatch.undo()
+
+    assert Checkpoint("topcv", resume=True, directory=str(tmp_path)).state["done_through"] == 4
+    assert os.listdir(tmp_path) == ["topcv.json"]
+
+
+def test_unreadable_checkpoint_starts_a_new_run(tmp_path):
+    (tmp_path / "topcv.json").write_text('{"done_through": ', encoding="utf-8")
+    assert Checkpoint("topcv", resume=True, directory=str(tmp_path)).state is None
@@ -0,0 +1,51 @@
+import pytest
+
+from common.dedupe import DuplicateIndex, normalise_company, normalise_location, normalise_title
+
+
+def posting(site, job_id, title, company, location="Hà Nội"):
+    return {"site": site, "url": f"https://{site}.example/{job_id}", "job_id": job_id, "title": title,
+            "company": company, "location": location}
+
+
+@pytest.fixture
+def index(tmp_path):
+    with DuplicateIndex(str(tmp_path / "duplicates.db")) as index:
+        yield index
+
+
+def test_normalisation():
+    assert normalise_title("[HOT] Tuyển gấp Lập Trình Viên Python - Lương 20 triệu") == \
+        ["lap", "trinh", "vien", "python"]
+    assert normalise_company("CÔNG TY TNHH FPT Software Việt Nam") == ["fpt", "software"]
+    assert normalise_location("Quận 1, TP.HCM") == {"ho-chi-minh"}
+    assert normalise_location("Hà Nội & Đà Nẵng") == {"ha-noi", "da-nang"}
+
+
+def test_clusters_the_same_job_across_sites(index):
+    first = index.add(posting("topcv", "1", "Lập trình viên Python (Django)", "Công ty TNHH FPT Software"))
+    second = index.add(posting("itviec", "a", "Tuyển gấp lập trình viên Python Django", "FPT Software JSC"))
+    third = index.add(posting("careerlink", "9", "Lập Trình Viên Python Django - Lương cao",
+                              "CÔNG TY CỔ PHẦN FPT SOFTWARE", "Hà Nội, Việt Nam"))
+    assert first == second == third
+    assert index.stats() == {"postings": 3, "clusters": 1, "duplicated": 1, "cross_site": 1}
+
+
+def test_keeps_different_jobs_apart(index):
+    python = index.add(posting("topcv", "1", "Lập trình viên Python Django", "Phần mềm FPT"))
+    # Same title at another company, at the same company in another province, and another job
+    assert index.add(posting("itviec", "a", "Lập trình viên Python Django", "Ngân hàng Techcombank")) != python
+    assert index.add(posting("topdev", "b", "Lập trình viên Python Django", "Phần mềm FPT",
+                             "Đà Nẵng")) != python
+    assert index.add(posting("jobsgo", "c", "Kế toán tổng hợp", "Phần mềm FPT")) != python
+    assert index.stats()["clusters"] == 4
+
+
+def test_reindexed_posting_keeps_its_cluster(index):
+    first = index.add(posting("topcv", "1", "Kỹ sư DevOps", "Viettel"))
+    assert index.add(posting("topcv", "1", "Senior DevOps Engineer", "Tập đoàn Viettel")) == first
+    assert index.stats()["postings"] == 1
+
+
+def test_posting_without_title_or_company_is_not_clustered(index):
+    assert index.add(posting("topcv", "1", "", None)) is None
@@ -0,0 +1,50 @@
+from common.frontier import Frontier, canonical_job_id
+
+FIRST = "https://www.topcv.vn/viec-lam/lap-trinh-vien-python/1874558.html"
+# The same job under a renamed slug
+FIRST_RENAMED = "https://www.topcv.vn/viec-lam/python-developer/1874558.html"
+SECOND = "https://www.topcv.vn/brand/acme/tuyen-dung/backend-engineer-j1874567.html"
+
+
+def test_canonical_job_id():
+    assert canonical_job_id("topcv", FIRST) == "1874558"
+    assert canonical_job_id("topcv", SECOND) == "1874567"
+    assert canonical_job_id("careerlink", "https://www.careerlink.vn/tuyen-dung/tester/2841932") == "2841932"
+    assert canonical_job_id("vietnamworks", "https://www.vietnamworks.com/tester-1834567-jv") == "1834567"
+    # Sites without a pattern are keyed on the whole URL
+    assert canonical_job_id("unknown", FIRST) == FIRST
+
+
+def test_deduplicates_on_job_id(tmp_path):
+    with Frontier(str(tmp_path / "frontier.db")) as frontier:
+        assert frontier.add_many("topcv", [FIRST, SECOND], page=1) == [FIRST, SECOND]
+        assert frontier.add_many("topcv", [FIRST_RENAMED, SECOND], page=2) == []
+        # Sites are deduplicated separately
+        assert frontier.add("itviec", FIRST)
+        assert frontier.count("topcv") == 2
+        assert list(frontier.urls("topcv")) == [FIRST, SECOND]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "frontier.db")
+    with Frontier(path) as frontier:
+        frontier.add_many("topcv", [FIRST, SECOND])
+
+    with Frontier(path) as frontier:
+        assert frontier.contains("topcv", FIRST_RENAMED)
+        assert frontier.count("topcv") == 2
+        assert frontier.add_many("topcv", [FIRST, SECOND]) == []
+        exported = tmp_path / "job_urls.txt"
+        assert frontier.export_txt("topcv", str(exported)) == 2
+
+    assert exported.read_text(encoding="utf-8").split() == [FIRST, SECOND]
+
+
+def test_import_txt(tmp_path):
+    source = tmp_path / "job_urls.txt"
+    source.write_text(f"{FIRST}\n\n{FIRST_RENAMED}\n{SECOND}\n", encoding="utf-8")
+    with Frontier(str(tmp_path / "frontier.db")) as frontier:
+        assert frontier.import_txt("topcv", str(source)) == 2
+        assert frontier.import_txt("topcv", str(tmp_path / "missing.txt")) == 0
+        assert frontier.count("topcv") == 2
+
@@ -0,0 +1,40 @@
+import json
+import os
+from urllib.parse import urljoin
+
+import pytest
+
+from common.parsing import BACKENDS, HAS_LXML, HAS_SELECTOLAX, parse_listing
+from common.registry import get_spec
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "listings")
+
+# Job URLs the original per-site get_urls.py extractors found in the fixtures
+with open(os.path.join(FIXTURES_DIR, "baseline_urls.json"), encoding="utf-8") as file:
+    BASELINE_URLS = json.load(file)
+
+# Absolute careerlink links the original extractor dropped by mistake
+KEPT_ABSOLUTE = {"careerlink": ["https://www.careerlink.vn/tim-viec-lam/ke-toan-truong/2712350"]}
+
+MISSING = {"lxml": not HAS_LXML, "selectolax": not HAS_SELECTOLAX}
+
+
+def load(site):
+    with open(os.path.join(FIXTURES_DIR, f"{site}.html"), encoding="utf-8") as file:
+        return file.read()
+
+
+def intended(site, url):
+    """The registry joins relative links onto the site and drops fragments"""
+    return urljoin(get_spec(site).base_url, url.split('#')[0])
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("site", sorted(BASELINE_URLS))
+def test_extracts_what_the_original_extractors_did(site, backend):
+    if MISSING.get(backend):
+        pytest.skip(f"{backend} is not installed")
+    job_urls = parse_listing(site, load(site), backend)
+    kept = KEPT_ABSOLUTE.get(site, [])
+    assert [url for url in job_urls if url not in kept] == [intended(site, url) for url in BASELINE_URLS[site]]
+    assert all(url in job_urls for url in kept)
@@ -0,0 +1,89 @@
+import pytest
+import requests
+
+from common import common
+from common.common import (RATE_DECREASE_FACTOR, RATE_INCREASE_STEP, SUCCESSES_BEFORE_SPEEDUP, HostRateLimiter,
+                           RetryConfig, ScrapingError, TokenBucket, get_host, scrape_page_with_retry)
+from common.standin_server import StandinServer
+
+HOST = "www.topcv.vn"
+
+
+class Clock:
+    """Stands in for the time module in common.common, so buckets refill on demand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(common, "time", clock)
+    return clock
+
+
+def test_bucket_spaces_requests_at_its_rate(clock):
+    bucket = TokenBucket(rate=2.0, capacity=2)
+    assert [bucket.reserve() for _ in range(4)] == pytest.approx([0.0, 0.0, 0.5, 1.0])
+    clock.now += 1.5
+    assert bucket.reserve() == pytest.approx(0.0)
+
+
+def test_blocked_bucket_waits_out_the_pause(clock):
+    bucket = TokenBucket(rate=1.0)
+    bucket.block(30)
+    assert bucket.reserve() == pytest.approx(30.0)
+    assert bucket.reserve() == pytest.approx(31.0)
+
+
+def test_throttle_slows_the_host_down_and_successes_speed_it_back_up(clock):
+    limiter = HostRateLimiter(default_rate=1.0, min_rate=0.3, max_rate=1.0)
+    limiter.reserve(HOST)
+    limiter.record_throttle(HOST)
+    assert limiter.rates()[HOST] == pytest.approx(RATE_DECREASE_FACTOR)
+    limiter.record_throttle(HOST)
+    # Never below min_rate
+    assert limiter.rates()[HOST] == pytest.approx(0.3)
+
+    for _ in range(SUCCESSES_BEFORE_SPEEDUP - 1):
+        limiter.record_success(HOST)
+    assert limiter.rates()[HOST] == pytest.approx(0.3)
+    limiter.record_success(HOST)
+    assert limiter.rates()[HOST] == pytest.approx(0.3 + RATE_INCREASE_STEP)
+
+    for _ in range(100 * SUCCESSES_BEFORE_SPEEDUP):
+        limiter.record_success(HOST)
+    # Never above max_rate
+    assert limiter.rates()[HOST] == pytest.approx(1.0)
+
+
+def test_throttle_resets_the_success_count(clock):
+    limiter = HostRateLimiter(default_rate=1.0, max_rate=2.0)
+    for _ in range(SUCCESSES_BEFORE_SPEEDUP - 1):
+        limiter.record_success(HOST)
+    limiter.record_throttle(HOST)
+    limiter.record_success(HOST)
+    assert limiter.rates()[HOST] == pytest.approx(RATE_DECREASE_FACTOR)
+
+
+def test_retry_after_pauses_the_host_only(clock):
+    limiter = HostRateLimiter(default_rate=1.0, host_rates={"itviec.com": 2.0})
+    limiter.reserve(HOST)
+    limiter.reserve("itviec.com")
+    limiter.record_throttle(HOST, retry_after=20)
+    assert limiter.reserve(HOST) >= 20
+    assert limiter.reserve("itviec.com") == pytest.approx(0.5)
+
+
+def test_throttled_response_slows_the_host_down():
+    limiter = HostRateLimiter(default_rate=100.0, max_rate=100.0)
+    with StandinServer(pages=1, throttle_rate=1.0, retry_after=0) as server:
+        with pytest.raises(ScrapingError) as error:
+            scrape_page_with_retry(requests.Session(), server.url + "/?page={page}", 1, RetryConfig(max_retries=1),
+                                   limiter)
+    assert error.value.status_code == 429
+    assert limiter.rates()[get_host(server.url)] == pytest.approx(100.0 * RATE_DECREASE_FACTOR)
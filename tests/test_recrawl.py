@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from common import recrawl
+from common.recrawl import CHANGED_FACTOR, UNCHANGED_FACTOR, RecrawlStore, content_hash
+
+HOUR = 60 * 60
+FIRST = "https://www.topcv.vn/viec-lam/lap-trinh-vien-python/1874558.html"
+SECOND = "https://www.topcv.vn/viec-lam/ke-toan/1874570.html"
+
+
+class Clock:
+    def __init__(self):
+        self.now = datetime(2026, 10, 1, 12, tzinfo=timezone.utc)
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(recrawl, "_now", clock)
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    with RecrawlStore(str(tmp_path / "recrawl.db"), initial_interval=24 * HOUR, min_interval=6 * HOUR,
+                      max_interval=48 * HOUR) as store:
+        yield store
+
+
+def interval(store, url):
+    return store._row("topcv", url)[3]
+
+
+def test_content_hash_ignores_volatile_markup():
+    page = '<div class="job">Lập trình viên</div>\n<script type="application/ld+json">{"title": "Dev"}</script>'
+    noisy = ('<div class="job">Lập trình viên</div>\n  <script>var token = "a1b2";</script><!-- 12ms -->'
+             '<input type="hidden" name="csrf" value="x"><script type="application/ld+json">{"title": "Dev"}</script>')
+    assert content_hash(noisy) == content_hash(page)
+    assert content_hash(page.replace("Dev", "Senior Dev")) != content_hash(page)
+
+
+def test_interval_shrinks_on_changes_and_grows_while_unchanged(store, clock):
+    assert store.record_content("topcv", FIRST, "a", {"ETag": '"1"'})
+    assert interval(store, FIRST) == 24 * HOUR
+    assert store.due("topcv") == []
+
+    clock.now += timedelta(hours=24)
+    assert store.due("topcv") == [FIRST]
+    assert store.record_content("topcv", FIRST, "b", {"ETag": '"2"'})
+    assert interval(store, FIRST) == 24 * HOUR * CHANGED_FACTOR
+    assert store.conditional_headers("topcv", FIRST) == {"If-None-Match": '"2"'}
+
+    assert not store.record_content("topcv", FIRST, "b", {"ETag": '"2"'})
+    assert interval(store, FIRST) == 24 * HOUR * CHANGED_FACTOR * UNCHANGED_FACTOR
+    for _ in range(5):
+        store.record_unchanged("topcv", FIRST)
+    assert interval(store, FIRST) == 48 * HOUR
+    for digest in "cdefg":
+        store.record_content("topcv", FIRST, digest, {})
+    assert interval(store, FIRST) == 6 * HOUR
+    assert (store.changed, store.unchanged) == (6, 6)
+
+
+def test_expired_page_is_never_due_again(store, clock):
+    store.record_content("topcv", FIRST, "a", {})
+    assert store.record_expired("topcv", FIRST, 404)
+    assert not store.record_expired("topcv", FIRST, 404)
+    clock.now += timedelta(days=60)
+    assert store.due("topcv") == []
+    assert store.counts("topcv") == {"live": 0, "due": 0, "expired": 1}
+    assert store.expired == 1
+
+
+def test_job_whose_first_fetch_is_a_404_is_stored_expired(store, clock):
+    assert not store.knows("topcv", SECOND)
+    assert store.record_expired("topcv", SECOND, 410)
+    assert store.knows("topcv", SECOND)
+    assert not store.record_expired("topcv", SECOND, 410)
+    assert store.counts("topcv") == {"live": 0, "due": 0, "expired": 1}
+
+
+def test_due_pages_come_most_overdue_first(store, clock):
+    store.record_content("topcv", FIRST, "a", {})
+    clock.now += timedelta(hours=1)
+    store.record_content("topcv", SECOND, "a", {})
+    clock.now += timedelta(days=2)
+    assert store.due("topcv") == [FIRST, SECOND]
+    assert store.due("topcv", limit=1) == [FIRST]
+    assert store.counts("topcv") == {"live": 2, "due": 2, "expired": 0}
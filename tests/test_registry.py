@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from common.parsing import BACKENDS, HAS_LXML, HAS_SELECTOLAX, parse_listing
+from common.registry import fill_template, find_script_json, get_spec, iter_job_objects
+
+JOBS = [
+    {"jobId": 1834567, "jobTitle": "Kỹ sư phần mềm", "jobUrl": "https://www.vietnamworks.com/ky-su-1834567-jv",
+     "companyName": "FPT", "prettySalary": "Thương lượng", "workingLocations": [{"cityName": "Hà Nội"}]},
+    # Relative URL, with tracking, and no locations
+    {"jobId": 1834568, "jobTitle": "Tester", "jobUrl": "/tester-1834568-jv?source=searchResults#apply",
+     "companyName": "Viettel", "prettySalary": "15-20 triệu", "workingLocations": []},
+]
+NEXT_DATA = {"props": {"pageProps": {"initialState": {
+    "search": {"data": JOBS, "meta": {"nbHits": 2}},
+    "filters": [{"jobId": 0, "label": "Không có jobUrl"}],
+}}}, "page": "/viec-lam", "buildId": "a1b2"}
+
+
+def listing_page(payload: str, attributes: str = 'id="__NEXT_DATA__" type="application/json"') -> str:
+    return (f'<!DOCTYPE html><html><head><script src="/_next/main.js"></script></head>'
+            f'<body><div id="__next"><div class="job-card">Kỹ sư phần mềm</div></div>'
+            f'<script {attributes}>{payload}</script></body></html>')
+
+
+def test_find_script_json():
+    html = listing_page(json.dumps(NEXT_DATA, ensure_ascii=False))
+    assert find_script_json(html, "__NEXT_DATA__") == NEXT_DATA
+    # Unquoted attributes and whitespace around the payload
+    assert find_script_json(listing_page("\n  [1, 2]\n", "type=application/json id=__NEXT_DATA__"),
+                            "__NEXT_DATA__") == [1, 2]
+    assert find_script_json(html, "__NUXT__") is None
+
+
+def test_truncated_payload_is_not_decoded():
+    payload = json.dumps(NEXT_DATA, ensure_ascii=False)
+    html = listing_page(payload)
+    truncated = html[:html.index(payload) + len(payload) // 2]
+    assert find_script_json(truncated, "__NEXT_DATA__") is None
+    assert get_spec("vietnamworks").extract_json(truncated) == []
+
+
+def test_job_objects_are_found_wherever_they_are_nested():
+    assert [job["jobId"] for job in iter_job_objects(NEXT_DATA, ("jobId", "jobUrl"))] == [1834567, 1834568]
+    assert fill_template("{workingLocations[0][cityName]}", JOBS[0]) == "Hà Nội"
+    assert fill_template("{workingLocations[0][cityName]}", JOBS[1]) is None
+
+
+def test_embedded_json_listing():
+    page = get_spec("vietnamworks").extract_json(listing_page(json.dumps(NEXT_DATA, ensure_ascii=False)))
+    assert page == ["https://www.vietnamworks.com/ky-su-1834567-jv", "https://www.vietnamworks.com/tester-1834568-jv"]
+    assert page.fields[page[0]] == {"title": "Kỹ sư phần mềm", "company": "FPT", "salary": "Thương lượng",
+                                    "location": "Hà Nội"}
+    assert page.fields[page[1]]["location"] is None
+    assert not page.is_last
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_every_backend_reads_the_embedded_json(backend):
+    if {"lxml": not HAS_LXML, "selectolax": not HAS_SELECTOLAX}.get(backend):
+        pytest.skip(f"{backend} is not installed")
+    html = listing_page(json.dumps(NEXT_DATA, ensure_ascii=False))
+    assert parse_listing("vietnamworks", html, backend) == get_spec("vietnamworks").extract_json(html)
+
+
+def test_json_api_listing_ends_on_a_short_page():
+    spec = get_spec("topdev")
+    jobs = [{"id": job_id, "title": "Dev", "detail_url": f"https://topdev.vn/viec-lam/dev-{job_id}"}
+            for job_id in range(3)]
+    page = spec.extract_json(json.dumps({"data": jobs, "meta": {"current_page": 4}}))
+    assert len(page) == 3
+    assert page.is_last
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from common import retry
+from common.retry import RetryScheduler
+
+
+class Clock:
+    """Stands in for the time module in common.retry, so deadlines pass on demand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry, "time", clock)
+    return clock
+
+
+def test_retries_come_back_in_deadline_order(clock):
+    retries = RetryScheduler(max_retries=5)
+    assert retries.schedule("topcv", "www.topcv.vn", 7, 1, delay=5)
+    assert retries.schedule("topcv", "www.topcv.vn", 3, 1, delay=1)
+    assert retries.schedule("topcv", "www.topcv.vn", 4, 2, delay=1)
+    assert retries.pop_due("topcv") is None
+    assert retries.next_deadline("topcv") == pytest.approx(1001.0)
+
+    clock.now += 1
+    # Equal deadlines keep their scheduling order
+    assert retries.pop_due("topcv") == (3, 1)
+    assert retries.pop_due("topcv") == (4, 2)
+    assert retries.pop_due("topcv") is None
+    clock.now += 4
+    assert retries.pop_due("topcv") == (7, 1)
+    assert retries.pending() == 0
+
+
+def test_owners_have_their_own_queues(clock):
+    retries = RetryScheduler()
+    retries.schedule("jobsgo@ha-noi", "jobsgo.vn", 2, 1, delay=0)
+    retries.schedule("jobsgo@da-nang", "jobsgo.vn", 5, 1, delay=3)
+    assert retries.pop_due("jobsgo@da-nang") is None
+    assert retries.pop_due("jobsgo@ha-noi") == (2, 1)
+    assert retries.pending() == 1
+    assert retries.next_deadline() == pytest.approx(1003.0)
+
+
+def test_attempts_are_capped(clock):
+    retries = RetryScheduler(max_retries=3)
+    assert retries.schedule("topcv", "www.topcv.vn", 1, 2, delay=0)
+    assert not retries.schedule("topcv", "www.topcv.vn", 1, 3, delay=0)
+    assert (retries.scheduled, retries.denied) == (1, 1)
+
+
+def test_host_budget_runs_out_and_is_earned_back(clock):
+    retries = RetryScheduler(max_retries=10, budget=2, budget_ratio=0.5)
+    assert retries.schedule("topcv", "www.topcv.vn", 1, 1, delay=0)
+    assert retries.schedule("topcv", "www.topcv.vn", 2, 1, delay=0)
+    assert not retries.schedule("topcv", "www.topcv.vn", 3, 1, delay=0)
+    # Other hosts keep their own budget
+    assert retries.schedule("itviec", "itviec.com", 1, 1, delay=0)
+
+    retries.record_success("www.topcv.vn")
+    assert not retries.schedule("topcv", "www.topcv.vn", 3, 1, delay=0)
+    retries.record_success("www.topcv.vn")
+    assert retries.schedule("topcv", "www.topcv.vn", 3, 1, delay=0)
+    # Successes never raise the budget past its size
+    for _ in range(10):
+        retries.record_success("itviec.com")
+    assert [retries.schedule("itviec", "itviec.com", page, 1, delay=0) for page in range(3)] == [True, True, False]
+
+
+def test_wait_sleeps_until_the_next_deadline(clock, monkeypatch):
+    slept = []
+
+    async def sleep(delay):
+        slept.append(delay)
+
+    monkeypatch.setattr(retry.asyncio, "sleep", sleep)
+    retries = RetryScheduler()
+    asyncio.run(retries.wait("topcv"))
+    retries.schedule("topcv", "www.topcv.vn", 1, 1, delay=8)
+    asyncio.run(retries.wait("topcv"))
+    asyncio.run(retries.wait("topcv", timeout=2))
+    assert slept == [pytest.approx(8.0), pytest.approx(2.0)]
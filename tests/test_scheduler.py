@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from common.async_crawler import KNOWN_PAGES_BEFORE_STOP, PrioritySemaphore
+from common.common import HostRateLimiter, get_host
+from common.registry import get_spec
+from common.scheduler import DEFAULT_JOBS_PER_PAGE, MIN_EXPECTED_NEW_JOBS, CrawlSchedule, SiteHistory
+
+NOW = datetime(2026, 10, 1, 12, tzinfo=timezone.utc)
+
+
+def run(hours_ago, pages=10, requests=10, job_urls=200, new_jobs=0, complete=True):
+    return ((NOW - timedelta(hours=hours_ago)).isoformat(timespec='seconds'), pages, requests, job_urls, new_jobs,
+            int(complete))
+
+
+def host(site):
+    return get_host(get_spec(site).url)
+
+
+@pytest.fixture
+def schedule(tmp_path):
+    with CrawlSchedule(str(tmp_path / "schedule.db")) as schedule:
+        yield schedule
+
+
+def record(schedule, site, hours_ago, **fields):
+    row = run(hours_ago, **fields)
+    schedule.record_run(site, datetime.fromisoformat(row[0]), *row[1:5], complete=bool(row[5]))
+
+
+def test_history_estimates_new_jobs_per_hour():
+    history = SiteHistory([run(0, new_jobs=30), run(10, new_jobs=20), run(20)])
+    assert history.new_per_hour == pytest.approx(50 / 20)
+    assert history.jobs_per_page == 20
+    assert history.backlog_pages == 0
+
+
+def test_history_skips_intervals_after_a_cut_run():
+    # The run after the cut one also found the jobs the cut one did not reach
+    history = SiteHistory([run(0, new_jobs=80), run(10, pages=3, new_jobs=5, complete=False), run(20)])
+    assert history.new_per_hour == pytest.approx(5 / 10)
+    assert history.backlog_pages == 0
+    cut = SiteHistory([run(0, pages=3, complete=False), run(10, pages=4, complete=False), run(20)])
+    assert cut.backlog_pages == 7
+
+
+def test_history_needs_two_runs():
+    assert SiteHistory([run(0, new_jobs=30)]).new_per_hour is None
+    assert SiteHistory([]).jobs_per_page is None
+
+
+def test_plan_orders_sites_by_expected_new_jobs_per_second(schedule, monkeypatch):
+    monkeypatch.setattr("common.scheduler._now", lambda: NOW)
+    for site in ("topcv", "itviec", "careerlink"):
+        record(schedule, site, 48)
+    # topcv and itviec gain 4 jobs an hour, careerlink hardly any
+    record(schedule, "topcv", 24, new_jobs=96)
+    record(schedule, "itviec", 24, new_jobs=96)
+    record(schedule, "careerlink", 24, new_jobs=2)
+    limiter = HostRateLimiter(host_rates={host("topcv"): 0.5, host("itviec"): 1.0, host("careerlink"): 1.0})
+
+    plans = {plan.site: plan for plan in schedule.plan(["topcv", "itviec", "careerlink", "123job"], limiter)}
+    assert [plan.site for plan in schedule.plan(["topcv", "itviec", "careerlink"], limiter)] == \
+        ["itviec", "topcv", "careerlink"]
+
+    itviec = plans["itviec"]
+    assert itviec.expected_new == pytest.approx(96)
+    assert itviec.pages == 96 // DEFAULT_JOBS_PER_PAGE + 1
+    assert itviec.page_yield(1) == DEFAULT_JOBS_PER_PAGE
+    assert itviec.page_yield(itviec.pages + 1) == 0
+    # Same yield, half the rate
+    assert plans["topcv"].page_priority(1) == pytest.approx(itviec.page_priority(1) / 2)
+    assert not plans["careerlink"].due
+    assert plans["careerlink"].expected_new < MIN_EXPECTED_NEW_JOBS
+    # A site that was never crawled is due, at a full page per request
+    assert plans["123job"].due
+    assert plans["123job"].page_yield(1) == DEFAULT_JOBS_PER_PAGE
+
+
+def test_plan_reaches_past_the_pages_of_cut_runs(schedule, monkeypatch):
+    monkeypatch.setattr("common.scheduler._now", lambda: NOW)
+    record(schedule, "topcv", 24, pages=6, complete=False)
+    [plan] = schedule.plan(["topcv"], HostRateLimiter())
+    assert plan.known_pages == KNOWN_PAGES_BEFORE_STOP + 6
+
+
+def test_host_rates_round_trip(schedule):
+    schedule.record_rates({host("topcv"): 0.75})
+    assert schedule.host_rates() == {host("topcv"): 0.75}
+
+
+def test_priority_semaphore_serves_the_highest_priority_first():
+    async def scenario():
+        semaphore = PrioritySemaphore(1)
+        order = []
+
+        async def request(priority):
+            async with semaphore.slot(priority):
+                order.append(priority)
+                await asyncio.sleep(0)
+
+        await semaphore.acquire()
+        waiters = [asyncio.create_task(request(priority)) for priority in (1.0, 5.0, 3.0)]
+        await asyncio.sleep(0)
+        semaphore.release()
+        await asyncio.gather(*waiters)
+        return order
+
+    assert asyncio.run(scenario()) == [5.0, 3.0, 1.0]
@@ -0,0 +1,80 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from common import seen_index
+from common.frontier import Frontier
+from common.seen_index import IntSet, SeenIndex, job_key
+
+JOB_IDS = ["1874558", "3269762", "zrMLJoYA9d", "senior-java-developer-3434", "0123"]
+
+
+def test_job_keys_do_not_collide():
+    keys = [job_key(job_id) for job_id in JOB_IDS]
+    assert len(set(keys)) == len(keys)
+    assert job_key("1874558") == 1874558
+    assert all(0 <= key < 2 ** 64 for key in keys)
+
+
+def test_int_set_survives_compaction(monkeypatch):
+    monkeypatch.setattr(seen_index, "COMPACT_MIN", 4)
+    values = IntSet()
+    assert all(values.add(value) for value in range(100, 0, -7))
+    assert not values.add(37)
+    assert 2 in values and 3 not in values
+    assert len(values) == len(range(100, 0, -7))
+
+
+@pytest.mark.parametrize("kind", ["exact", "bloom"])
+def test_save_and_load(tmp_path, kind):
+    directory = str(tmp_path / "seen")
+    index = SeenIndex(kind, directory, capacity=1000)
+    for job_id in JOB_IDS:
+        assert index.add("topcv", job_id)
+    index.add("itviec", JOB_IDS[0])
+    index.save(stamp=42)
+
+    loaded = SeenIndex(kind, directory, capacity=1000)
+    assert loaded.load() == 42
+    assert all(loaded.contains("topcv", job_id) for job_id in JOB_IDS)
+    assert loaded.count("topcv") == len(JOB_IDS)
+    assert not loaded.contains("itviec", JOB_IDS[1])
+    # A loaded index keeps taking new jobs
+    assert loaded.add("topcv", "1874559")
+    assert not loaded.add("topcv", JOB_IDS[0])
+
+
+def test_index_with_other_settings_is_not_loaded(tmp_path):
+    directory = str(tmp_path / "seen")
+    index = SeenIndex("exact", directory)
+    index.add("topcv", JOB_IDS[0])
+    index.save()
+    assert SeenIndex("bloom", directory).load() is None
+
+
+def test_frontier_catches_up_with_jobs_added_after_the_index_was_saved(tmp_path):
+    path = str(tmp_path / "frontier.db")
+    with Frontier(path) as frontier:
+        frontier.add("topcv", "https://www.topcv.vn/viec-lam/a/1.html")
+
+    # Another process added a job without saving the index
+    with sqlite3.connect(path) as connection:
+        connection.execute("INSERT INTO jobs VALUES ('topcv', '2', 'https://www.topcv.vn/viec-lam/b/2.html', 1, "
+                           "'2026-01-01T00:00:00+00:00', '2026-01-01T00:00:00+00:00')")
+    connection.close()
+
+    with Frontier(path) as frontier:
+        assert frontier.count("topcv") == 2
+        assert frontier.contains("topcv", "https://www.topcv.vn/viec-lam/b/2.html")
+
+
+def test_frontier_rebuilds_a_missing_index(tmp_path):
+    path = str(tmp_path / "frontier.db")
+    with Frontier(path, index_kind="bloom") as frontier:
+        frontier.add("topcv", "https://www.topcv.vn/viec-lam/a/1.html")
+    shutil.rmtree(path + ".seen")
+
+    with Frontier(path, index_kind="bloom") as frontier:
+        assert frontier.count("topcv") == 1
+        assert not frontier.add("topcv", "https://www.topcv.vn/viec-lam/a/1.html")
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from common import sharding
+from common.sharding import (MAX_WORKER_DEATHS, ShardCoordinator, find_last_page, interleave_shards, page_runs,
+                             split_pages)
+from common.standin_server import JOBS_PER_PAGE, StandinServer
+
+RATE = 100.0
+
+
+def test_find_last_page():
+    for last in (0, 1, 2, 7, 64, 1000):
+        probed = []
+
+        def has_jobs(page):
+            probed.append(page)
+            return page <= last
+
+        assert find_last_page(has_jobs) == last
+        assert len(probed) <= 2 * max(last, 1).bit_length() + 2
+
+
+def test_page_runs():
+    assert page_runs([7, 1, 2, 3, 5, 6, 9]) == [(1, 3), (5, 7), (9, 9)]
+
+
+def test_shards_are_interleaved_across_sites():
+    shards = interleave_shards({"topcv": split_pages("topcv", "", 1, 7, shard_size=3),
+                                "itviec": split_pages("itviec", "", 1, 3, shard_size=3)})
+    assert [repr(shard) for shard in shards] == ["topcv[1-3]", "itviec[1-3]", "topcv[4-6]", "topcv[7-7]"]
+
+
+@pytest.fixture
+def crawl(monkeypatch):
+    """Crawl 6 stand-in pages in shards of 3, with a listing parser that fails on some pages"""
+    monkeypatch.setattr(sharding, "WORKER_POLL_INTERVAL", 0.1)
+    parse_listing = sharding.parse_listing
+
+    def run(on_page_text):
+        def parse(site, html, backend):
+            on_page_text(html)
+            return parse_listing(site, html, backend)
+
+        # Worker processes are forked, so they inherit the patched parser
+        monkeypatch.setattr(sharding, "parse_listing", parse)
+        pages = {}
+        with StandinServer(pages=6) as server:
+            coordinator = ShardCoordinator(workers=2, rate=RATE, max_rate=RATE)
+            coordinator.run(split_pages("topcv", server.url + "/?page={page}", 1, 6, shard_size=3),
+                            lambda site, page, urls: pages.__setitem__(page, urls))
+        return coordinator, pages, sorted(page for _site, page in coordinator.failed_pages)
+
+    return run
+
+
+def test_page_that_does_not_parse_is_failed_and_the_shard_goes_on(crawl):
+    def on_page_text(html):
+        if "/2000.html" in html:
+            raise AttributeError("'NoneType' object has no attribute 'get'")
+
+    coordinator, pages, failures = crawl(on_page_text)
+    assert failures == [2]
+    assert sorted(pages) == [1, 3, 4, 5, 6]
+    assert all(len(urls) == JOBS_PER_PAGE for urls in pages.values())
+    assert coordinator.reassigned == 0
+
+
+def test_shard_that_keeps_killing_workers_is_given_up(crawl):
+    def on_page_text(html):
+        if "/2000.html" in html:
+            os._exit(1)
+
+    coordinator, pages, failures = crawl(on_page_text)
+    assert failures == [2, 3]
+    assert sorted(pages) == [1, 4, 5, 6]
+    assert coordinator.reassigned == MAX_WORKER_DEATHS - 1
+    assert coordinator.abandoned == 1
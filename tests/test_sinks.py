@@ -0,0 +1,93 @@
+import gzip
+import io
+import json
+import sqlite3
+
+import pytest
+
+from common.parsing import ListingPage
+from common.sinks import LISTING_FIELDS, JsonlSink, SqliteSink, open_sink
+
+URL = "https://www.topcv.vn/viec-lam/lap-trinh-vien-python/{job_id}.html"
+
+
+def records(count):
+    return [{"site": "topcv", "job_id": str(job_id), "url": URL.format(job_id=job_id), "page": index // 20 + 1,
+             "title": f"Lập trình viên Python {job_id}", "crawled_at": "2026-10-01T12:00:00+00:00"}
+            for index, job_id in enumerate(range(1874000, 1874000 + count))]
+
+
+def expected(rows):
+    return [{field: row.get(field) for field in LISTING_FIELDS} for row in rows]
+
+
+def read_jsonl(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    if path.endswith(".gz"):
+        data = gzip.decompress(data)
+    elif path.endswith(".zst"):
+        zstandard = pytest.importorskip("zstandard")
+        data = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+
+@pytest.mark.parametrize("output_format", ["jsonl", "jsonl.gz", "jsonl.zst"])
+def test_jsonl_round_trip(tmp_path, output_format):
+    if output_format == "jsonl.zst":
+        pytest.importorskip("zstandard")
+    rows = records(25)
+    with open_sink(output_format, "listings", str(tmp_path), batch_size=10) as sink:
+        for row in rows:
+            sink.write(row)
+        # Two full batches are written, the rest waits for close
+        assert sink.written == 20
+    assert sink.written == 25
+    [path] = sink.paths
+    assert path.endswith(f".{output_format}")
+    assert read_jsonl(path) == expected(rows)
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_files_are_rotated_by_size_and_complete_on_their_own(tmp_path, compression):
+    # The compressor holds back some output, so compressed files need a few batches to show their size
+    rows = records(10000)
+    with JsonlSink(str(tmp_path), "listings", compression, batch_size=250, max_bytes=20_000) as sink:
+        for row in rows:
+            sink.write(row)
+    assert len(sink.paths) > 1
+    assert len(set(sink.paths)) == len(sink.paths)
+    assert [row for path in sink.paths for row in read_jsonl(path)] == expected(rows)
+
+
+def test_add_page_writes_a_record_per_job(tmp_path):
+    job_urls = ListingPage([URL.format(job_id=1), URL.format(job_id=2)],
+                           fields={URL.format(job_id=1): {"title": "Tester", "company": "FPT"}})
+    with JsonlSink(str(tmp_path), "listings", None) as sink:
+        sink.add_page("topcv", 3, job_urls)
+    first, second = read_jsonl(sink.paths[0])
+    assert (first["job_id"], first["page"], first["title"], first["company"]) == ("1", 3, "Tester", "FPT")
+    assert second["title"] is None and second["crawled_at"]
+
+
+def test_parquet_round_trip(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    rows = records(30)
+    with open_sink("parquet", "listings", str(tmp_path), batch_size=10) as sink:
+        for row in rows:
+            sink.write(row)
+    table = parquet.read_table(sink.paths[0])
+    assert table.to_pylist() == expected(rows)
+    assert parquet.ParquetFile(sink.paths[0]).num_row_groups == 3
+
+
+def test_sqlite_sink_adds_new_fields_to_an_existing_table(tmp_path):
+    path = str(tmp_path / "listings.db")
+    with SqliteSink(path, "listings", fields=("site", "job_id")) as sink:
+        sink.write({"site": "topcv", "job_id": "1"})
+    with SqliteSink(path, "listings") as sink:
+        sink.write(records(1)[0])
+    with sqlite3.connect(path) as connection:
+        rows = connection.execute("SELECT site, job_id, page FROM listings ORDER BY rowid").fetchall()
+    connection.close()
+    assert rows == [("topcv", "1", None), ("topcv", "1874000", 1)]
@@ -0,0 +1,105 @@
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from common import transport
+from common.parsing import ListingStream
+from common.registry import get_spec
+from common.transport import read_body, stream_get
+
+FIRST = "<html><body><h1>Việc làm mới nhất</h1>" + "<p>Lập trình viên Python</p>" * 50
+REST = "<p>Kế toán tổng hợp</p>" * 50 + "</body></html>"
+
+
+class SlowGzipServer:
+    """Sends a gzip page in two flushed parts and holds the second back until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.held_back = False
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                compressor = zlib.compressobj(wbits=31)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Encoding", "gzip")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.wfile.write(compressor.compress(FIRST.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH))
+                self.wfile.flush()
+                server.held_back = server.release.wait(2)
+                self.wfile.write(compressor.compress(REST.encode("utf-8")) + compressor.flush())
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}/"
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release.set()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def test_text_is_passed_on_while_the_body_downloads(monkeypatch):
+    # Small chunks split the multi-byte characters between chunks
+    monkeypatch.setattr(transport, "STREAM_CHUNK_SIZE", 7)
+    parts = []
+
+    def on_text(text):
+        if not server.release.is_set():
+            assert FIRST.startswith("".join(parts) + text)
+        parts.append(text)
+        if "".join(parts) == FIRST:
+            server.release.set()
+
+    with SlowGzipServer() as server:
+        response = stream_get(requests.Session(), server.url, on_text)
+
+    # The first part was passed on while the second was still held back
+    assert server.held_back
+    assert "".join(parts) == FIRST + REST
+    assert response.text == FIRST + REST
+    assert response.headers["Content-Encoding"] == "gzip"
+
+
+def test_body_that_was_already_read_is_passed_on_whole():
+    with SlowGzipServer() as server:
+        server.release.set()
+        response = requests.get(server.url)
+    parts = []
+    assert read_body(response, parts.append) == (FIRST + REST).encode("utf-8")
+    assert parts == [FIRST + REST]
+
+
+def test_embedded_listing_is_parsed_before_the_page_is_complete():
+    spec = get_spec("vietnamworks")
+    html = ('<html><head></head><body><script id="__NEXT_DATA__" type="application/json">'
+            '{"props": {"jobs": [{"jobId": 1, "jobTitle": "Tester", "jobUrl": "/tester-1-jv"}]}}</script>'
+            + "<div>footer</div>" * 100 + "</body></html>")
+    stream = ListingStream(spec)
+    end = html.index("</script>") + len("</script>")
+    for start in range(0, end, 10):
+        stream.feed(html[start:min(start + 10, end)])
+    assert stream.result == ["https://www.vietnamworks.com/tester-1-jv"]
+
+
+@pytest.mark.parametrize("chunk", [1, 13, 4096])
+def test_listing_stream_waits_for_the_whole_payload(chunk):
+    html = '<script id="__NEXT_DATA__">{"jobs": [{"jobId": 1, "jobTitle": "Tester", "jobUrl": "/tester-1-jv"}]}'
+    stream = ListingStream(get_spec("vietnamworks"))
+    for start in range(0, len(html), chunk):
+        stream.feed(html[start:start + chunk])
+    assert stream.result is None
+    stream.feed("</script></body></html>")
+    assert stream.result == ["https://www.vietnamworks.com/tester-1-jv"]
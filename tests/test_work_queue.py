@@ -0,0 +1,127 @@
+import argparse
+
+import pytest
+
+import crawl_distributed
+from common import distributed, work_queue
+from common.frontier import Frontier
+from common.work_queue import WorkQueue
+
+LISTING = "https://www.topcv.vn/tim-viec-lam-moi-nhat?page={page}"
+DETAIL = "https://www.topcv.vn/viec-lam/lap-trinh-vien/1874558.html"
+
+
+class Clock:
+    """Stands in for the time module in common.work_queue, so leases run out on demand"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(work_queue, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    with WorkQueue(str(tmp_path / "work_queue.db"), lease_timeout=60, max_attempts=2) as queue:
+        queue.enqueue([("page", "topcv", "topcv", LISTING, page) for page in (1, 2)])
+        yield queue
+
+
+def test_leases_are_exclusive(queue):
+    first = queue.lease("a", 1)
+    second = queue.lease("b", 5)
+    assert [task.page for task in first] == [1]
+    assert [task.page for task in second] == [2]
+    assert queue.lease("c", 5) == []
+    assert queue.counts()["leased"] == 2
+
+
+def test_expired_lease_is_taken_over_and_finished_once(queue, clock):
+    [task] = queue.lease("a", 1)
+    clock.now += 61
+    [taken_over] = queue.lease("b", 1)
+    assert taken_over.id == task.id
+    assert taken_over.attempts == 2
+
+    # The first worker was only slow: both finish, one result is kept
+    queue.complete(taken_over, "b", ["x"])
+    queue.complete(task, "a", ["x"])
+    assert len(queue.results()) == 1
+
+
+def test_lease_that_runs_out_on_every_attempt_fails_the_task(queue, clock):
+    for _ in range(2):
+        assert [task.page for task in queue.lease("a", 1)] == [1]
+        clock.now += 61
+    assert [task.page for task in queue.lease("a", 1)] == [2]
+    assert queue.counts()["failed"] == 1
+
+
+def test_retry_waits_for_its_delay(queue, clock):
+    [task] = queue.lease("a", 1)
+    assert queue.retry(task, "a", "502", delay=10)
+    queue.lease("a", 1)
+    assert queue.lease("a", 1) == []
+    assert queue.next_due() == pytest.approx(10)
+    clock.now += 10
+    [again] = queue.lease("a", 1)
+    assert again.id == task.id
+    # The second attempt was the last one
+    assert not queue.retry(again, "a", "502", delay=10)
+    assert queue.counts()["failed"] == 1
+
+
+def test_finished_tasks_are_queued_again_for_a_new_run(queue):
+    for task in queue.lease("a", 2):
+        queue.complete(task, "a", [])
+    assert queue.drained()
+    assert queue.enqueue([("page", "topcv", "topcv", LISTING, 1)]) == 1
+    [task] = queue.lease("a", 1)
+    assert task.generation == 1
+
+
+class Page:
+    text = "<html></html>"
+
+
+def test_worker_fails_a_task_whose_page_does_not_parse(tmp_path, monkeypatch):
+    def parse_detail(site, url, html):
+        raise AttributeError("'list' object has no attribute 'get'")
+
+    monkeypatch.setattr(distributed, "fetch_attempt", lambda *args, **kwargs: Page())
+    monkeypatch.setattr(distributed, "parse_detail", parse_detail)
+    path = str(tmp_path / "work_queue.db")
+    with WorkQueue(path) as queue:
+        queue.enqueue([("detail", "topcv", "topcv", DETAIL, 0)])
+
+    worker = distributed.QueueWorker(path, owner="a")
+    [task] = worker.queue.lease("a", 1)
+    worker.run_task(task)
+    assert worker.failed == 1
+    assert worker.queue.counts()["failed"] == 1
+    worker.queue.close()
+
+
+@pytest.mark.parametrize("records", [[], [{"site": "topcv", "url": DETAIL, "title": "Lập trình viên"}]])
+def test_details_file_is_only_created_for_detail_results(tmp_path, monkeypatch, records):
+    monkeypatch.setattr(crawl_distributed, "job_urls_path", lambda name: str(tmp_path / f"{name}.txt"))
+    monkeypatch.setattr(crawl_distributed, "open_frontier", lambda sites: Frontier(str(tmp_path / "frontier.db")))
+    details = tmp_path / "job_details.jsonl"
+    args = argparse.Namespace(sink=None, details_output=str(details))
+
+    def run(frontier, on_page, on_record):
+        for record in records:
+            on_record(record)
+
+    crawl_distributed.collect_results(args, ["topcv"], run)
+    assert details.exists() == bool(records)
+    if records:
+        assert len(details.read_text(encoding="utf-8").splitlines()) == 1
@@ -11,7 +11,7 @@ websites = {
     "jobstreet": "https://www.jobstreet.vn/j?p={page}",
     "linkedin": "https://www.linkedin.com",
     "timviec": "https://timviec.com.vn/tim-viec-lam?page={page}",
-    "topcv": "https://www.topcv.vn/tim-viec-lam-moi-nhat?type_keyword=1&page={page}&sba=1",
+    "topcv": "https://www.topcv.vn/tim-viec-lam-moi-nhat?sort=new&type_keyword=1&page={page}&sba=1",
     "topdev": "https://topdev.vn/viec-lam/tim-kiem",
     "vieclam.tuoitre": "https://vieclam.tuoitre.vn/viec-lam/tat-ca-viec-lam-r50-trang-{page}-vi.html",
     "vieclam24h": "https://vieclam24h.vn/tim-kiem-viec-lam-nhanh?page={page}",